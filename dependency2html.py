@@ -19,7 +19,10 @@ import time
 import sqlite3
 from collections import OrderedDict
 import json
+import zlib
+import base64
 import dependencydatabase
+import dependencymatrix
 import argparse
 
 # ################################################################################################ #
@@ -294,6 +297,10 @@ class DependencyMatrixHtmlTableWriter(HtmlTableWriter):
         
         self.isFillerElement = False
         
+        # The filler elements of each column and the column index of each project, see WriteRow.
+        self.fillerElements = None
+        self.columnIndices = None
+        
         self.solutionInfo = solutionInfo
     
     def _SanitizeClassOrIdentifier(self, identifier):
@@ -390,33 +397,90 @@ class DependencyMatrixHtmlTableWriter(HtmlTableWriter):
     def WriteRowEnd(self):
         self.writer.write('</tr>\n')
     
-    def WriteElementStart(self):
-        rowHeading = self.rowHeadingList[self.rowIndex]
-        colHeading = self.columnHeadingList[self.columnIndex]
-        
-        self.writer.write('    <td class="')
+    def _GetElementClass(self, rowIndex, columnIndex, isFillerElement):
+        rowHeading = self.rowHeadingList[rowIndex]
+        colHeading = self.columnHeadingList[columnIndex]
         
         classStr = self._GetColClass(colHeading)
-        # Write the table data item prefix
-        if self.rowIndex == self.columnIndex:
+        if rowIndex == columnIndex:
             classStr = " ".join([ classStr, "self" ])
-        elif self.rowIndex > self.columnIndex:
-            if self.isFillerElement:
+        elif rowIndex > columnIndex:
+            if isFillerElement:
                 classStr = " ".join([ classStr, "independent" ])
             else:
                 classStr = " ".join([ classStr, "error" ])
         elif not self.solutionInfo.HasProjectDependency(rowHeading, colHeading):
-            if self.isFillerElement:
+            if isFillerElement:
                 classStr = " ".join([ classStr, "independent" ])
             else:
                 classStr = " ".join([ classStr, "warning" ])
-            
-        self.writer.write(classStr)
         
+        return classStr
+    
+    def WriteElementStart(self):
+        # Write the table data item prefix
+        self.writer.write('    <td class="')
+        self.writer.write(self._GetElementClass(self.rowIndex, self.columnIndex, self.isFillerElement))
         self.writer.write('">')
     
     def WriteElementEnd(self):
         self.writer.write('</td>\n')
+    
+    # WriteRow
+    #   Writes a whole row of the matrix, heading included, as a single string. cellData maps the
+    #   column indices of the row's non-empty cells to their contents, all of the other cells are
+    #   written as empty filler elements. The rows must be written in order, between WriteTableStart
+    #   and WriteTableEnd.
+    #   
+    #   This is a faster alternative to writing the matrix through a HtmlTableInlineWriter: the
+    #   filler elements, which are most of a large matrix, are prepared once per column and joined in
+    #   bulk, and the row's declared dependencies are looked up once per row.
+    def WriteRow(self, rowIndex, cellData):
+        if self.fillerElements is None:
+            self._PrepareFillerElements()
+        independentElements, selfElements, dependentElements = self.fillerElements
+        columnCount = len(self.columnHeadingList)
+        rowHeading = self.rowHeadingList[rowIndex]
+        dependencyColumns = set([self.columnIndices[projectName] for projectName in self.solutionInfo.GetProjectDependencies(rowHeading) if projectName in self.columnIndices])
+        
+        # Filler elements below the diagonal are always independent, above it they are independent
+        # unless the row's project depends on the column's project.
+        elements = independentElements[:rowIndex]
+        if rowIndex < columnCount:
+            elements.append(selfElements[rowIndex])
+        for columnIndex in xrange(rowIndex + 1, columnCount):
+            if columnIndex in dependencyColumns:
+                elements.append(dependentElements[columnIndex])
+            else:
+                elements.append(independentElements[columnIndex])
+        
+        for columnIndex, data in cellData.iteritems():
+            elements[columnIndex] = '    <td class="' + self._GetElementClass(rowIndex, columnIndex, False) + '">' + data + '</td>\n'
+        
+        rowId = self._GetRowId(rowHeading)
+        self.writer.write(''.join([
+            '<tr id="', rowId, '">\n',
+            '    <th scope="row" onclick="javascript:highlightRow(\'', rowId, '\')" onmouseover="javascript:ComputeRowTotals(\'', rowId, '\')" onmouseout="javascript:HideSumTable()">',
+            rowHeading,
+            '</th>\n',
+            ''.join(elements),
+            '</tr>\n']))
+    
+    # _PrepareFillerElements
+    #   Prepares the three kinds of empty filler elements of every column: independent, diagonal (the
+    #   project itself) and dependent, and the map of the column headings to their indices.
+    def _PrepareFillerElements(self):
+        independentElements = []
+        selfElements = []
+        dependentElements = []
+        for colHeading in self.columnHeadingList:
+            colClass = self._GetColClass(colHeading)
+            independentElements.append('    <td class="' + colClass + ' independent"></td>\n')
+            selfElements.append('    <td class="' + colClass + ' self"></td>\n')
+            dependentElements.append('    <td class="' + colClass + '"></td>\n')
+        
+        self.fillerElements = (independentElements, selfElements, dependentElements)
+        self.columnIndices = dict([(colHeading, index) for index, colHeading in enumerate(self.columnHeadingList)])
         
     # SetRowAndColumnHeadings
     #   This function sets the internal list of headings. The list defines both the column headings
@@ -426,7 +490,64 @@ class DependencyMatrixHtmlTableWriter(HtmlTableWriter):
     
     def SetColumnHeadings(self, headingList):
         self.columnHeadingList = headingList
-        
+        self.fillerElements = None
+        
+# CompressedDetailPayload class
+#   Collects the #include details of the matrix cells into a single compressed payload that is
+#   embedded in the HTML file when the --compress-details option is given.
+#
+#   The file paths, #include texts and #include types are dictionary encoded: each distinct string
+#   is stored once in a string table and referred to by its index. A cell is encoded as a list of
+#     [file index, [[include text index, [line number, include type index, ...]], ...]]
+#   items. The payload is the JSON object {"cells": {<cell id>: <cell>, ...}, "strings": [...]} which
+#   is gzip compressed as it is written and base64 encoded at the end. The report decompresses it the
+#   first time a cell is opened and expands the cells one at a time (see getShardCell).
+class CompressedDetailPayload(object):
+    def __init__(self):
+        self.stringTable = []
+        self.stringIndices = {}
+        self.cellCount = 0
+        
+        # A zlib window size of 16 + 15 writes a gzip header, which the browser knows how to read.
+        self.compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.compressedChunks = [self.compressor.compress('{"cells":{')]
+    
+    def _GetStringIndex(self, string):
+        index = self.stringIndices.get(string)
+        if index is None:
+            index = len(self.stringTable)
+            self.stringIndices[string] = index
+            self.stringTable.append(string)
+        
+        return index
+    
+    # AddCell
+    #   Encodes and compresses the file object list of a cell (see
+    #   DatabaseProcessor._GetCellFileObjectList).
+    def AddCell(self, cellId, fileObjectList):
+        cell = []
+        for filePath, includeList in fileObjectList.iteritems():
+            includes = []
+            for includeText, occurrences in includeList.iteritems():
+                lines = []
+                for occurrence in occurrences:
+                    lines.append(occurrence["line-number"])
+                    lines.append(self._GetStringIndex(occurrence["include-type"]))
+                includes.append([self._GetStringIndex(includeText), lines])
+            cell.append([self._GetStringIndex(filePath), includes])
+        
+        separator = ',' if self.cellCount > 0 else ''
+        self.compressedChunks.append(self.compressor.compress(separator + json.dumps(cellId) + ':' + json.dumps(cell, separators=(',', ':'))))
+        self.cellCount += 1
+    
+    # GetEncoded
+    #   Finishes the payload and returns it base64 encoded. No more cells can be added afterwards.
+    def GetEncoded(self):
+        self.compressedChunks.append(self.compressor.compress('},"strings":' + json.dumps(self.stringTable, separators=(',', ':')) + '}'))
+        self.compressedChunks.append(self.compressor.flush())
+        
+        return base64.b64encode(''.join(self.compressedChunks))
+    
 # DatabaseProcessor class
 #   This class reads takes a database generated by the SolutionProcessor and uses it to generate
 #   a Dependency Matrix HTML page.
@@ -439,6 +560,21 @@ class DatabaseProcessor(object):
         self.solutionInfo = dependencydatabase.SolutionInfo(config)
         self.config = config
         
+        # The id of the element holding the --compress-details payload.
+        self.detailPayloadId = "compressed-details"
+        
+        # The cell classes of the --virtual-matrix data, in the order of cellClassNames in the report.
+        self.virtualMatrixCellClasses = [dependencymatrix.DependencyMatrix.cellInternal, dependencymatrix.DependencyMatrix.cellHierarchyViolation, dependencymatrix.DependencyMatrix.cellDependencyViolation, dependencymatrix.DependencyMatrix.cellDependency]
+        
+        # The row and column totals of the --virtual-matrix data are [error sum, warning sum,
+        # dependencies sum] triplets, summed the way ComputeRowTotals sums the table cells.
+        self.virtualMatrixTotalIndices = {
+            dependencymatrix.DependencyMatrix.cellHierarchyViolation: 0,
+            dependencymatrix.DependencyMatrix.cellDependencyViolation: 1,
+            dependencymatrix.DependencyMatrix.cellInternal: 2,
+            dependencymatrix.DependencyMatrix.cellDependency: 2
+        }
+        
         # Initialise the HTML/CSS and JavaScript code that is not dependent on the query results.
         self.htmlDTD = "<!DOCTYPE html>"
         self.htmlStyle = r"""<style type="text/css">
@@ -701,6 +837,32 @@ input[type="button"].subtable-extra-button {
 .diff-count {
     font-weight: bold;
 }
+
+/* Virtual matrix (--virtual-matrix), drawn by drawVirtualMatrix */
+.virtual-matrix-caption {
+    font-size: 11px;
+    text-align: center;
+    margin: 5px;
+}
+.virtual-matrix {
+    position: relative;
+    height: 80vh;
+    border: 1px solid #666666;
+}
+.virtual-matrix-canvas {
+    position: absolute;
+    top: 0;
+    left: 0;
+    pointer-events: none;
+}
+.virtual-matrix-scroller {
+    position: absolute;
+    top: 0;
+    right: 0;
+    bottom: 0;
+    left: 0;
+    overflow: auto;
+}
 </style>"""
 
         # JQuery library inclusion. WARNING!!! The library includes escaped characters! Should you
@@ -776,18 +938,138 @@ function generateIncludesTableRows(jqRowAnchorElement, jsonData, filter) {
         }
     }
 }
-function generateIncludesTable(jsonElementId, filter) {
-    // Damn, we have to do work now. Fiesta's over, let's get to it!
-    // Get the JSON data
+/* The include details of a cell are either inline JSON in its jsondata element or, for reports
+ * written with --detail-files, in a sidecar script file holding the details of a whole matrix row.
+ * The sidecar file (named by the data-shard attribute) is loaded on demand the first time any of its
+ * cells is needed and calls registerDetailShard when it has loaded.
+ *
+ * Reports written with --compress-details instead have a single compressed payload embedded in the
+ * element that the data-shard attribute names. It is decompressed the first time any cell is needed.
+ */
+var detailShards = {};
+function registerDetailShard(shardName, shardData) {
+    var shard = detailShards[shardName];
+    detailShards[shardName] = { data: shardData, callbacks: [] };
+    
+    if (shard) {
+        for (var i = 0; i < shard.callbacks.length; ++i) {
+            shard.callbacks[i](shardData);
+        }
+    }
+}
+function getCellData(jsonElementId, callback) {
     var element = $('#' + jsonElementId);
+    if (!element || element.length == 0) {
+        return;
+    }
     
-    if (element && element.length) {        
+    var shardName = element.attr('data-shard');
+    if (!shardName) {
+        var jsonData;
         try {
             jsonData = JSON.parse(element.text());
         } catch (e) {
             alert('Error parsing JSON data!\n\n' + e.message);
             return;
         }
+        callback(jsonData);
+        return;
+    }
+    
+    getShardCellData(shardName, jsonElementId, callback);
+}
+function getShardCellData(shardName, jsonElementId, callback) {
+    var shard = detailShards[shardName];
+    if (shard && shard.data) {
+        callback(getShardCell(shard.data, jsonElementId));
+        return;
+    }
+    
+    var shardCallback = function (shardData) { callback(getShardCell(shardData, jsonElementId)); };
+    if (shard) {
+        // The sidecar file is already loading.
+        shard.callbacks.push(shardCallback);
+        return;
+    }
+    
+    detailShards[shardName] = { data: null, callbacks: [shardCallback] };
+    var payloadElement = document.getElementById(shardName);
+    if (payloadElement) {
+        unpackDetailPayload(shardName, payloadElement);
+        return;
+    }
+    
+    var script = document.createElement('script');
+    script.src = shardName;
+    script.onerror = function () {
+        delete detailShards[shardName];
+        alert('Error loading the detail file ' + shardName + '!');
+    };
+    document.getElementsByTagName('head')[0].appendChild(script);
+}
+function unpackDetailPayload(shardName, payloadElement) {
+    var onError = function (message) {
+        delete detailShards[shardName];
+        alert('Error decompressing the include details!\n\n' + message);
+    };
+    
+    if (typeof DecompressionStream === 'undefined') {
+        onError('This browser does not support DecompressionStream.');
+        return;
+    }
+    
+    var binary = atob($(payloadElement).text().replace(/\s/g, ''));
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; ++i) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    
+    var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+    new Response(stream).text().then(function (text) {
+        var payload = JSON.parse(text);
+        payload.expanded = {};
+        registerDetailShard(shardName, payload);
+    }).catch(function (e) {
+        onError(e.message);
+    });
+}
+function getShardCell(shardData, jsonElementId) {
+    if (!shardData.strings) {
+        return shardData[jsonElementId];
+    }
+    
+    // A dictionary encoded cell of a compressed payload, see CompressedDetailPayload in the script.
+    var jsonData = shardData.expanded[jsonElementId];
+    if (!jsonData) {
+        var strings = shardData.strings;
+        var cell = shardData.cells[jsonElementId] || [];
+        jsonData = [];
+        for (var i = 0; i < cell.length; ++i) {
+            var includeList = {};
+            for (var j = 0; j < cell[i][1].length; ++j) {
+                var lines = cell[i][1][j][1];
+                var occurrences = [];
+                for (var k = 0; k < lines.length; k += 2) {
+                    occurrences.push({ 'line-number': lines[k], 'include-type': strings[lines[k + 1]] });
+                }
+                includeList[strings[cell[i][1][j][0]]] = occurrences;
+            }
+            jsonData.push({ 'file': strings[cell[i][0]], 'include-list': includeList });
+        }
+        shardData.expanded[jsonElementId] = jsonData;
+    }
+    
+    return jsonData;
+}
+function generateIncludesTable(jsonElementId, filter) {
+    getCellData(jsonElementId, function (jsonData) {
+        // Damn, we have to do work now. Fiesta's over, let's get to it!
+        var element = $('#' + jsonElementId);
+        
+        // The table may have been generated while the details were loading.
+        if ($('#' + generateDivElementId(jsonElementId)).length > 0) {
+            return;
+        }
         
         // Insert the table into the DOM.
         var newElement = $('<div id="' + generateDivElementId(jsonElementId) + '" class="headerlist"></div>');
@@ -817,7 +1099,7 @@ function generateIncludesTable(jsonElementId, filter) {
         if (parent && parent.length > 0) {
             parent.append(newElement);
         }
-    }
+    });
 }
 function showHide(jsonElementId, action) {
     var doTableGeneration = true;
@@ -907,6 +1189,13 @@ function HideSumTable() {
 }
 /* Shows the dynamic row/column sums that show on hover over the headings */
 function DisplaySumTable(parent, errorSum, warningSum, dependenciesSum) {
+    pos = parent.position();
+    pos.top += parent.height();;
+    pos.left += parent.width();;
+    
+    DisplaySumTableAt(pos, errorSum, warningSum, dependenciesSum);
+}
+function DisplaySumTableAt(pos, errorSum, warningSum, dependenciesSum) {
     var container = $('<div id="sum-table"></div>').html(
         $("<table></table>").append(
             $("<thead></thead>").append(
@@ -939,10 +1228,6 @@ function DisplaySumTable(parent, errorSum, warningSum, dependenciesSum) {
         )
     );
     
-    pos = parent.position();
-    pos.top += parent.height();;
-    pos.left += parent.width();;
-    
     container.css({top: pos.top, left: pos.left, position:'absolute'});
     $("body").append(container);
 }
@@ -1007,41 +1292,551 @@ function ComputeColumnTotals(columnClass) {
     parent = $('tr:first th:eq(' + colIndex + ')')
     DisplaySumTable(parent, errorSum, warningSum, dependenciesSum);
 }
-/* Search/Filter functions */
-function find(searchText, options) {
-    if (searchText) {
-        var re = new RegExp(searchText);
+/* Virtual matrix functions
+ *
+ * Reports written with --virtual-matrix have no matrix table. The matrix is in the
+ * dependencyMatrixData object instead:
+ *   projects             - the project names in the matrix order
+ *   cells                - [row, column, include count, cell class, ...] of the non-empty cells, the
+ *                          cell class is an index into cellClassNames
+ *   declaredDependencies - the column indices of the declared dependencies of each row
+ *   rowTotals            - [error sum, warning sum, dependencies sum, ...] of each row
+ *   columnTotals         - the same for each column
+ *   detailShards         - the data-shard (see getCellData) of the cell details of each row, or one
+ *                          for all of the rows
+ * Only the cells in view are drawn, on a canvas under a scrolling element that is sized as the
+ * whole matrix, so the cost of the page doesn't grow with the number of projects.
+ */
+var virtualMatrix = null;
+var cellClassNames = ['self', 'error', 'warning', 'dependency'];
+var virtualMatrixStyle = {
+    cellWidth: 40,
+    cellHeight: 20,
+    headerWidth: 200,
+    headerHeight: 140,
+    font: '11px verdana,arial,sans-serif',
+    lineColor: '#666666',
+    textColor: '#333333',
+    colors: { 'self': '#eeeeee', 'independent': '#cccccc', 'warning': '#ffcc66', 'error': '#ff3300', 'dependency': '#ffffff' },
+    highlightColors: { 'self': '#EEEE00', 'independent': '#DDDD00', 'warning': '#FFD666', 'error': '#FF8800', 'dependency': '#F8F800' }
+};
+function initVirtualMatrix() {
+    var data = window.dependencyMatrixData;
+    var style = virtualMatrixStyle;
+    var vm = { data: data, rowCells: [], declared: [], headerColors: [], highlightedRows: {}, highlightedColumns: {}, filterCounts: null, hover: null, isRedrawPending: false };
+    var i, k;
+    
+    for (i = 0; i < data.projects.length; ++i) {
+        vm.rowCells.push({});
+        vm.declared.push({});
+        for (k = 0; k < data.declaredDependencies[i].length; ++k) {
+            vm.declared[i][data.declaredDependencies[i][k]] = true;
+        }
         
-        $('.jsondata').each(function () {
-            var count = 0;
-            var jsonData = JSON.parse($(this).text());
-            var i = 0;
+        var projectGroup = getProjectGroup(data.projects[i]);
+        vm.headerColors.push((projectGroup && projectGroup.css && projectGroup.css['background-color']) || style.colors['dependency']);
+    }
+    for (k = 0; k < data.cells.length; k += 4) {
+        vm.rowCells[data.cells[k]][data.cells[k + 1]] = k;
+    }
+    
+    vm.canvas = $('#virtual-matrix canvas')[0];
+    vm.scroller = $('#virtual-matrix .virtual-matrix-scroller');
+    vm.scroller.find('.virtual-matrix-spacer').css({
+        width: style.headerWidth + data.projects.length * style.cellWidth,
+        height: style.headerHeight + data.projects.length * style.cellHeight
+    });
+    vm.scroller.on('scroll', requestVirtualMatrixRedraw);
+    vm.scroller.on('mousemove', onVirtualMatrixMouseMove);
+    vm.scroller.on('mouseleave', function () { virtualMatrix.hover = null; HideSumTable(); });
+    vm.scroller.on('click', onVirtualMatrixClick);
+    $(window).on('resize', requestVirtualMatrixRedraw);
+    
+    virtualMatrix = vm;
+    drawVirtualMatrix();
+}
+function getVirtualCellId(rowIndex, columnIndex) {
+    // The same as the ids of the cell details in the script, see _GetJsonDataId.
+    var projects = virtualMatrix.data.projects;
+    return projects[rowIndex].replace(/ /g, '-') + '-' + projects[columnIndex].replace(/ /g, '-') + '-json';
+}
+function getVirtualCellShard(rowIndex) {
+    var detailShards = virtualMatrix.data.detailShards;
+    return (typeof detailShards === 'string') ? detailShards : detailShards[rowIndex];
+}
+function getVirtualCellClass(rowIndex, columnIndex) {
+    var k = virtualMatrix.rowCells[rowIndex][columnIndex];
+    if (k !== undefined) {
+        return cellClassNames[virtualMatrix.data.cells[k + 3]];
+    } else if (rowIndex == columnIndex) {
+        return 'self';
+    } else if (rowIndex < columnIndex && virtualMatrix.declared[rowIndex][columnIndex]) {
+        return 'dependency';
+    }
+    
+    return 'independent';
+}
+function requestVirtualMatrixRedraw() {
+    if (virtualMatrix && !virtualMatrix.isRedrawPending) {
+        virtualMatrix.isRedrawPending = true;
+        window.requestAnimationFrame(drawVirtualMatrix);
+    }
+}
+function drawVirtualMatrix() {
+    var vm = virtualMatrix;
+    var style = virtualMatrixStyle;
+    var data = vm.data;
+    var scroller = vm.scroller[0];
+    var width = scroller.clientWidth;
+    var height = scroller.clientHeight;
+    var ratio = window.devicePixelRatio || 1;
+    var rowIndex, columnIndex, x, y, k;
+    
+    vm.isRedrawPending = false;
+    if (vm.canvas.width != width * ratio || vm.canvas.height != height * ratio) {
+        vm.canvas.width = width * ratio;
+        vm.canvas.height = height * ratio;
+        vm.canvas.style.width = width + 'px';
+        vm.canvas.style.height = height + 'px';
+    }
+    
+    var context = vm.canvas.getContext('2d');
+    context.setTransform(ratio, 0, 0, ratio, 0, 0);
+    context.clearRect(0, 0, width, height);
+    context.textBaseline = 'middle';
+    context.lineWidth = 1;
+    context.strokeStyle = style.lineColor;
+    
+    // The range of the cells in view.
+    var projectCount = data.projects.length;
+    var firstRow = Math.floor(scroller.scrollTop / style.cellHeight);
+    var lastRow = Math.min(projectCount - 1, Math.floor((scroller.scrollTop + height - style.headerHeight) / style.cellHeight));
+    var firstColumn = Math.floor(scroller.scrollLeft / style.cellWidth);
+    var lastColumn = Math.min(projectCount - 1, Math.floor((scroller.scrollLeft + width - style.headerWidth) / style.cellWidth));
+    
+    // The cells
+    for (rowIndex = firstRow; rowIndex <= lastRow; ++rowIndex) {
+        y = style.headerHeight + rowIndex * style.cellHeight - scroller.scrollTop;
+        for (columnIndex = firstColumn; columnIndex <= lastColumn; ++columnIndex) {
+            x = style.headerWidth + columnIndex * style.cellWidth - scroller.scrollLeft;
             
-            for (i = 0; i < jsonData.length; ++i) {
-                var filename = jsonData[i]['file'];
-                
-                if (options.files && re.test(filename)) {
-                    count += Object.keys(jsonData[i]['include-list']).length;
-                } else {
-                    for (var includeText in jsonData[i]['include-list']) {
-                        if (options.includes && re.test(includeText))
-                        {
-                            count++;
-                        }
+            var cellClass = getVirtualCellClass(rowIndex, columnIndex);
+            var isHighlighted = vm.highlightedRows[rowIndex] || vm.highlightedColumns[columnIndex];
+            context.fillStyle = (isHighlighted ? style.highlightColors : style.colors)[cellClass];
+            context.fillRect(x, y, style.cellWidth, style.cellHeight);
+            context.strokeRect(x + 0.5, y + 0.5, style.cellWidth, style.cellHeight);
+            
+            k = vm.rowCells[rowIndex][columnIndex];
+            if (k === undefined) {
+                continue;
+            }
+            
+            var text = data.cells[k + 2];
+            if (vm.filterCounts) {
+                // Only the counts of the filter's matches are shown, see find.
+                text = vm.filterCounts[getVirtualCellId(rowIndex, columnIndex)];
+                if (!text) {
+                    continue;
+                }
+                context.font = 'bold ' + style.font;
+                context.fillStyle = (cellClass == 'warning' || cellClass == 'error') ? '#ffff00' : '#ff0000';
+            } else if (cellClass == 'error') {
+                context.font = 'bold ' + style.font;
+                context.fillStyle = '#ffffff';
+            } else {
+                context.font = style.font;
+                context.fillStyle = style.textColor;
+            }
+            context.fillText(text, x + 5, y + style.cellHeight / 2);
+        }
+    }
+    
+    // The row headings
+    context.font = style.font;
+    context.fillStyle = style.colors['dependency'];
+    context.fillRect(0, style.headerHeight, style.headerWidth, height - style.headerHeight);
+    context.save();
+    context.beginPath();
+    context.rect(0, style.headerHeight, style.headerWidth, height - style.headerHeight);
+    context.clip();
+    for (rowIndex = firstRow; rowIndex <= lastRow; ++rowIndex) {
+        y = style.headerHeight + rowIndex * style.cellHeight - scroller.scrollTop;
+        context.fillStyle = vm.headerColors[rowIndex];
+        context.fillRect(0, y, style.headerWidth, style.cellHeight);
+        context.fillStyle = style.textColor;
+        context.fillText(data.projects[rowIndex], 5, y + style.cellHeight / 2);
+    }
+    context.restore();
+    
+    // The column headings
+    context.fillStyle = style.colors['dependency'];
+    context.fillRect(style.headerWidth, 0, width - style.headerWidth, style.headerHeight);
+    context.save();
+    context.beginPath();
+    context.rect(style.headerWidth, 0, width - style.headerWidth, style.headerHeight);
+    context.clip();
+    for (columnIndex = firstColumn; columnIndex <= lastColumn; ++columnIndex) {
+        x = style.headerWidth + columnIndex * style.cellWidth - scroller.scrollLeft;
+        context.fillStyle = vm.headerColors[columnIndex];
+        context.fillRect(x, 0, style.cellWidth, style.headerHeight);
+        context.save();
+        context.translate(x + style.cellWidth / 2, style.headerHeight - 5);
+        context.rotate(-Math.PI / 2);
+        context.fillStyle = style.textColor;
+        context.fillText(data.projects[columnIndex], 0, 0);
+        context.restore();
+    }
+    context.restore();
+    
+    // The corner
+    context.fillStyle = style.colors['dependency'];
+    context.fillRect(0, 0, style.headerWidth, style.headerHeight);
+}
+/* Returns the row and column under the mouse, -1 for the headings and null outside of the matrix */
+function getVirtualMatrixPosition(e) {
+    var style = virtualMatrixStyle;
+    var scroller = virtualMatrix.scroller[0];
+    var offset = virtualMatrix.scroller.offset();
+    var x = e.pageX - offset.left;
+    var y = e.pageY - offset.top;
+    var projectCount = virtualMatrix.data.projects.length;
+    var position = { row: -1, column: -1 };
+    
+    if (x >= scroller.clientWidth || y >= scroller.clientHeight) {
+        return null;
+    }
+    if (x >= style.headerWidth) {
+        position.column = Math.floor((x - style.headerWidth + scroller.scrollLeft) / style.cellWidth);
+    }
+    if (y >= style.headerHeight) {
+        position.row = Math.floor((y - style.headerHeight + scroller.scrollTop) / style.cellHeight);
+    }
+    if (position.row >= projectCount || position.column >= projectCount) {
+        return null;
+    }
+    
+    return position;
+}
+function onVirtualMatrixMouseMove(e) {
+    var position = getVirtualMatrixPosition(e);
+    var hover = null;
+    
+    // Show the precomputed totals of the row or column whose heading is under the mouse.
+    if (position && position.row >= 0 && position.column < 0) {
+        hover = 'row-' + position.row;
+    } else if (position && position.column >= 0 && position.row < 0) {
+        hover = 'column-' + position.column;
+    }
+    if (hover === virtualMatrix.hover) {
+        return;
+    }
+    
+    virtualMatrix.hover = hover;
+    HideSumTable();
+    if (hover) {
+        var totals = (position.row >= 0) ? virtualMatrix.data.rowTotals : virtualMatrix.data.columnTotals;
+        var i = 3 * Math.max(position.row, position.column);
+        DisplaySumTableAt({ top: e.pageY + 10, left: e.pageX + 10 }, totals[i], totals[i + 1], totals[i + 2]);
+    }
+}
+function onVirtualMatrixClick(e) {
+    var position = getVirtualMatrixPosition(e);
+    if (!position || (position.row < 0 && position.column < 0)) {
+        return;
+    }
+    
+    if (position.column < 0) {
+        virtualMatrix.highlightedRows[position.row] = !virtualMatrix.highlightedRows[position.row];
+        requestVirtualMatrixRedraw();
+    } else if (position.row < 0) {
+        virtualMatrix.highlightedColumns[position.column] = !virtualMatrix.highlightedColumns[position.column];
+        requestVirtualMatrixRedraw();
+    } else if (virtualMatrix.rowCells[position.row][position.column] !== undefined) {
+        showVirtualCellDetails(position.row, position.column, e.pageX, e.pageY);
+    }
+}
+function showVirtualCellDetails(rowIndex, columnIndex, pageX, pageY) {
+    var jsonElementId = getVirtualCellId(rowIndex, columnIndex);
+    
+    getShardCellData(getVirtualCellShard(rowIndex), jsonElementId, function (jsonData) {
+        var filter = getCurrentFilter();
+        hideVirtualCellDetails();
+        
+        // The same table as generateIncludesTable generates, in a single floating element.
+        var newElement = $('<div id="' + generateDivElementId(jsonElementId) + '" class="headerlist virtual-matrix-details"></div>');
+        var buttonHeader = $('<div class="button-header"></div>');
+        buttonHeader.append($('<input type="button" value="&#10006;" class="close-button" onclick="javascript:hideVirtualCellDetails();">'));
+        if (filter) {
+            buttonHeader.append($('<input id="' + generateFilterButtonId(jsonElementId) + '" class="subtable-extra-button" type="button" value="Show all" onclick="javascript:showHideNonhighlightedRows(\'' + jsonElementId + '\');">'));
+        }
+        newElement.append(buttonHeader);
+        
+        var newTable = $('<table class="includes-table"><thead><tr><th>File</th><th>Include Text</th><th>Line Number</th><th>Include Type</th></tr></thead></table>');
+        var newTableBody = $('<tbody></tbody>');
+        newTable.append(newTableBody);
+        newElement.append(newTable);
+        generateIncludesTableRows(newTableBody, jsonData, filter);
+        
+        newElement.css({ top: pageY, left: pageX });
+        $('body').append(newElement);
+    });
+}
+function hideVirtualCellDetails() {
+    $('.virtual-matrix-details').remove();
+}
+/* Search/Filter functions */
+
+/* The search index maps each distinct file path and #include text of the report to the cells that
+ * contain it. It is built once, the first time a filter is applied, so that a filter only tests each
+ * distinct string against the regular expression instead of parsing the JSON of every cell again.
+ *
+ *   filePostings[file]       - [cell, number of #include texts of the file in the cell, ...]
+ *   includePostings[include] - [cell, file, ...]
+ *
+ * The index is built and searched in a Web Worker so that the page stays responsive. Where a worker
+ * can't be started the same functions run on the page itself.
+ */
+function buildSearchIndex(cells) {
+    var index = { cellIds: [], files: [], filePostings: [], includes: [], includePostings: [] };
+    var fileIndices = new Map();
+    var includeIndices = new Map();
+    
+    for (var c = 0; c < cells.length; ++c) {
+        index.cellIds.push(cells[c][0]);
+        var jsonData = (typeof cells[c][1] === 'string') ? JSON.parse(cells[c][1]) : cells[c][1];
+        
+        for (var i = 0; i < jsonData.length; ++i) {
+            var fileIndex = fileIndices.get(jsonData[i]['file']);
+            if (fileIndex === undefined) {
+                fileIndex = index.files.length;
+                fileIndices.set(jsonData[i]['file'], fileIndex);
+                index.files.push(jsonData[i]['file']);
+                index.filePostings.push([]);
+            }
+            
+            var includeTexts = Object.keys(jsonData[i]['include-list']);
+            index.filePostings[fileIndex].push(c, includeTexts.length);
+            
+            for (var j = 0; j < includeTexts.length; ++j) {
+                var includeIndex = includeIndices.get(includeTexts[j]);
+                if (includeIndex === undefined) {
+                    includeIndex = index.includes.length;
+                    includeIndices.set(includeTexts[j], includeIndex);
+                    index.includes.push(includeTexts[j]);
+                    index.includePostings.push([]);
+                }
+                index.includePostings[includeIndex].push(c, fileIndex);
+            }
+        }
+    }
+    
+    return index;
+}
+function searchIndex(index, searchText, options) {
+    // A cell's count is the number of its (file, #include text) pairs where either the file or the
+    // #include text matches.
+    var re = new RegExp(searchText);
+    var counts = new Int32Array(index.cellIds.length);
+    var isFileMatched = new Uint8Array(index.files.length);
+    var f, t, k, postings;
+    
+    if (options.files) {
+        for (f = 0; f < index.files.length; ++f) {
+            if (re.test(index.files[f])) {
+                isFileMatched[f] = 1;
+                postings = index.filePostings[f];
+                for (k = 0; k < postings.length; k += 2) {
+                    counts[postings[k]] += postings[k + 1];
+                }
+            }
+        }
+    }
+    if (options.includes) {
+        for (t = 0; t < index.includes.length; ++t) {
+            if (re.test(index.includes[t])) {
+                postings = index.includePostings[t];
+                for (k = 0; k < postings.length; k += 2) {
+                    if (!isFileMatched[postings[k + 1]]) {
+                        counts[postings[k]]++;
                     }
                 }
             }
+        }
+    }
+    
+    var result = {};
+    for (var c = 0; c < counts.length; ++c) {
+        if (counts[c] > 0) {
+            result[index.cellIds[c]] = counts[c];
+        }
+    }
+    
+    return result;
+}
+function searchIndexWorker() {
+    var index = null;
+    
+    self.onmessage = function (e) {
+        if (e.data.type === 'build') {
+            index = buildSearchIndex(e.data.cells);
+        } else if (e.data.type === 'search') {
+            postMessage({ requestId: e.data.requestId, counts: searchIndex(index, e.data.searchText, e.data.options) });
+        }
+    };
+}
+var searchEngine = null;
+function collectSearchCells(callback) {
+    // Inline cells are passed on as text so that the JSON is parsed where the index is built.
+    var cells = [];
+    var pendingCount = 1;
+    var onCellCollected = function () {
+        if (--pendingCount == 0) {
+            callback(cells);
+        }
+    };
+    
+    if (virtualMatrix) {
+        var data = virtualMatrix.data;
+        var collectCell = function (jsonElementId, shardName) {
+            ++pendingCount;
+            getShardCellData(shardName, jsonElementId, function (jsonData) {
+                cells.push([jsonElementId, jsonData]);
+                onCellCollected();
+            });
+        };
+        for (var k = 0; k < data.cells.length; k += 4) {
+            collectCell(getVirtualCellId(data.cells[k], data.cells[k + 1]), getVirtualCellShard(data.cells[k]));
+        }
+    }
+    
+    $('.jsondata').each(function () {
+        var jsonElementId = $(this).attr('id');
+        if ($(this).attr('data-shard')) {
+            ++pendingCount;
+            getCellData(jsonElementId, function (jsonData) {
+                cells.push([jsonElementId, jsonData]);
+                onCellCollected();
+            });
+        } else {
+            cells.push([jsonElementId, $(this).text()]);
+        }
+    });
+    onCellCollected();
+}
+function startSearchWorker(engine) {
+    try {
+        var source = buildSearchIndex.toString() + '\n' + searchIndex.toString() + '\n(' + searchIndexWorker.toString() + ')();\n';
+        engine.worker = new Worker(URL.createObjectURL(new Blob([source], { type: 'text/javascript' })));
+    } catch (e) {
+        engine.worker = null;
+        return;
+    }
+    
+    engine.worker.onmessage = function (e) {
+        var callback = engine.requests[e.data.requestId];
+        delete engine.requests[e.data.requestId];
+        if (callback) {
+            callback(e.data.counts);
+        }
+    };
+    engine.worker.onerror = function (e) {
+        // Fall back to searching on the page. If the index was already sent to the worker it has to
+        // be built again and the searches that were sent to the worker are redone.
+        engine.worker.terminate();
+        engine.worker = null;
+        if (!engine.isReady) {
+            return;
+        }
+        
+        var requests = engine.requests;
+        engine.requests = {};
+        engine.isReady = false;
+        for (var requestId in requests) {
+            engine.queue.push(requests[requestId].run);
+        }
+        collectSearchCells(function (cells) {
+            engine.index = buildSearchIndex(cells);
+            setSearchEngineReady(engine);
+        });
+    };
+}
+function setSearchEngineReady(engine) {
+    engine.isReady = true;
+    for (var i = 0; i < engine.queue.length; ++i) {
+        engine.queue[i]();
+    }
+    engine.queue = [];
+}
+function getSearchEngine() {
+    if (!searchEngine) {
+        var engine = { worker: null, index: null, isReady: false, queue: [], requests: {}, nextRequestId: 0 };
+        startSearchWorker(engine);
+        collectSearchCells(function (cells) {
+            if (engine.worker) {
+                engine.worker.postMessage({ type: 'build', cells: cells });
+            } else {
+                engine.index = buildSearchIndex(cells);
+            }
+            setSearchEngineReady(engine);
+        });
+        searchEngine = engine;
+    }
+    
+    return searchEngine;
+}
+function runSearch(searchText, options, callback) {
+    var engine = getSearchEngine();
+    var run = function () {
+        if (engine.worker) {
+            var requestId = engine.nextRequestId++;
+            callback.run = run;
+            engine.requests[requestId] = callback;
+            engine.worker.postMessage({ type: 'search', requestId: requestId, searchText: searchText, options: { files: options.files, includes: options.includes } });
+        } else {
+            callback(searchIndex(engine.index, searchText, options));
+        }
+    };
+    
+    if (engine.isReady) {
+        run();
+    } else {
+        engine.queue.push(run);
+    }
+}
+var lastSearchId = 0;
+function find(searchText, options) {
+    // Results of an earlier search that arrive after this one was started are ignored.
+    var searchId = ++lastSearchId;
+    
+    if (searchText) {
+        new RegExp(searchText); // Throws on an invalid expression before any work is done.
+        
+        runSearch(searchText, options, function (counts) {
+            if (searchId != lastSearchId) {
+                return;
+            }
             
-            var container = $(this).parent();
-            var countElem = container.children('span.include-count');
-            countElem.addClass('hidden');
-            if (count > 0)
-            {
-                var newCountElem = $('<span class="include-count js-computed-sum"></span>').text(count);
-                container.append(newCountElem);
+            if (virtualMatrix) {
+                virtualMatrix.filterCounts = counts;
+                requestVirtualMatrixRedraw();
             }
+            $('.jsondata').each(function () {
+                var count = counts[$(this).attr('id')];
+                var container = $(this).parent();
+                var countElem = container.children('span.include-count');
+                countElem.addClass('hidden');
+                if (count > 0)
+                {
+                    var newCountElem = $('<span class="include-count js-computed-sum"></span>').text(count);
+                    container.append(newCountElem);
+                }
+            });
         });
     } else {
+        if (virtualMatrix) {
+            virtualMatrix.filterCounts = null;
+            requestVirtualMatrixRedraw();
+        }
         $('table.includes-table tr td.highlight').each(function () {
             $(this).removeClass("highlight");
         });
@@ -1209,6 +2004,11 @@ function computeMatrixTableDiff() {
 function applyDiff() {
     var frame = $('#diff-frame');
     
+    if (virtualMatrix) {
+        alert('Diffs are not supported by reports written with --virtual-matrix!');
+        return;
+    }
+    
     if (frame) {
         clearDiff();
     }
@@ -1297,6 +2097,9 @@ function applyProjectGroupsCSS() {
 function initStart() {
     initJsonData();
     applyProjectGroupsCSS();
+    if (window.dependencyMatrixData) {
+        initVirtualMatrix();
+    }
 }
 </script>"""
             self.htmlOnloadFunction = "initStart()";
@@ -1322,6 +2125,68 @@ function initStart() {
         rv += self._SanitizeClassOrIdentifier(project2)
         rv += '-info'
         return rv
+
+    # _GetCellFileObjectList
+    #   Queries the #include directives with which the files of one project include the files of
+    #   another. Returns an OrderedDict of the file paths mapped to OrderedDicts of the #include texts
+    #   mapped to lists of their occurences. The files are sorted by path and the #include directives
+    #   are kept in the order they appear in the file.
+    def _GetCellFileObjectList(self, projectId, includeProjectId):
+        fileObjectList = OrderedDict()
+
+        self.database.cur.execute("""
+        SELECT f.SolutionPath AS FilePath,
+               t.Text AS IncludeText,
+               t.IncludeType AS IncludeType,
+               i.LineNumber AS LineNumber
+        FROM CodeFileEntry c
+        INNER JOIN PathEntry f ON f.Id = c.PathId
+        INNER JOIN IncludeDirectiveEntry i ON i.CodeFileId = c.PathId
+        INNER JOIN IncludeTextEntry t ON t.Id = i.IncludeTextId
+        WHERE c.ProjectId = ? AND i.IncludeProjectId = ?
+        ORDER BY f.SolutionPath ASC, i.rowid ASC;
+        """, (projectId, includeProjectId))
+
+        for filePath, includeText, includeType, lineNumber in self.database.cur.fetchall():
+            if filePath not in fileObjectList:
+                fileObjectList[filePath] = OrderedDict()
+            if includeText not in fileObjectList[filePath]:
+                fileObjectList[filePath][includeText] = []
+            fileObjectList[filePath][includeText].append(OrderedDict([("line-number", lineNumber), ("include-type", includeType)]))
+
+        return fileObjectList
+
+    # _GetDetailFilesPath
+    #   Returns the path of the directory into which the per-row detail files of the HTML file are
+    #   written when the --detail-files option is given. It is next to the HTML file and named after
+    #   it.
+    def _GetDetailFilesPath(self, outFilename):
+        return os.path.splitext(outFilename)[0] + "-details"
+    
+    # _PrepareDetailFilesPath
+    #   Creates the detail files directory or removes the detail files of a previous run from it.
+    def _PrepareDetailFilesPath(self, detailFilesPath):
+        if os.path.isdir(detailFilesPath):
+            for filename in os.listdir(detailFilesPath):
+                if filename.startswith("row-") and filename.endswith(".js"):
+                    os.remove(os.path.join(detailFilesPath, filename))
+        else:
+            self.config.messagePrinter.info("Making directory: {0}".format(detailFilesPath))
+            os.mkdir(detailFilesPath)
+    
+    # _WriteVirtualMatrix
+    #   Writes the --virtual-matrix form of the dependency matrix: an empty container that the report
+    #   draws the visible part of the matrix into and the matrix data as a JavaScript object (see
+    #   initVirtualMatrix in the report).
+    def _WriteVirtualMatrix(self, file, matrixData):
+        file.write('<div class="virtual-matrix-caption">Project Dependency Matrix</div>\n')
+        file.write('<div id="virtual-matrix" class="virtual-matrix">\n')
+        file.write('    <canvas class="virtual-matrix-canvas"></canvas>\n')
+        file.write('    <div class="virtual-matrix-scroller"><div class="virtual-matrix-spacer"></div></div>\n')
+        file.write('</div>\n')
+        file.write('<script type="text/javascript">\n')
+        file.write('var dependencyMatrixData = ' + json.dumps(matrixData, separators=(',', ':')).replace('</', '<\\/') + ';\n')
+        file.write('</script>\n')
     
     def SetTitle(self, title):
         self.title = title
@@ -1355,6 +2220,18 @@ function initStart() {
                 self.config.messagePrinter.info("Making directory: {0}".format(htmlPath))
                 os.mkdir(htmlPath)
         
+        # With --detail-files the include details of the cells go into one sidecar file per row
+        # instead of being inlined in the HTML file. The report loads them on demand.
+        detailFilesPath = None
+        detailPayload = None
+        isVirtualMatrix = self.config.virtualMatrix
+        if self.config.compressDetails or (isVirtualMatrix and not self.config.detailFiles):
+            detailPayload = CompressedDetailPayload()
+        elif self.config.detailFiles:
+            detailFilesPath = self._GetDetailFilesPath(outFilename)
+            self._PrepareDetailFilesPath(detailFilesPath)
+            self.config.messagePrinter.info("Detail files: {0}".format(detailFilesPath))
+        
         # Write the HTML document header info.
         file = open(outFilename, "w")
         file.write(self.htmlDTD + "\n")
@@ -1394,150 +2271,130 @@ function initStart() {
         
         # The following part sets up the table headers (top row). All the computed counts that
         # follow will have to be in exactly the same order.
-        projectOrderList = []
-        
-        self.database.cur.execute("SELECT * FROM Project p ORDER BY p.HierarchyLevel ASC, p.Name DESC")
+        self.config.messagePrinter.info("Querying the dependency matrix...")
         
-        row = self.database.cur.fetchone()
-        while row:
-            projectOrderList.append(row[1])
-            row = self.database.cur.fetchone()
+        dependencyMatrix = dependencymatrix.DependencyMatrix(self.database, self.solutionInfo)
+        projectOrderList = dependencyMatrix.projectNames
+        projectIdList = dependencyMatrix.projectIds
         
         matrixWriter = DependencyMatrixHtmlTableWriter(file, self.solutionInfo)
         matrixWriter.SetRowHeadings(projectOrderList)
         matrixWriter.SetColumnHeadings(projectOrderList)
-        matrixTableWriter = HtmlTableInlineWriter(matrixWriter)
-        
-        self.config.messagePrinter.info("The following query might take a while (~2min)...")
         
-        queryStart = time.clock()
-        # Compute the number of times each item show up in the given header. Must follow the same
-        # order as the previously outputed headers.
-        self.database.cur.execute("""
-        SELECT p.Name AS ProjectName,
-               f.SolutionPath AS FilePath,
-               f.Filename AS Filename,
-               i.IncludeText AS IncludeText,
-               i.IncludeType AS IncludeType,
-               i.IncludeFilename AS IncludeFilename,
-               i.LineNumber AS LineNumber,
-               i.IncludeProject AS IncludeProject
-        FROM Project p
-        LEFT JOIN CodeFile f ON p.Name = f.Project
-        INNER JOIN IncludeDirective i ON i.CodeFileSolutionPath = f.SolutionPath
-        INNER JOIN Project ip ON i.IncludeProject = ip.Name
-        ORDER BY p.HierarchyLevel ASC, p.Name DESC, ip.HierarchyLevel ASC, ip.Name DESC, f.SolutionPath ASC;
-        """)
-        
-        self.config.messagePrinter.info("Query completed. Processing result set...")
-        # Setup the constant indices of the result set columns. They follow the order given in the
-        # SELECT statement above.
-        projectName = 0
-        filePath = 1
-        filename = 2
-        includeText = 3
-        includeType = 4
-        includeFilename = 5
-        lineNumber = 6
-        includeProject = 7
-        
-        # Iteration state variables
-        currentProject = projectOrderList[0]
-        currentIncludeProject = projectOrderList[0]
-        currentIncludeCount = 0
-        
-        # Write the table data item prefix
-        jsonDataId = self._GetJsonDataId(currentProject, currentIncludeProject)
-        matrixTableWriter.WriteData('\n<div onclick="javascript:showHide(\'' + jsonDataId + '\', \'show\')">\n', projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
-        matrixTableWriter.WriteData('<div id="' + jsonDataId + '" class="jsondata hidden">\n', projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
-        
-        # Initialise the JSON element. writer.
-        fileObjectList = OrderedDict()
-        
-        totalDependencies = 0
-        totalInternalLinkage = 0
-        totalHierarchyViolations = 0
-        totalPotentialViolations = 0
-        # Iterate over the result set and generate an HTML table.
-        row = self.database.cur.fetchone()
-        while row:
-            if currentProject != row[projectName] or currentIncludeProject != row[includeProject]:
-                # Finalise the JSON element.
+        # The include counts of the cells come from the dependency matrix, the files and the #include
+        # directives behind each cell are only queried when the cell is written (see
+        # _GetCellFileObjectList). Cell (0, 0) is always written, even when empty.
+        rowColumnIndices = [dependencyMatrix.GetRowColumns(rowIndex) for rowIndex in xrange(len(projectOrderList))]
+        if rowColumnIndices and 0 not in rowColumnIndices[0]:
+            rowColumnIndices[0] = [0] + rowColumnIndices[0]
+        cellCount = sum([len(columnIndices) for columnIndices in rowColumnIndices])
+        
+        self.config.messagePrinter.info("Query completed. Writing {0} matrix cells...".format(cellCount))
+        
+        remainingCellCount = cellCount
+        
+        # With --virtual-matrix the cells are collected into flat [row, column, include count, cell
+        # class] arrays and the row and column totals are summed as they are collected.
+        if isVirtualMatrix:
+            virtualCells = []
+            rowTotals = [0] * (3 * len(projectOrderList))
+            columnTotals = [0] * (3 * len(projectOrderList))
+            rowDetailShards = []
+        
+        # The matrix is written a row at a time, see DependencyMatrixHtmlTableWriter.WriteRow.
+        if not isVirtualMatrix:
+            matrixWriter.WriteTableStart()
+        for rowIndex, currentProject in enumerate(projectOrderList):
+            cellData = {}
+            
+            # The detail file of the row, named relative to the HTML file for the report to load it.
+            shardData = OrderedDict()
+            shardName = None
+            if detailPayload:
+                shardName = self.detailPayloadId
+            elif detailFilesPath:
+                shardName = os.path.basename(detailFilesPath) + "/row-" + str(rowIndex) + ".js"
+            if isVirtualMatrix:
+                rowDetailShards.append(shardName)
+            
+            for columnIndex in rowColumnIndices[rowIndex]:
+                currentIncludeProject = projectOrderList[columnIndex]
+                currentIncludeCount = dependencyMatrix.GetCount(rowIndex, columnIndex)
+                remainingCellCount -= 1
+                
+                # The table data item prefix, the JSON element and the suffix.
+                jsonDataId = self._GetJsonDataId(currentProject, currentIncludeProject)
+                fileObjectList = self._GetCellFileObjectList(projectIdList[rowIndex], projectIdList[columnIndex])
                 fileObjectList2 = [OrderedDict([('file', x), ('include-list', fileObjectList[x])]) for x in fileObjectList];
-                file.write(json.dumps(fileObjectList2) + '\n');
+                cellClass = dependencyMatrix.ClassifyCell(rowIndex, columnIndex)
                 
-                # Write the table data item suffix
-                matrixTableWriter.WriteData('</div>\n', projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
-                dataString = "<!-- row:[" + currentProject + "] column:[" + currentIncludeProject + "] -->\n"
-                dataString += '<span class="include-count">'
-                dataString += str(currentIncludeCount)
-                dataString += '</span>\n'
-                matrixTableWriter.WriteData(dataString, projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
-                matrixTableWriter.WriteData('</div>\n', projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
+                if detailPayload:
+                    detailPayload.AddCell(jsonDataId, fileObjectList)
+                elif shardName:
+                    shardData[jsonDataId] = fileObjectList2
                 
-                # Add this to the appropriate total
-                if matrixWriter.GetRowIndex() == matrixWriter.GetColumnIndex():
-                    totalInternalLinkage += currentIncludeCount
-                elif matrixWriter.GetRowIndex() > matrixWriter.GetColumnIndex():
-                    totalHierarchyViolations += currentIncludeCount
-                    if self.config.printHierarchyViolations:
-                        self.config.messagePrinter.info("Project hierarchy violation:  {project} includes {count} items from {include}".format(project=currentProject, count=currentIncludeCount, include=currentIncludeProject))
-                elif not self.solutionInfo.HasProjectDependency(currentProject, currentIncludeProject):
-                    totalPotentialViolations += currentIncludeCount
-                    if self.config.printDependencyViolations:
-                        self.config.messagePrinter.info("Project dependency violation: {project} includes {count} items from {include}".format(project=currentProject, count=currentIncludeCount, include=currentIncludeProject))
+                if isVirtualMatrix:
+                    virtualCells.extend([rowIndex, columnIndex, currentIncludeCount, self.virtualMatrixCellClasses.index(cellClass)])
+                    totalIndex = self.virtualMatrixTotalIndices[cellClass]
+                    rowTotals[3 * rowIndex + totalIndex] += currentIncludeCount
+                    columnTotals[3 * columnIndex + totalIndex] += currentIncludeCount
                 else:
-                    totalDependencies += currentIncludeCount
+                    dataList = ['\n<div onclick="javascript:showHide(\'' + jsonDataId + '\', \'show\')">\n']
+                    if shardName:
+                        dataList.append('<div id="' + jsonDataId + '" class="jsondata hidden" data-shard="' + shardName + '"></div>\n')
+                    else:
+                        dataList.append('<div id="' + jsonDataId + '" class="jsondata hidden">\n')
+                        dataList.append(json.dumps(fileObjectList2))
+                        if remainingCellCount > 0:
+                            dataList.append('\n')
+                        dataList.append('</div>\n')
+                    dataList.append("<!-- row:[" + currentProject + "] column:[" + currentIncludeProject + "] -->\n")
+                    dataList.append('<span class="include-count">' + str(currentIncludeCount) + '</span>\n')
+                    dataList.append('</div>\n')
+                    cellData[columnIndex] = ''.join(dataList)
                 
-                # Change to the next project group (row,column)
-                currentProject = row[projectName]
-                currentIncludeProject = row[includeProject]
-                currentIncludeCount = 0
-                
-                jsonDataId = self._GetJsonDataId(currentProject, currentIncludeProject)
-                matrixTableWriter.WriteData('\n<div onclick="javascript:showHide(\'' + jsonDataId + '\', \'show\')">\n', projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
-                matrixTableWriter.WriteData('<div id="' + jsonDataId + '" class="jsondata hidden">\n', projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
-        
-                # Initialise a new JSON element. writer.
-                fileObjectList = OrderedDict()
+                if cellClass == dependencymatrix.DependencyMatrix.cellHierarchyViolation and self.config.printHierarchyViolations:
+                    self.config.messagePrinter.info("Project hierarchy violation:  {project} includes {count} items from {include}".format(project=currentProject, count=currentIncludeCount, include=currentIncludeProject))
+                elif cellClass == dependencymatrix.DependencyMatrix.cellDependencyViolation and self.config.printDependencyViolations:
+                    self.config.messagePrinter.info("Project dependency violation: {project} includes {count} items from {include}".format(project=currentProject, count=currentIncludeCount, include=currentIncludeProject))
             
-            # Write a row to the JSON element.
-            if row[filePath] not in fileObjectList:
-                fileObjectList[row[filePath]] = OrderedDict();
-            if row[includeText] not in fileObjectList[row[filePath]]:
-                fileObjectList[row[filePath]][row[includeText]] = [];
-            fileObjectList[row[filePath]][row[includeText]].append(OrderedDict());
-            fileObjectList[row[filePath]][row[includeText]][-1]["line-number"]  = row[lineNumber];
-            fileObjectList[row[filePath]][row[includeText]][-1]["include-type"] = row[includeType];
+            if not isVirtualMatrix:
+                matrixWriter.WriteRow(rowIndex, cellData)
             
-            # Increment step
-            currentIncludeCount += 1
-            row = self.database.cur.fetchone()
-        
-        # Finalise the JSON element.
-        fileObjectList2 = [OrderedDict([('file', x), ('include-list', fileObjectList[x])]) for x in fileObjectList];
-        file.write(json.dumps(fileObjectList2));
-        
-        # Write the table data item suffix
-        matrixTableWriter.WriteData('</div>\n', projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
-        dataString = "<!-- row:[" + currentProject + "] column:[" + currentIncludeProject + "] -->\n"
-        dataString += '<span class="include-count">'
-        dataString += str(currentIncludeCount)
-        dataString += '</span>\n'
-        matrixTableWriter.WriteData(dataString, projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
-        matrixTableWriter.WriteData('</div>\n', projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
-        
-        # Ensure that ALL the rows are written!
-        if currentProject != projectOrderList[-1]:
-            # We will enter here if we haven't reached the last row. We will write a fake data item
-            # to any one of the columns in the last row which will force the writer to write out
-            # upto and including the last row when we End() it.
-            currentProject = projectOrderList[-1]
-            currentIncludeProject = projectOrderList[-1]
-            matrixTableWriter.WriteData("\n<!-- r:[" + currentProject + "] c:[" + currentIncludeProject + "] -->\n", projectOrderList.index(currentIncludeProject), projectOrderList.index(currentProject))
+            if shardData:
+                shardFile = open(os.path.join(detailFilesPath, "row-" + str(rowIndex) + ".js"), "w")
+                shardFile.write("registerDetailShard(" + json.dumps(shardName) + ", " + json.dumps(shardData) + ");\n")
+                shardFile.close()
         
         # Finalise the matrix table
-        matrixTableWriter.End()
+        if isVirtualMatrix:
+            # A single detail shard name stands for all of the rows.
+            if detailPayload:
+                rowDetailShards = self.detailPayloadId
+            
+            self._WriteVirtualMatrix(file, OrderedDict([
+                ("projects", projectOrderList),
+                ("cells", virtualCells),
+                ("declaredDependencies", [dependencyMatrix.GetDeclaredDependencyColumns(rowIndex) for rowIndex in xrange(len(projectOrderList))]),
+                ("rowTotals", rowTotals),
+                ("columnTotals", columnTotals),
+                ("detailShards", rowDetailShards)]))
+        else:
+            matrixWriter.WriteTableEnd()
+        
+        if detailPayload:
+            encodedPayload = detailPayload.GetEncoded()
+            self.config.messagePrinter.info("Compressed the include details to {0} bytes.".format(len(encodedPayload)))
+            file.write('<div id="' + self.detailPayloadId + '" class="hidden">\n')
+            for offset in xrange(0, len(encodedPayload), 4096):
+                file.write(encodedPayload[offset:offset + 4096] + '\n')
+            file.write('</div>\n')
+        
+        totals = dependencyMatrix.GetTotals()
+        totalDependencies = totals[dependencymatrix.DependencyMatrix.cellDependency]
+        totalInternalLinkage = totals[dependencymatrix.DependencyMatrix.cellInternal]
+        totalHierarchyViolations = totals[dependencymatrix.DependencyMatrix.cellHierarchyViolation]
+        totalPotentialViolations = totals[dependencymatrix.DependencyMatrix.cellDependencyViolation]
         
         # Write the footer (includes summary tables, filter and diff inputs)
         file.write("""
@@ -1637,6 +2494,10 @@ def Main(argv):
     config.argparser.add_argument('--dont-open', dest='openInBrowser', action='store_false', default=True, help='Prevents the script from automatically opening the resulting HTML file in the default web browser.')
     config.argparser.add_argument('--print-dependency-violations', dest='printDependencyViolations', action='store_true', default=False, help='Print dependency violations as they are discovered in the terminal.')
     config.argparser.add_argument('--print-hierarchy-violations', dest='printHierarchyViolations', action='store_true', default=False, help='Print hierarchy violations as they are discovered in the terminal.')
+    detailOutputGroup = config.argparser.add_mutually_exclusive_group()
+    detailOutputGroup.add_argument('--compress-details', dest='compressDetails', action='store_true', default=False, help='Embed the #include details of the matrix cells as a single compressed payload instead of inlining them as JSON. The HTML file stays self-contained but is much smaller. The report decompresses the payload when a cell is first opened.')
+    detailOutputGroup.add_argument('--detail-files', dest='detailFiles', action='store_true', default=False, help='Write the #include details of the matrix cells into one file per matrix row next to the HTML file instead of inlining them. The report then loads them on demand, which keeps the HTML file small.')
+    config.argparser.add_argument('--virtual-matrix', dest='virtualMatrix', action='store_true', default=False, help='Ship the matrix as data and only draw the part of it that is in view instead of writing it as an HTML table. Use it for solutions with too many projects for the table to be usable. The #include details are compressed (see --compress-details) unless --detail-files is given. Diffs are not supported.')
     config.argparser.add_argument('--print-totals', dest='printTotalViolations', action='store_true', default=False, help='Print totals for hierarchy and dependency violations once the HTML has been generated.')
     
     config.Configure(argv)
@@ -24,8 +24,28 @@ import time
 import sqlite3
 from collections import OrderedDict
 import json
+import hashlib
+import multiprocessing
+import threading
+
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+import ctypes
+import ctypes.util
+import errno
+import struct
+import select
 from utility import Logger
 from utility import toPosixPath
+import dependencymatrix
 import argparse
 import codecs
 
@@ -54,6 +74,15 @@ class DependencyScriptConfiguration(object):
         self.argparser.add_argument('-c', '--config-filename', dest='scriptIni', metavar='<config-filename>', help='Specifies the path to the configuration file to use.')
         self.argparser.add_argument('-f', '--database-filename', dest='databaseFilename', metavar='<db-filename>', help='Specifies the filename of the database. Note: specifying this option overrides the filename in the configuration file.')
         self.argparser.add_argument('-s', '--source-path', dest='sourcePath', metavar='<source-path>', help='Specifies the path to the root of the source code.')
+        self.argparser.add_argument('-i', '--incremental', action='store_true', default=False, dest='incremental', help='Update an existing database instead of rebuilding it. Only the files that were added or modified since the last scan are parsed, removed files are deleted from the database and the includes that could refer to added or removed files are resolved again. A full scan is done if the database doesn\'t exist or the project configuration has changed.')
+        self.argparser.add_argument('--hash', action='store_true', default=False, dest='hashContents', help='Record a hash of each file\'s contents. Incremental scans will then skip the files whose modification time changed but whose contents did not.')
+        self.argparser.add_argument('--fast-include-scan', action='store_true', default=False, dest='fastIncludeScan', help='Read the source files in large binary chunks and only run the #include regex on the lines that contain "#include". Produces the same results as the default line by line scan.')
+        self.argparser.add_argument('--include-scan-lines', type=int, default=None, dest='includeScanLines', metavar='<N>', help='Stop reading a file once N lines have passed since its last #include directive (or its start). Implies --fast-include-scan. Includes further down the file are missed!')
+        self.argparser.add_argument('--stop-at-declaration', action='store_true', default=False, dest='stopAtDeclaration', help='Stop reading a file at its first line that starts with an identifier outside of a comment, i.e. the first declaration. Implies --fast-include-scan. Includes further down the file are missed!')
+        self.argparser.add_argument('--batch-size', dest='batchSize', type=int, default=DependencyScriptDatabase.defaultBatchSize, metavar='<rows>', help='The number of rows that are collected in memory before they are inserted into the database in a single transaction. Default: %(default)s.')
+        self.argparser.add_argument('--pipeline', action='store_true', default=False, dest='pipeline', help='Scan using a pipeline of threads: a directory walker, a pool of file readers, a parser and a database writer connected by bounded queues. Overlaps the file reads with everything else which helps on slow, e.g. network mounted, file systems. The rows are written in the order the files are read in. Can\'t be combined with --jobs.')
+        self.argparser.add_argument('--read-threads', type=int, default=4, dest='readThreads', metavar='<N>', help='The number of file reader threads used by --pipeline. Default: %(default)s.')
+        self.argparser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1, metavar='<N>', help='Parse and resolve the source files using N worker processes. The results are written to the database by this process so the database is identical to the one generated with a single job.')
         
         # Configure the rest of our class. We need to initialize unused variables if we want to use
         # them later in our class.
@@ -112,7 +141,7 @@ class DependencyScriptConfiguration(object):
                 if self.isConfigured:
                     iniPath, iniFilename = os.path.split(self.scriptIni)
                     self.sourcePath = toPosixPath(os.path.normpath(os.path.join(iniPath, self.sourcePath)))
-                    print('source-path: {0}'.format(self.sourcePath))
+                    self.messagePrinter.info('source-path: {0}'.format(self.sourcePath))
         except:
             self.sourcePath = './'
         
@@ -174,6 +203,10 @@ class SolutionInfo(object):
     def __init__(self, config = None):
         self._jsonObjectHooks = { "ProjectGroupsList" : GroupInfo_JSONObjectHook }
         
+        # Project path lookups used by GetProjectName(), built on first use.
+        self.projectPathIndex = None
+        self.projectNameCache = None
+        
         if not config:
             self.path = None
             self.projectList = None
@@ -238,6 +271,9 @@ class SolutionInfo(object):
                 # Add the project to the dictionary
                 self.projectList[project.name] = project
         
+        self.projectPathIndex = None
+        self.projectNameCache = None
+        
     # filepath is either absolute or relative to the cwd.
     def GetPathRelativeToSolution(self, filepath):
         if not os.path.isabs(filepath):
@@ -264,45 +300,65 @@ class SolutionInfo(object):
         
         return None
     
+    # _BuildProjectPathIndex
+    #   Maps the normalised absolute path of each project to its name. When several projects share a
+    #   path the first one in the list wins.
+    def _BuildProjectPathIndex(self):
+        self.projectPathIndex = {}
+        self.projectNameCache = {}
+        
+        # Project paths are either absolute or relative to the solution path.
+        for project in self.projectList:
+            projectPath = self.projectList[project].path
+            if not os.path.isabs(projectPath):
+                projectPath = os.path.abspath(projectPath)
+            
+            projectPath = os.path.normpath(projectPath)
+            projectPath = toPosixPath(projectPath) # Standardise the slashes.
+            
+            if projectPath not in self.projectPathIndex:
+                self.projectPathIndex[projectPath] = project
+    
     # GetProjectName
     #   Computes the most likely project that the file belongs to on the basis of the file path
     #   given.
     #  
     #   filepath should be an absolute path, if it is not it is taken to be relative to the cwd.
+    #   
+    #   The project is the one with the longest path that is the file path itself or one of its
+    #   parent directories. The parent directories are looked up in the project path index and the
+    #   result is cached for each directory so that sibling files resolve with a single lookup.
     def GetProjectName(self, filepath):
         if not os.path.isabs(filepath):
             filepath = os.path.abspath(filepath)
 
         filepath = os.path.normpath(filepath)
         filepath = toPosixPath(filepath) # Standardise the slashes.
-        if filepath[-1] != '/': # Ensure that the path is slash terminated otherwise we might
-                                # end up including projects which start with the same name...
-            filepath += '/'
-            
+        
+        if self.projectPathIndex is None:
+            self._BuildProjectPathIndex()
+        
+        if filepath in self.projectPathIndex:
+            return self.projectPathIndex[filepath]
+        
+        dirpath = posixpath.dirname(filepath)
+        if dirpath in self.projectNameCache:
+            return self.projectNameCache[dirpath]
+        
         rv = None # Project name
-        rvLen = 0 # Lenght of the matched path
         
-        # Project paths are either absolute or relative to the solution path.
-        for project in self.projectList:
-            projectPath = self.projectList[project].path
-            if not os.path.isabs(projectPath):
-                projectPath = os.path.abspath(projectPath)
+        path = dirpath
+        while True:
+            if path in self.projectPathIndex:
+                rv = self.projectPathIndex[path]
+                break
             
-            projectPath = os.path.normpath(projectPath)
-            projectPath = toPosixPath(projectPath) # Standardise the slashes.
-            if projectPath[-1] != '/': # Ensure that the path is slash terminated otherwise we might
-                                       # end up including projects which start with the same name...
-                projectPath += '/'
-            
-            # Check all projects in the list and return the one with the longest matching path.
-            if filepath.startswith(projectPath):
-                if not rv:
-                    rv = project
-                    rvLen = len(projectPath)
-                else:
-                    if rvLen < len(projectPath):
-                        rv = project
-                        rvLen = len(projectPath)
+            parentPath = posixpath.dirname(path)
+            if parentPath == path:
+                break
+            path = parentPath
+        
+        self.projectNameCache[dirpath] = rv
         
         return rv
     
@@ -333,6 +389,12 @@ class SolutionInfo(object):
             
         return i
     
+    # Returns the list of the names of the projects that the project declares a dependency on.
+    def GetProjectDependencies(self, projectName):
+        if projectName in self.projectList and self.projectList[projectName].dependencies:
+            return self.projectList[projectName].dependencies
+        return []
+    
     def HasProjectDependency(self, projectName, projectDependency):
         if projectName in self.projectList:
             return (projectDependency in self.projectList[projectName].dependencies)
@@ -349,54 +411,271 @@ class SolutionInfo(object):
         return None
 
 class DependencyScriptDatabase(object):
-    def __init__(self, filename = None, errorLogger = None, messagePrinter = None):
-        self._projectDropCommand = """
-DROP TABLE IF EXISTS Project;
+    includeTypeLocal = "local"
+    includeTypeSystem = "system"
+    defaultBatchSize = 10000
+    
+    # Stored in the database's user_version. Databases with an older version are migrated when they
+    # are opened (see Migrate).
+    #   0: The original Project, CodeFile and IncludeDirective tables.
+    #   1: Secondary indexes for the dependency matrix and dependency tree queries.
+    #   2: Normalised tables keyed by integer ids. The original tables are views over them.
+    #   3: The ProjectDependency table of the include counts between each pair of projects.
+    #   4: The SolutionFileEntry table of all of the files of the solution.
+    schemaVersion = 4
+    
+    def __init__(self, filename = None, errorLogger = None, messagePrinter = None, batchSize = None):
+        # The schema is normalised: every solution path, project and distinct #include text is stored
+        # once and referred to by its integer id. The PathEntry table holds the paths of both the
+        # scanned files and the included files.
+        self._tableCreateCommands = [
 """
-
-        self._projectCreateCommand = """
-CREATE TABLE IF NOT EXISTS Project (
-    SolutionPath TEXT PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS ProjectEntry (
+    Id INTEGER PRIMARY KEY,
+    SolutionPath TEXT UNIQUE,
     Name TEXT,
     HierarchyLevel INTEGER
 );
+""",
 """
-    
-        self._codeFileDropCommand = """
-DROP TABLE IF EXISTS CodeFile;
-"""
-
-        self._codeFileCreateCommand = """
-CREATE TABLE IF NOT EXISTS CodeFile (
-    SolutionPath TEXT PRIMARY KEY,
-    Project TEXT,
+CREATE TABLE IF NOT EXISTS PathEntry (
+    Id INTEGER PRIMARY KEY,
+    SolutionPath TEXT,
     Filename TEXT
 );
+""",
 """
-
-        self._includeDirectiveDropCommand = """
-DROP TABLE IF EXISTS IncludeDirective;
+CREATE TABLE IF NOT EXISTS CodeFileEntry (
+    PathId INTEGER PRIMARY KEY,
+    ProjectId INTEGER
+);
+""",
 """
-
-        self._includeDirectiveCreateCommand = """
-CREATE TABLE IF NOT EXISTS IncludeDirective (
-    CodeFileSolutionPath TEXT,
-    IncludeText TEXT,
+CREATE TABLE IF NOT EXISTS IncludeTextEntry (
+    Id INTEGER PRIMARY KEY,
+    Text TEXT,
     IncludeType TEXT,
-    IncludeFilename TEXT,
-    IncludeProject TEXT,
-    IncludeSolutionPath TEXT,
+    Filename TEXT
+);
+""",
+"""
+CREATE TABLE IF NOT EXISTS IncludeDirectiveEntry (
+    CodeFileId INTEGER,
+    IncludeTextId INTEGER,
+    IncludeProjectId INTEGER,
+    IncludePathId INTEGER,
     LineNumber INTEGER
 );
+""",
+# The CodeFileStatEntry table records the state of each file when it was last parsed so that an
+# incremental scan can skip the files that haven't changed.
+"""
+CREATE TABLE IF NOT EXISTS CodeFileStatEntry (
+    PathId INTEGER PRIMARY KEY,
+    ModifiedTime REAL,
+    Size INTEGER,
+    ContentHash TEXT
+);
+""",
+# The ProjectDependencyEntry table holds the number of #include directives and the number of files
+# with which a project includes the files of another project (or of itself). It is maintained by
+# this class as rows are written (see UpdateProjectDependencies).
+"""
+CREATE TABLE IF NOT EXISTS ProjectDependencyEntry (
+    ProjectId INTEGER,
+    IncludeProjectId INTEGER,
+    IncludeCount INTEGER,
+    FileCount INTEGER,
+    PRIMARY KEY (ProjectId, IncludeProjectId)
+);
+""",
+# The SolutionFileEntry table lists every file that the last walk of the solution found, whether it
+# was scanned or not. Any of them can be the target of an #include directive so an incremental scan
+# resolves the directives that could refer to the files that were added or removed since again.
+"""
+CREATE TABLE IF NOT EXISTS SolutionFileEntry (
+    PathId INTEGER PRIMARY KEY
+);
+""",
+        ]
+        
+        # The views expose the tables and columns of the earlier schema versions.
+        self._viewCreateCommands = [
+"""
+CREATE VIEW IF NOT EXISTS Project AS
+SELECT SolutionPath, Name, HierarchyLevel
+FROM ProjectEntry;
+""",
 """
+CREATE VIEW IF NOT EXISTS CodeFile AS
+SELECT f.SolutionPath AS SolutionPath, p.Name AS Project, f.Filename AS Filename
+FROM CodeFileEntry c
+INNER JOIN PathEntry f ON f.Id = c.PathId
+LEFT JOIN ProjectEntry p ON p.Id = c.ProjectId;
+""",
+"""
+CREATE VIEW IF NOT EXISTS IncludeDirective AS
+SELECT f.SolutionPath AS CodeFileSolutionPath,
+       t.Text AS IncludeText,
+       t.IncludeType AS IncludeType,
+       t.Filename AS IncludeFilename,
+       p.Name AS IncludeProject,
+       ip.SolutionPath AS IncludeSolutionPath,
+       i.LineNumber AS LineNumber
+FROM IncludeDirectiveEntry i
+INNER JOIN PathEntry f ON f.Id = i.CodeFileId
+INNER JOIN IncludeTextEntry t ON t.Id = i.IncludeTextId
+LEFT JOIN ProjectEntry p ON p.Id = i.IncludeProjectId
+LEFT JOIN PathEntry ip ON ip.Id = i.IncludePathId;
+""",
+"""
+CREATE VIEW IF NOT EXISTS CodeFileStat AS
+SELECT f.SolutionPath AS SolutionPath, s.ModifiedTime AS ModifiedTime, s.Size AS Size, s.ContentHash AS ContentHash
+FROM CodeFileStatEntry s
+INNER JOIN PathEntry f ON f.Id = s.PathId;
+""",
+"""
+CREATE VIEW IF NOT EXISTS ProjectDependency AS
+SELECT p.Name AS Project, ip.Name AS IncludeProject, d.IncludeCount AS IncludeCount, d.FileCount AS FileCount
+FROM ProjectDependencyEntry d
+INNER JOIN ProjectEntry p ON p.Id = d.ProjectId
+INNER JOIN ProjectEntry ip ON ip.Id = d.IncludeProjectId;
+""",
+        ]
+        
+        # Every table and view of this and the earlier schema versions, see Drop.
+        self._schemaObjectNames = ["Project", "CodeFile", "IncludeDirective", "CodeFileStat", "ProjectEntry", "PathEntry", "CodeFileEntry", "IncludeTextEntry", "IncludeDirectiveEntry", "CodeFileStatEntry", "ProjectDependency", "ProjectDependencyEntry", "SolutionFileEntry"]
+        
+        # Secondary indexes. These are created after the tables have been populated when bulk loading
+        # (see BeginBulkLoad and EndBulkLoad) as that is much faster than updating them on every row.
+        # The uniqueness of the paths and #include texts is guaranteed by the ids being handed out by
+        # this class (see _GetPathId and _GetIncludeTextId).
+        self._indexCreateCommands = [
+"""
+CREATE UNIQUE INDEX IF NOT EXISTS PathEntry_SolutionPath ON PathEntry (SolutionPath);
+""",
+"""
+CREATE UNIQUE INDEX IF NOT EXISTS IncludeTextEntry_Text ON IncludeTextEntry (Text, IncludeType);
+""",
+"""
+CREATE INDEX IF NOT EXISTS IncludeTextEntry_Filename ON IncludeTextEntry (Filename);
+""",
+"""
+CREATE INDEX IF NOT EXISTS IncludeDirectiveEntry_CodeFileId ON IncludeDirectiveEntry (CodeFileId);
+""",
+"""
+CREATE INDEX IF NOT EXISTS IncludeDirectiveEntry_IncludeProjectId ON IncludeDirectiveEntry (IncludeProjectId, CodeFileId);
+""",
+"""
+CREATE INDEX IF NOT EXISTS IncludeDirectiveEntry_IncludeTextId ON IncludeDirectiveEntry (IncludeTextId);
+""",
+"""
+CREATE INDEX IF NOT EXISTS CodeFileEntry_ProjectId ON CodeFileEntry (ProjectId, PathId);
+""",
+"""
+CREATE INDEX IF NOT EXISTS ProjectEntry_Name ON ProjectEntry (Name, HierarchyLevel);
+""",
+"""
+CREATE INDEX IF NOT EXISTS ProjectEntry_HierarchyLevel ON ProjectEntry (HierarchyLevel ASC, Name DESC);
+""",
+        ]
+        
+        # Copies the tables of schema version 0 and 1 into the normalised tables, see Migrate.
+        self._migrateToVersion2Commands = [
+"""
+INSERT INTO ProjectEntry (SolutionPath, Name, HierarchyLevel)
+SELECT SolutionPath, Name, HierarchyLevel FROM Project ORDER BY rowid;
+""",
+"""
+INSERT INTO PathEntry (SolutionPath, Filename)
+SELECT SolutionPath, PosixBasename(SolutionPath) FROM (
+    SELECT SolutionPath FROM CodeFile
+    UNION SELECT CodeFileSolutionPath FROM IncludeDirective
+    UNION SELECT IncludeSolutionPath FROM IncludeDirective WHERE IncludeSolutionPath IS NOT NULL
+);
+""",
+"""
+INSERT INTO CodeFileEntry (PathId, ProjectId)
+SELECT f.Id, p.Id
+FROM CodeFile c
+INNER JOIN PathEntry f ON f.SolutionPath = c.SolutionPath
+LEFT JOIN ProjectEntry p ON p.Name = c.Project;
+""",
+"""
+INSERT INTO IncludeTextEntry (Text, IncludeType, Filename)
+SELECT IncludeText, IncludeType, MIN(IncludeFilename) FROM IncludeDirective GROUP BY IncludeText, IncludeType;
+""",
+"""
+INSERT INTO IncludeDirectiveEntry (CodeFileId, IncludeTextId, IncludeProjectId, IncludePathId, LineNumber)
+SELECT f.Id, t.Id, p.Id, ip.Id, i.LineNumber
+FROM IncludeDirective i
+INNER JOIN PathEntry f ON f.SolutionPath = i.CodeFileSolutionPath
+INNER JOIN IncludeTextEntry t ON t.Text = i.IncludeText AND t.IncludeType = i.IncludeType
+LEFT JOIN ProjectEntry p ON p.Name = i.IncludeProject
+LEFT JOIN PathEntry ip ON ip.SolutionPath = i.IncludeSolutionPath
+ORDER BY i.rowid;
+""",
+        ]
+        
+        # Recomputes the ProjectDependencyEntry rows of the projects whose ids are formatted in.
+        self._projectDependencyUpdateCommands = [
+"""
+DELETE FROM ProjectDependencyEntry WHERE ProjectId IN ({0});
+""",
+"""
+INSERT INTO ProjectDependencyEntry (ProjectId, IncludeProjectId, IncludeCount, FileCount)
+SELECT c.ProjectId, i.IncludeProjectId, COUNT(*), COUNT(DISTINCT c.PathId)
+FROM CodeFileEntry c
+INNER JOIN IncludeDirectiveEntry i ON i.CodeFileId = c.PathId
+WHERE c.ProjectId IN ({0}) AND i.IncludeProjectId IS NOT NULL
+GROUP BY c.ProjectId, i.IncludeProjectId;
+""",
+        ]
+        
+        self._migrateFileStatsToVersion2Command = """
+INSERT INTO CodeFileStatEntry (PathId, ModifiedTime, Size, ContentHash)
+SELECT f.Id, s.ModifiedTime, s.Size, s.ContentHash
+FROM CodeFileStat s
+INNER JOIN PathEntry f ON f.SolutionPath = s.SolutionPath;
+"""
+        
+        # SQLite settings used while bulk loading the tables of a full scan, which drops them first.
+        # Durability doesn't matter as a failed full scan is simply started again. An incremental
+        # update keeps the existing data so it never bulk loads, see PopulateDatabase.
+        self._bulkLoadPragmas = [
+            "PRAGMA journal_mode = MEMORY;",
+            "PRAGMA synchronous = OFF;",
+            "PRAGMA cache_size = -262144;", # 256MB
+            "PRAGMA temp_store = MEMORY;",
+            "PRAGMA mmap_size = 268435456;",
+        ]
+        
+        # SQLite settings for readers and incremental updates. These are the SQLite defaults.
+        self._durablePragmas = [
+            "PRAGMA journal_mode = DELETE;",
+            "PRAGMA synchronous = FULL;",
+            "PRAGMA cache_size = -2000;",
+            "PRAGMA temp_store = DEFAULT;",
+            "PRAGMA mmap_size = 0;",
+        ]
 
         self.filename = filename
         self.isOpen = False
-        self.includeTypeLocal = "local"
-        self.includeTypeSystem = "system"
+        self.isBulkLoading = False
         self.errorLogger = errorLogger
         self.messagePrinter = messagePrinter
         
+        # Rows added by AddFile(), AddInclude() and AddFileStat() are buffered and inserted in bulk
+        # once batchSize rows have been collected (see Flush).
+        self.batchSize = batchSize
+        if self.batchSize is None:
+            self.batchSize = self.defaultBatchSize
+        self._ClearBuffers()
+        self._ClearIds()
+        
+        # The ids of the projects whose ProjectDependencyEntry rows are out of date.
+        self._dirtyProjectIds = set()
+        
     def DeleteFile(self, filename = None):
         if filename and filename != self.filename:
             self.filename = filename
@@ -414,7 +693,10 @@ CREATE TABLE IF NOT EXISTS IncludeDirective (
                 self.messagePrinter.info("Removing: " + str(self.dirPath))
             os.rmdir(self.dirPath)
         
-    def Open(self, filename = None):
+    # Open
+    #   Opens the database. If bulkLoad is True the database is switched into bulk-load mode (see
+    #   BeginBulkLoad) which must be ended with EndBulkLoad once the data has been loaded.
+    def Open(self, filename = None, bulkLoad = False):
         if filename and filename != self.filename:
             if self.isOpen:
                 self.Abort()
@@ -433,141 +715,642 @@ CREATE TABLE IF NOT EXISTS IncludeDirective (
                 os.mkdir(dbPath)
                 self.dirPath = dbPath
             
-            self.con = sqlite3.connect(self.filename)
+            # A pipelined scan writes from its own thread. The connection is still only ever used by
+            # one thread at a time.
+            self.con = sqlite3.connect(self.filename, check_same_thread = False)
             self.cur = self.con.cursor()
             
             self.isOpen = True
+            self.isBulkLoading = False
+            self._ClearIds()
             if self.messagePrinter:
                 self.messagePrinter.info("Database opened.")
+        
+        if bulkLoad and self.isOpen and not self.isBulkLoading:
+            self.BeginBulkLoad()
+        elif not bulkLoad and self.isOpen:
+            self.Migrate()
             
         return self.isOpen
-
+    
+    def GetSchemaVersion(self):
+        self.cur.execute("PRAGMA user_version;")
+        return self.cur.fetchone()[0]
+    
+    # Migrate
+    #   Brings a database that was generated by an older version of this script up to the current
+    #   schemaVersion. Empty databases are left alone, they get the current schema from Create().
+    #   
+    #   The migration is done in a single transaction. It fails on a read-only database in which case
+    #   the database has to be generated again.
+    def Migrate(self):
+        version = self.GetSchemaVersion()
+        if version >= self.schemaVersion or not self.HasTable("IncludeDirective"):
+            return
+        
+        if self.messagePrinter:
+            self.messagePrinter.info("Migrating database from schema version {0} to {1}.".format(version, self.schemaVersion))
+        
+        self.Flush()
+        self.con.commit()
+        
+        # The sqlite3 module commits implicitly before schema changes, take control of the
+        # transaction so that a failed migration leaves the database as it was.
+        isolationLevel = self.con.isolation_level
+        self.con.isolation_level = None
+        try:
+            self.cur.execute("BEGIN;")
+            try:
+                if version < 2:
+                    self._MigrateToVersion2()
+                if version < 3:
+                    self._MigrateToVersion3()
+                if version < 4:
+                    self._MigrateToVersion4()
+                for command in self._indexCreateCommands:
+                    self.cur.execute(command)
+                self.cur.execute("PRAGMA user_version = {0};".format(self.schemaVersion))
+                self.cur.execute("COMMIT;")
+            except sqlite3.Error as e:
+                self.cur.execute("ROLLBACK;")
+                if self.messagePrinter:
+                    self.messagePrinter.error("Failed to migrate the database: {0}".format(e))
+                return
+            
+            # Give the space of the dropped tables back.
+            if version < 2:
+                self.cur.execute("VACUUM;")
+        finally:
+            self.con.isolation_level = isolationLevel
+    
+    # _MigrateToVersion2
+    #   Moves the rows of the original tables into the normalised tables and replaces the original
+    #   tables with the views of the same name.
+    def _MigrateToVersion2(self):
+        self.con.create_function("PosixBasename", 1, posixpath.basename)
+        
+        hasFileStats = self.HasTable("CodeFileStat")
+        
+        for command in self._tableCreateCommands:
+            self.cur.execute(command)
+        for command in self._indexCreateCommands:
+            self.cur.execute(command)
+        for command in self._migrateToVersion2Commands:
+            self.cur.execute(command)
+        if hasFileStats:
+            self.cur.execute(self._migrateFileStatsToVersion2Command)
+        
+        for name in ["Project", "CodeFile", "IncludeDirective", "CodeFileStat"]:
+            self.cur.execute("DROP TABLE IF EXISTS {0};".format(name))
+        for command in self._viewCreateCommands:
+            self.cur.execute(command)
+    
+    # _MigrateToVersion3
+    #   Adds the ProjectDependencyEntry table and computes it for all of the projects.
+    def _MigrateToVersion3(self):
+        for command in self._tableCreateCommands:
+            self.cur.execute(command)
+        for command in self._viewCreateCommands:
+            self.cur.execute(command)
+        
+        self.cur.execute("SELECT Id FROM ProjectEntry")
+        self._UpdateProjectDependencies([row[0] for row in self.cur.fetchall()])
+    
+    # _MigrateToVersion4
+    #   Adds the empty SolutionFileEntry table. The next incremental scan then takes all of the files
+    #   of the solution for added ones and resolves all of the #include directives again.
+    def _MigrateToVersion4(self):
+        for command in self._tableCreateCommands:
+            self.cur.execute(command)
+    
+    # BeginBulkLoad
+    #   Trades durability for loading speed and defers the creation of the secondary indexes, of the
+    #   tables created by Create(), until EndBulkLoad is called.
+    def BeginBulkLoad(self):
+        self.con.commit()
+        for pragma in self._bulkLoadPragmas:
+            self.cur.execute(pragma)
+        self.isBulkLoading = True
+        
+        if self.messagePrinter:
+            self.messagePrinter.info("Database bulk load started.")
+    
+    # EndBulkLoad
+    #   Builds the secondary indexes and restores the durable settings for the readers.
+    def EndBulkLoad(self):
+        if not self.isBulkLoading:
+            return
+        
+        self.Flush()
+        self.con.commit()
+        self.CreateIndexes()
+        self.UpdateProjectDependencies()
+        for pragma in self._durablePragmas:
+            self.cur.execute(pragma)
+        self.isBulkLoading = False
+        
+        if self.messagePrinter:
+            self.messagePrinter.info("Database bulk load finished.")
+    
+    # CreateIndexes
+    #   Creates the secondary indexes. This is the last step of creating the schema so it also marks
+    #   the database with the current schemaVersion.
+    def CreateIndexes(self):
+        for command in self._indexCreateCommands:
+            self.cur.execute(command)
+        self.cur.execute("PRAGMA user_version = {0};".format(self.schemaVersion))
+        self.con.commit()
+    
+    # Drop
+    #   Drops the tables and views of this and of the earlier schema versions.
     def Drop(self):
-        self.cur.execute(self._projectDropCommand)
-        self.cur.execute(self._codeFileDropCommand)
-        self.cur.execute(self._includeDirectiveDropCommand)
+        self._ClearBuffers()
+        self._ClearIds()
+        self._dirtyProjectIds = set()
+        for name in self._schemaObjectNames:
+            self.cur.execute("SELECT type FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')", (name,))
+            row = self.cur.fetchone()
+            if row:
+                self.cur.execute("DROP {0} {1};".format(row[0].upper(), name))
+        self.cur.execute("PRAGMA user_version = 0;")
         self.con.commit()
         
+    # Create
+    #   Creates the tables and views that don't exist yet. An empty database is marked with the
+    #   current schemaVersion right away so that it's never taken for an unversioned one, even if it
+    #   isn't populated completely.
     def Create(self):
-        self.cur.execute(self._projectCreateCommand)
-        self.cur.execute(self._codeFileCreateCommand)
-        self.cur.execute(self._includeDirectiveCreateCommand)
+        isEmpty = not self.HasTable("IncludeDirective")
+        for command in self._tableCreateCommands:
+            self.cur.execute(command)
+        for command in self._viewCreateCommands:
+            self.cur.execute(command)
+        if isEmpty:
+            self.cur.execute("PRAGMA user_version = {0};".format(self.schemaVersion))
         self.con.commit()
         
+        if not self.isBulkLoading:
+            self.CreateIndexes()
+        
+    # Abort
+    #   Rolls back the uncommitted changes. A bulk load is ended without loading any more data, the
+    #   rows it has committed so far are kept.
     def Abort(self):
+        self._ClearBuffers()
+        self._ClearIds()
+        self._dirtyProjectIds = set()
         if self.isOpen:
             self.con.rollback()
             if self.messagePrinter:
                 self.messagePrinter.info("Database rolled back.")
+            
+            if self.isBulkLoading:
+                if self.GetSchemaVersion() == self.schemaVersion:
+                    self.CreateIndexes()
+                for pragma in self._durablePragmas:
+                    self.cur.execute(pragma)
+                self.isBulkLoading = False
         
     def SaveProgress(self):
         if self.isOpen:
+            self.Flush()
             self.con.commit()
         
     def Close(self):
         if self.isOpen:
+            if not self.isBulkLoading:
+                self.UpdateProjectDependencies()
+            self.Flush()
             self.con.commit()
             self.con.close()
             self.isOpen = False
             self.con = None
             self.cur = None
+            self._ClearIds()
             if self.messagePrinter:
                 self.messagePrinter.info("Database closed.")
         
     def SetFilename(self, filename):
         self.filename = filename
+    
+    def _ClearBuffers(self):
+        self._removedIncludeRows = []
+        self._pathRows = []
+        self._includeTextRows = []
+        self._fileRows = []
+        self._includeRows = []
+        self._fileStatRows = []
+        self._bufferedRowCount = 0
+    
+    def _BufferRow(self, rowList, row):
+        rowList.append(row)
+        self._bufferedRowCount += 1
+        if self._bufferedRowCount >= self.batchSize:
+            self.Flush()
+    
+    # _ClearIds
+    #   Forgets the ids of the paths, projects and #include texts. They are loaded from the database
+    #   again when they are next needed (see _LoadIds).
+    def _ClearIds(self):
+        self._pathIds = None
+        self._projectIds = None
+        self._includeTextIds = None
+    
+    # _LoadIds
+    #   Loads the ids of the paths, projects and #include texts that are already in the database. New
+    #   ids are handed out by this class so that the rows that refer to them can be buffered too.
+    def _LoadIds(self):
+        self.Flush()
+        
+        self.cur.execute("SELECT SolutionPath, Id FROM PathEntry")
+        self._pathIds = dict(self.cur.fetchall())
+        self.cur.execute("SELECT Name, Id FROM ProjectEntry")
+        self._projectIds = dict(self.cur.fetchall())
+        self.cur.execute("SELECT Text, IncludeType, Id FROM IncludeTextEntry")
+        self._includeTextIds = dict([((row[0], row[1]), row[2]) for row in self.cur.fetchall()])
+        
+        self.cur.execute("SELECT MAX(Id) FROM PathEntry")
+        self._nextPathId = (self.cur.fetchone()[0] or 0) + 1
+        self.cur.execute("SELECT MAX(Id) FROM IncludeTextEntry")
+        self._nextIncludeTextId = (self.cur.fetchone()[0] or 0) + 1
+    
+    # _GetPathId
+    #   Returns the id of a posix solution path, a new path is added to the PathEntry table.
+    def _GetPathId(self, solutionPath):
+        if self._pathIds is None:
+            self._LoadIds()
+        
+        pathId = self._pathIds.get(solutionPath)
+        if pathId is None:
+            pathId = self._nextPathId
+            self._nextPathId += 1
+            self._pathIds[solutionPath] = pathId
+            self._BufferRow(self._pathRows, (pathId, solutionPath, posixpath.basename(solutionPath)))
+        
+        return pathId
+    
+    def _GetProjectId(self, projectName):
+        if projectName is None:
+            return None
+        if self._projectIds is None:
+            self._LoadIds()
+        
+        return self._projectIds[projectName]
+    
+    # _GetIncludeTextId
+    #   Returns the id of an #include text of the given type, a new text is added to the
+    #   IncludeTextEntry table.
+    def _GetIncludeTextId(self, includeText, includeType, includeFilename):
+        if self._includeTextIds is None:
+            self._LoadIds()
+        
+        key = (includeText, includeType)
+        includeTextId = self._includeTextIds.get(key)
+        if includeTextId is None:
+            includeTextId = self._nextIncludeTextId
+            self._nextIncludeTextId += 1
+            self._includeTextIds[key] = includeTextId
+            self._BufferRow(self._includeTextRows, (includeTextId, includeText, includeType, includeFilename))
+        
+        return includeTextId
+    
+    # Flush
+    #   Inserts all the buffered rows with one executemany() per table inside a single transaction.
+    #   Every method that reads, updates or deletes rows flushes first so the buffering is never
+    #   visible. The buffered removals of #include directives (see RemoveIncludes) are done before
+    #   the inserts.
+    def Flush(self):
+        if self._bufferedRowCount == 0 or not self.isOpen:
+            return
+        
+        removedIncludeRows, pathRows, includeTextRows = self._removedIncludeRows, self._pathRows, self._includeTextRows
+        fileRows, includeRows, fileStatRows = self._fileRows, self._includeRows, self._fileStatRows
+        self._ClearBuffers()
+        
+        self.cur.executemany("DELETE FROM IncludeDirectiveEntry WHERE CodeFileId = ?", removedIncludeRows)
+        self.cur.executemany("INSERT INTO PathEntry (Id, SolutionPath, Filename) VALUES (?, ?, ?);", pathRows)
+        self.cur.executemany("INSERT INTO IncludeTextEntry (Id, Text, IncludeType, Filename) VALUES (?, ?, ?, ?);", includeTextRows)
+        self.cur.executemany("INSERT OR REPLACE INTO CodeFileEntry (PathId, ProjectId) VALUES (?, ?);", fileRows)
+        self.cur.executemany("INSERT OR REPLACE INTO CodeFileStatEntry (PathId, ModifiedTime, Size, ContentHash) VALUES (?, ?, ?, ?);", fileStatRows)
+        
+        # The rows are all integers and the table has no constraints, an error here is a failure of
+        # the database itself. executemany() isn't atomic so retrying the rows would insert the ones
+        # before the error twice.
+        self.cur.executemany("INSERT INTO IncludeDirectiveEntry (CodeFileId, IncludeTextId, IncludeProjectId, IncludePathId, LineNumber) VALUES (?, ?, ?, ?, ?);", includeRows)
+        
+        self.con.commit()
 
     def GetFile(self, solutionPath):
+        self.Flush()
         self.cur.execute("SELECT * FROM CodeFile WHERE SolutionPath = ?", (solutionPath,))
         return self.cur.fetchone()
     
     def GetFilesEndingWith(self, incompletePath):
+        self.Flush()
         self.cur.execute("SELECT * FROM CodeFile WHERE SolutionPath like ?", ('%' + incompletePath,))
         return self.cur.fetchall()
         
+    # Returns the id of the new project or None if another project has the same path.
     def AddProject(self, projectName, solutionPath, hierarchyLevel):
         solutionPath = toPosixPath(solutionPath) # normpath doesn't normalize to posix slashes.
         
         try:
-            self.cur.execute("INSERT INTO Project (SolutionPath, Name, HierarchyLevel) VALUES (?, ?, ?);", (solutionPath, projectName, hierarchyLevel))
-        except:
-            self.cur.execute("UPDATE CodeFile SET Name = ?, HierarchyLevel = ? WHERE SolutionPath = ?;", (projectName, hierarchyLevel, solutionPath))
+            self.cur.execute("INSERT INTO ProjectEntry (SolutionPath, Name, HierarchyLevel) VALUES (?, ?, ?);", (solutionPath, projectName, hierarchyLevel))
+            projectId = self.cur.lastrowid
+        except sqlite3.IntegrityError:
+            return None
         
-        return self.cur.lastrowid
+        if self._projectIds is not None:
+            self._projectIds[projectName] = projectId
+        
+        return projectId
         
     def AddFile(self, filename, project, solutionPath, exists):
         solutionPath = toPosixPath(solutionPath) # normpath doesn't normalize to posix slashes.
         
-        try:
-            self.cur.execute("INSERT INTO CodeFile (SolutionPath, Project, Filename) VALUES (?, ?, ?);", (solutionPath, project, filename))
-        except:
-            self.cur.execute("UPDATE CodeFile SET Project = ?, Filename = ? WHERE SolutionPath = ?;", (project, filename, solutionPath))
-        
-        return self.cur.lastrowid
+        # Look up the ids first, handing out a new id can flush the buffers.
+        fileRow = (self._GetPathId(solutionPath), self._GetProjectId(project))
+        self._BufferRow(self._fileRows, fileRow)
+        if fileRow[1] is not None:
+            self._dirtyProjectIds.add(fileRow[1])
 
     def AddInclude(self, solutionPath, includeText, includeType, includeFilename, includeProject, includeSolutionPath, lineNumber):
         solutionPath = toPosixPath(solutionPath) # normpath doesn't normalize to posix slashes.
         normIncludeText = toPosixPath(includeText) # normpath doesn't normalize to posix slashes.
+        includePathId = None
         if includeSolutionPath:
             includeSolutionPath = toPosixPath(includeSolutionPath) # normpath doesn't normalize to posix slashes
+            includePathId = self._GetPathId(includeSolutionPath)
         
         if normIncludeText != includeText:
             if self.errorLogger:
                 self.errorLogger.write("Error, #include directive with non-posix path!" + includeText + " included in " + solutionPath + "\n")
             includeText = normIncludeText
         
-        try:
-            self.cur.execute("INSERT INTO IncludeDirective (CodeFileSolutionPath, IncludeText, IncludeType, IncludeFilename, IncludeProject, IncludeSolutionPath, LineNumber) VALUES (?, ?, ?, ?, ?, ?, ?);", (solutionPath, includeText, includeType, includeFilename, includeProject, includeSolutionPath, lineNumber))
-        except:
-            if self.messagePrinter:
-                msg = "Unknown exception for: INSERT INTO IncludeDirective (CodeFileSolutionPath, IncludeText, IncludeType, IncludeFilename, IncludeProject, IncludeSolutionPath) VALUES (" + repr(solutionPath) + "," + repr(includeText) + "," + repr(includeType) + "," + repr(includeFilename) + "," + repr(includeProject) + "," + repr(includeSolutionPath) + "," + repr(lineNumber) + ");"
-                self.messagePrinter.info(msg)
+        includeRow = (self._GetPathId(solutionPath), self._GetIncludeTextId(includeText, includeType, includeFilename), self._GetProjectId(includeProject), includePathId, lineNumber)
+        self._BufferRow(self._includeRows, includeRow)
+    
+    # HasTable
+    #   Returns True if the database already contains a table or a view with the given name.
+    def HasTable(self, tableName):
+        self.cur.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (tableName,))
+        return self.cur.fetchone() is not None
+    
+    # Returns a list of (SolutionPath, Name, HierarchyLevel) tuples for all the projects.
+    def GetProjects(self):
+        self.Flush()
         
-        return self.cur.lastrowid
+        self.cur.execute("SELECT SolutionPath, Name, HierarchyLevel FROM Project ORDER BY HierarchyLevel ASC")
+        return self.cur.fetchall()
+    
+    def AddFileStat(self, solutionPath, modifiedTime, size, contentHash = None):
+        solutionPath = toPosixPath(solutionPath) # normpath doesn't normalize to posix slashes.
+        
+        fileStatRow = (self._GetPathId(solutionPath), modifiedTime, size, contentHash)
+        self._BufferRow(self._fileStatRows, fileStatRow)
+    
+    # Returns a dictionary of the file solution paths mapped to their (ModifiedTime, Size, ContentHash)
+    # tuples.
+    def GetFileStats(self):
+        self.Flush()
+        
+        fileStats = {}
+        
+        self.cur.execute("SELECT SolutionPath, ModifiedTime, Size, ContentHash FROM CodeFileStat")
+        
+        row = self.cur.fetchone()
+        while row:
+            fileStats[row[0]] = (row[1], row[2], row[3])
+            row = self.cur.fetchone()
+        
+        return fileStats
+    
+    # RemoveIncludes
+    #   Removes the #include directives that were found in the file. The removal is buffered like the
+    #   inserts, it is done before any of the buffered #include directives are added.
+    def RemoveIncludes(self, solutionPath):
+        removedIncludeRow = (self._GetPathId(toPosixPath(solutionPath)),)
+        self._MarkProjectOfFileDirty(removedIncludeRow[0])
+        self._BufferRow(self._removedIncludeRows, removedIncludeRow)
+    
+    # RemoveFile
+    #   Removes the file, its #include directives and its recorded file state. The path itself is
+    #   kept as other files may still include it.
+    def RemoveFile(self, solutionPath):
+        self.Flush()
+        
+        solutionPath = toPosixPath(solutionPath) # normpath doesn't normalize to posix slashes.
+        pathId = self._GetPathId(solutionPath)
+        self._MarkProjectOfFileDirty(pathId)
+        
+        self.cur.execute("DELETE FROM IncludeDirectiveEntry WHERE CodeFileId = ?", (pathId,))
+        self.cur.execute("DELETE FROM CodeFileEntry WHERE PathId = ?", (pathId,))
+        self.cur.execute("DELETE FROM CodeFileStatEntry WHERE PathId = ?", (pathId,))
+    
+    # Returns the set of the solution paths in the SolutionFileEntry table.
+    def GetSolutionFiles(self):
+        self.Flush()
+        
+        self.cur.execute("SELECT f.SolutionPath FROM SolutionFileEntry s INNER JOIN PathEntry f ON f.Id = s.PathId")
+        return set([row[0] for row in self.cur.fetchall()])
+    
+    def AddSolutionFiles(self, solutionPaths):
+        pathIdRows = [(self._GetPathId(toPosixPath(solutionPath)),) for solutionPath in solutionPaths]
+        self.Flush()
+        self.cur.executemany("INSERT OR IGNORE INTO SolutionFileEntry (PathId) VALUES (?);", pathIdRows)
+    
+    def RemoveSolutionFiles(self, solutionPaths):
+        pathIdRows = [(self._GetPathId(toPosixPath(solutionPath)),) for solutionPath in solutionPaths]
+        self.Flush()
+        self.cur.executemany("DELETE FROM SolutionFileEntry WHERE PathId = ?;", pathIdRows)
+    
+    # Returns a list of (rowid, CodeFileSolutionPath, IncludeText, IncludeType, LineNumber) tuples for
+    # all of the #include directives whose included filename is in the given list.
+    def GetIncludesOfFilenames(self, includeFilenames):
+        self.Flush()
+        
+        rv = []
+        
+        # Keep well below SQLite's limit on the number of host parameters.
+        includeFilenames = list(includeFilenames)
+        for i in xrange(0, len(includeFilenames), 500):
+            chunk = includeFilenames[i:i + 500]
+            self.cur.execute("""
+                SELECT i.rowid, f.SolutionPath, t.Text, t.IncludeType, i.LineNumber
+                FROM IncludeTextEntry t
+                INNER JOIN IncludeDirectiveEntry i ON i.IncludeTextId = t.Id
+                INNER JOIN PathEntry f ON f.Id = i.CodeFileId
+                WHERE t.Filename IN ({0})
+                """.format(", ".join(["?"] * len(chunk))), chunk)
+            rv.extend(self.cur.fetchall())
+        
+        return rv
+    
+    def UpdateIncludeResolution(self, includeRowId, includeProject, includeSolutionPath):
+        self.Flush()
+        
+        includePathId = None
+        if includeSolutionPath:
+            includeSolutionPath = toPosixPath(includeSolutionPath) # normpath doesn't normalize to posix slashes
+            includePathId = self._GetPathId(includeSolutionPath)
+        
+        self.cur.execute("UPDATE IncludeDirectiveEntry SET IncludeProjectId = ?, IncludePathId = ? WHERE rowid = ?;", (self._GetProjectId(includeProject), includePathId, includeRowId))
+        
+        self.cur.execute("SELECT CodeFileId FROM IncludeDirectiveEntry WHERE rowid = ?", (includeRowId,))
+        row = self.cur.fetchone()
+        if row:
+            self._MarkProjectOfFileDirty(row[0])
+    
+    # _MarkProjectOfFileDirty
+    #   Marks the ProjectDependencyEntry rows of the file's project as out of date. A file that was
+    #   added since the last flush has already marked its project in AddFile.
+    def _MarkProjectOfFileDirty(self, pathId):
+        self.cur.execute("SELECT ProjectId FROM CodeFileEntry WHERE PathId = ?", (pathId,))
+        row = self.cur.fetchone()
+        if row and row[0] is not None:
+            self._dirtyProjectIds.add(row[0])
+    
+    # UpdateProjectDependencies
+    #   Recomputes the ProjectDependencyEntry rows of the projects whose files have been added,
+    #   removed or had their #include directives changed since the last update. This is done when the
+    #   bulk load ends and when the database is closed.
+    def UpdateProjectDependencies(self):
+        if not self._dirtyProjectIds:
+            return
+        
+        self.Flush()
+        
+        self._UpdateProjectDependencies(self._dirtyProjectIds)
+        self._dirtyProjectIds = set()
+        self.con.commit()
+    
+    def _UpdateProjectDependencies(self, projectIds):
+        # Keep well below SQLite's limit on the number of host parameters.
+        projectIds = list(projectIds)
+        for i in xrange(0, len(projectIds), 500):
+            chunk = projectIds[i:i + 500]
+            for command in self._projectDependencyUpdateCommands:
+                self.cur.execute(command.format(", ".join(["?"] * len(chunk))), chunk)
+    
+    # Returns a list of (Project, IncludeProject, IncludeCount, FileCount) tuples, one for each pair of
+    # projects where the first project includes files of the second (including itself).
+    def GetProjectDependencies(self):
+        self.UpdateProjectDependencies()
+        
+        self.cur.execute("SELECT Project, IncludeProject, IncludeCount, FileCount FROM ProjectDependency")
+        return self.cur.fetchall()
+    
+    # Returns a list of (CodeFileSolutionPath, LineNumber, IncludeText, IncludeType) tuples for the
+    # #include directives with which the files of a project include the files of another project,
+    # sorted by path and in the order they appear in the files.
+    def GetProjectIncludeDirectives(self, projectName, includeProjectName):
+        self.Flush()
+        
+        self.cur.execute("""
+            SELECT f.SolutionPath, i.LineNumber, t.Text, t.IncludeType
+            FROM CodeFileEntry c
+            INNER JOIN ProjectEntry p ON p.Id = c.ProjectId
+            INNER JOIN PathEntry f ON f.Id = c.PathId
+            INNER JOIN IncludeDirectiveEntry i ON i.CodeFileId = c.PathId
+            INNER JOIN ProjectEntry ip ON ip.Id = i.IncludeProjectId
+            INNER JOIN IncludeTextEntry t ON t.Id = i.IncludeTextId
+            WHERE p.Name = ? AND ip.Name = ?
+            ORDER BY f.SolutionPath ASC, i.rowid ASC
+            """, (projectName, includeProjectName))
+        return self.cur.fetchall()
+    
+    # GetFileIncludeGraph
+    #   Returns the graph of the files that include other files as a list of the path ids of the
+    #   files and the lists of the indices (into the first list) of the files that each of them
+    #   includes, see the dependencygraph module. Only the #include directives that were resolved to
+    #   a file are in the graph.
+    def GetFileIncludeGraph(self):
+        self.Flush()
+        
+        pathIds = []
+        pathIndices = {}
+        adjacency = []
+        
+        self.cur.execute("SELECT DISTINCT CodeFileId, IncludePathId FROM IncludeDirectiveEntry WHERE IncludePathId IS NOT NULL")
+        for codeFileId, includePathId in self.cur:
+            for pathId in (codeFileId, includePathId):
+                if pathId not in pathIndices:
+                    pathIndices[pathId] = len(pathIds)
+                    pathIds.append(pathId)
+                    adjacency.append([])
+            adjacency[pathIndices[codeFileId]].append(pathIndices[includePathId])
+        
+        return (pathIds, adjacency)
+    
+    # Returns a list of (CodeFileId, IncludePathId, CodeFileSolutionPath, LineNumber, IncludeText,
+    # IncludeType) tuples for the resolved #include directives of the files with the given path ids,
+    # in the order they appear in the files.
+    def GetIncludeDirectivesOfFiles(self, pathIds):
+        self.Flush()
+        
+        rv = []
+        
+        # Keep well below SQLite's limit on the number of host parameters.
+        pathIds = list(pathIds)
+        for i in xrange(0, len(pathIds), 500):
+            chunk = pathIds[i:i + 500]
+            self.cur.execute("""
+                SELECT i.CodeFileId, i.IncludePathId, f.SolutionPath, i.LineNumber, t.Text, t.IncludeType
+                FROM IncludeDirectiveEntry i
+                INNER JOIN PathEntry f ON f.Id = i.CodeFileId
+                INNER JOIN IncludeTextEntry t ON t.Id = i.IncludeTextId
+                WHERE i.CodeFileId IN ({0}) AND i.IncludePathId IS NOT NULL
+                ORDER BY i.rowid ASC
+                """.format(", ".join(["?"] * len(chunk))), chunk)
+            rv.extend(self.cur.fetchall())
+        
+        return rv
+    
+    # Returns a dictionary of the given path ids mapped to their solution paths.
+    def GetSolutionPaths(self, pathIds):
+        self.Flush()
+        
+        rv = {}
+        
+        # Keep well below SQLite's limit on the number of host parameters.
+        pathIds = list(pathIds)
+        for i in xrange(0, len(pathIds), 500):
+            chunk = pathIds[i:i + 500]
+            self.cur.execute("SELECT Id, SolutionPath FROM PathEntry WHERE Id IN ({0})".format(", ".join(["?"] * len(chunk))), chunk)
+            rv.update(self.cur.fetchall())
+        
+        return rv
     
     # Returns a dictionary of projects mapped to their sets of dependencies.
     #   dictionary keys:  Project names (strings)
     #   dictionary value: A set of project names (set() containing project name strings)
     def QueryProjectDependencieTree(self):
         if self.isOpen:
-            dependencyTree = OrderedDict()
-            
-            self.cur.execute("""
-                SELECT c.Project as Project, i.IncludeProject as Dependency 
-                FROM CodeFile c
-                INNER JOIN IncludeDirective i ON c.SolutionPath = i.CodeFileSolutionPath 
-                WHERE c.Project IS NOT NULL AND i.IncludeProject IS NOT NULL
-                GROUP BY c.Project, i.IncludeProject;
-                """)
-            
-            row = self.cur.fetchone()
-            while row:
-                if row[0] not in dependencyTree:
-                    dependencyTree[row[0]] = set()
-                try:
-                    dependencyTree[row[0]].add(row[1])
-                except:
-                    pass # It would be odd but not an error for this line to be executed.
-                
-                row = self.cur.fetchone()
-
-            for project in dependencyTree:
-                dependencyTree[project].discard(project)
-            
-            return dependencyTree
+            return dependencymatrix.DependencyMatrix(self).GetDependencyTree()
         
         return None
         
 # FileFilter class
 #   The file filter class is a wrapper for two lists of regular expressions that are used to
 #   specify which files are to be included and which files are to be excluded from processing.
+#   A third list specifies the directories that are excluded as a whole, their subtrees are not
+#   walked at all.
+#   
+#   Each list is compiled into a single regular expression that matches if any of its patterns do,
+#   see _CompilePatternList.
 class FileFilter(object):
+    # Matches the start of an inline flag group, e.g. (?i) or (?iu).
+    inlineFlagRegex = re.compile('\\(\\?[aiLmsux]')
+    
     def __init__(self, config = None):
-        if not config:
-            self.includeList = [ ".*\\.cpp$", ".*\\.h$", ".*\\.hpp$", ".*\\.c$" ]
-            self.excludeList = [ ".*moc_.*" ]
-        else:
+        self.includeList = [ ".*\\.cpp$", ".*\\.h$", ".*\\.hpp$", ".*\\.c$" ]
+        self.excludeList = [ ".*moc_.*" ]
+        self.excludeDirectoryList = []
+        
+        if config:
             self.Configure(config)
+        else:
+            self.Compile()
     
     def Configure(self, config):
         if config.parser:
@@ -576,54 +1359,520 @@ class FileFilter(object):
                     self.includeList = config.parser.get("FileFilter", "IncludePatterns").split()
                 if config.parser.has_option("FileFilter", "ExcludePatterns"):
                     self.excludeList = config.parser.get("FileFilter", "ExcludePatterns").split()
+                if config.parser.has_option("FileFilter", "ExcludeDirectories"):
+                    self.excludeDirectoryList = config.parser.get("FileFilter", "ExcludeDirectories").split()
+        
+        self.Compile()
+    
+    # Compile
+    #   Compiles the pattern lists. Must be called again if the lists are modified.
+    def Compile(self):
+        self.includeRegex = self._CompilePatternList(self.includeList)
+        self.excludeRegex = self._CompilePatternList(self.excludeList)
+        self.excludeDirectoryRegex = self._CompilePatternList(self.excludeDirectoryList)
     
-    def _MatchAnyPatternInList(self, patternList, string):
+    # _CompilePatternList
+    #   Combines the patterns that can be into a single regular expression. A pattern with groups or
+    #   inline flags would change what the others match, e.g. (?i) applies to the whole expression
+    #   in Python 2 and the numbers of the groups shift, so those patterns are matched on their own.
+    def _CompilePatternList(self, patternList):
+        if not patternList:
+            return None
+        
+        combinedPatterns = []
+        regexList = []
         for pattern in patternList:
-            matchObj = re.match(pattern, string)
-            if matchObj:
-                return True
-
-        return False
-
+            regex = re.compile(pattern)
+            if regex.groups == 0 and not self.inlineFlagRegex.search(pattern):
+                combinedPatterns.append(pattern)
+            else:
+                regexList.append(regex)
+        
+        if combinedPatterns:
+            combinedRegex = re.compile('|'.join(['(?:{0})'.format(pattern) for pattern in combinedPatterns]))
+            if not regexList:
+                return combinedRegex
+            regexList.insert(0, combinedRegex)
+        return _PatternListMatcher(regexList)
+    
     def IsExcluded(self, filepath):
-        if not self.excludeList:
+        if not self.excludeRegex:
             # An empty list means that nothing is excluded
             return False
-        return self._MatchAnyPatternInList(self.excludeList, filepath)
+        return self.excludeRegex.match(filepath) is not None
         
     def IsIncluded(self, filepath):
-        if not self.includeList:
+        if not self.includeRegex:
             # An empty list means that everything is included.
             return True
-        return self._MatchAnyPatternInList(self.includeList, filepath)
+        return self.includeRegex.match(filepath) is not None
+    
+    def IsDirectoryExcluded(self, dirpath):
+        if not self.excludeDirectoryRegex:
+            # An empty list means that all directories are walked.
+            return False
+        return self.excludeDirectoryRegex.match(dirpath) is not None
+
+# _PatternListMatcher class
+#   Has the same match() interface as a compiled regular expression but tries each pattern of a list
+#   in turn. Used when a pattern list can't be combined into a single regular expression.
+class _PatternListMatcher(object):
+    def __init__(self, regexList):
+        self.regexList = regexList
+    
+    def match(self, string):
+        for regex in self.regexList:
+            matchObj = regex.match(string)
+            if matchObj:
+                return matchObj
+        
+        return None
+        
+# Process pool worker state. Each worker process gets its own copy of the SolutionProcessor (minus
+# the database connection) through the pool initializer and only ever parses and resolves files.
+_scanWorkerProcessor = None
+
+def _InitScanWorker(processor):
+    global _scanWorkerProcessor
+    _scanWorkerProcessor = processor
+
+def _ScanFileWorker(filepath):
+    try:
+        return _scanWorkerProcessor.ScanFile(filepath)
+    except SystemExit:
+        # GetIncludes() exits on files it can't open. A worker process that exits would leave the
+        # pool waiting for its result forever so report the failure to the writer instead.
+        return None
+
+# _Reraise
+#   Raises an exception again with its original traceback, given the tuple returned by sys.exc_info().
+#   The Python 2 raise statement that does this is a syntax error in Python 3 so it is compiled at
+#   run time there.
+if sys.version_info[0] >= 3:
+    def _Reraise(excInfo):
+        raise excInfo[1].with_traceback(excInfo[2])
+else:
+    exec("def _Reraise(excInfo):\n    raise excInfo[0], excInfo[1], excInfo[2]\n")
+
+# _ScanPipeline class
+#   Scans the solution with a pipeline of threads connected by bounded queues:
+#     walker -> file readers -> parser -> database writer
+#   The walker stats the files as it finds them (and, in incremental mode, drops the unchanged ones),
+#   a pool of reader threads reads the files into memory, the parser extracts and resolves their
+#   #include directives and the writer adds the results to the database. Reading the files overlaps
+#   with everything else which pays off when the file system has a high latency. A full queue blocks
+#   the stage that feeds it which bounds the memory use.
+#   
+#   The writer is the only thread that touches the database while the pipeline runs. A stage that
+#   fails records the error and keeps draining its input queue so that no other stage is left blocked.
+class _ScanPipeline(object):
+    queueSize = 256
+    
+    # Marks the end of the items a stage puts into a queue.
+    endOfQueue = object()
+    
+    def __init__(self, processor, isIncremental, storedFileStats):
+        self.processor = processor
+        self.messagePrinter = processor.messagePrinter
+        self.readThreadCount = processor.readThreads
+        self.isIncremental = isIncremental
+        self.storedFileStats = storedFileStats
+        
+        self.readQueue = Queue.Queue(self.queueSize)
+        self.parseQueue = Queue.Queue(self.queueSize)
+        self.writeQueue = Queue.Queue(self.queueSize)
+        
+        self.fileStats = {}
+        self.addedSolPaths = []
+        self.removedSolPaths = []
+        self.processedCounter = 0
+        self.skippedCounter = 0
+        self.unchangedCounter = 0
+        self.skippedBytesCounter = 0
+        
+        self.isFailed = False
+        self.excInfo = None
+    
+    # Run
+    #   Runs the pipeline to completion. Returns False if a file couldn't be scanned, exceptions
+    #   raised by the stages are raised again.
+    def Run(self):
+        threads = [threading.Thread(target = self._Walk)]
+        threads += [threading.Thread(target = self._Read) for i in range(self.readThreadCount)]
+        threads += [threading.Thread(target = self._Parse), threading.Thread(target = self._Write)]
+        
+        self.messagePrinter.info("Scanning using a pipeline with {0} reader threads".format(self.readThreadCount))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if self.excInfo is not None:
+            _Reraise(self.excInfo)
+        
+        return not self.isFailed
+    
+    def _Fail(self, excInfo = None):
+        if excInfo is not None and self.excInfo is None:
+            self.excInfo = excInfo
+        self.isFailed = True
+    
+    def _Walk(self):
+        try:
+            filepaths, self.skippedCounter = self.processor.GetFilesToScan(self._OnFileFound)
+            if self.isIncremental:
+                self.removedSolPaths = list(self.storedFileStats.keys())
+        except:
+            self._Fail(sys.exc_info())
+        finally:
+            for i in range(self.readThreadCount):
+                self.readQueue.put(self.endOfQueue)
+    
+    # _OnFileFound
+    #   Called by the walk for every file that passes the file filter.
+    def _OnFileFound(self, filepath):
+        if self.isFailed:
+            return
+        
+        # Record the state of the file before it is read. A file that is modified while we are
+        # parsing it will then be parsed again by the next incremental scan.
+        fileStat = self.processor.GetFileStat(filepath)
+        
+        if self.isIncremental:
+            solPath = self.processor.solutionInfo.GetPathRelativeToSolution(filepath)
+            fileState, contentHash = self.processor.CompareFileStat(filepath, solPath, fileStat, self.storedFileStats)
+            if fileState == SolutionProcessor.fileUnchanged:
+                self.unchangedCounter = self.unchangedCounter + 1
+                return
+            if fileState == SolutionProcessor.fileTouched:
+                self.unchangedCounter = self.unchangedCounter + 1
+                self.writeQueue.put((solPath, fileStat, contentHash))
+                return
+            if fileState == SolutionProcessor.fileAdded:
+                self.addedSolPaths.append(solPath)
+        
+        self.fileStats[filepath] = fileStat
+        self.readQueue.put(filepath)
+    
+    def _Read(self):
+        try:
+            while True:
+                filepath = self.readQueue.get()
+                if filepath is self.endOfQueue:
+                    break
+                if self.isFailed:
+                    continue
+                
+                try:
+                    with open(filepath, 'rb') as reader:
+                        data = reader.read()
+                except IOError as e:
+                    self.messagePrinter.error("Error, couldn't open" + repr(filepath))
+                    data = None
+                except:
+                    self._Fail(sys.exc_info())
+                    continue
+                
+                self.parseQueue.put((filepath, data))
+        finally:
+            self.parseQueue.put(self.endOfQueue)
+    
+    def _Parse(self):
+        try:
+            endCounter = 0
+            while endCounter < self.readThreadCount:
+                item = self.parseQueue.get()
+                if item is self.endOfQueue:
+                    endCounter = endCounter + 1
+                    continue
+                if self.isFailed:
+                    continue
+                
+                filepath, data = item
+                scanResult = None
+                if data is not None:
+                    try:
+                        scanResult = self.processor.ScanFile(filepath, data)
+                    except:
+                        self._Fail(sys.exc_info())
+                        continue
+                
+                self.writeQueue.put((filepath, scanResult))
+        finally:
+            self.writeQueue.put(self.endOfQueue)
+    
+    def _Write(self):
+        database = self.processor.database
+        while True:
+            item = self.writeQueue.get()
+            if item is self.endOfQueue:
+                break
+            if self.isFailed:
+                continue
+            
+            try:
+                if len(item) == 3:
+                    # The state of a touched file, see SolutionProcessor.CompareFileStat.
+                    solPath, fileStat, contentHash = item
+                    database.AddFileStat(solPath, fileStat[0], fileStat[1], contentHash)
+                    continue
+                
+                filepath, scanResult = item
+                if scanResult is None:
+                    self.messagePrinter.error("Error, failed to scan {0}".format(repr(filepath)))
+                    self._Fail()
+                    continue
+                
+                self.processor.WriteScanResult(scanResult, self.fileStats[filepath], self.isIncremental)
+                self.skippedBytesCounter += scanResult[5]
+                
+                self.processedCounter = self.processedCounter + 1
+                if self.processedCounter % 1000 == 0:
+                    self.messagePrinter.info("Processed {0: >4} files".format(self.processedCounter))
+            except:
+                self._Fail(sys.exc_info())
+
+# _InotifyWatcher class
+#   Watches the solution's directories, except the excluded ones, for changed files with Linux's
+#   inotify(7) API. The API is called through ctypes so the constructor raises an OSError where it is
+#   not available.
+class _InotifyWatcher(object):
+    # The inotify event masks, see inotify(7).
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    
+    watchMask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    
+    # The struct inotify_event header: wd, mask, cookie, len.
+    eventHeader = struct.Struct('iIII')
+    
+    # The time to wait for more events once the first one has arrived. An editor's save is usually a
+    # burst of events.
+    settleTime = 0.1
+    
+    # The longest time to collect events for, from the first one. A file that is written to all the
+    # time must not hold up the updates.
+    maxBatchTime = 0.5
+    
+    def __init__(self, processor):
+        self.processor = processor
+        
+        libcName = ctypes.util.find_library('c')
+        if libcName is None:
+            raise OSError("The C library couldn't be found.")
+        self.libc = ctypes.CDLL(libcName, use_errno = True)
+        if not hasattr(self.libc, 'inotify_init'):
+            raise OSError("inotify isn't supported on this platform.")
+        
+        self.fd = None
+        self.watchPaths = {}
+        self._AddWatches()
+    
+    def Close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+    
+    # Starts watching the solution from scratch.
+    def _AddWatches(self):
+        self.Close()
+        self.watchPaths = {}
+        
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
         
+        self._AddDirectoryTree(self.processor.solutionInfo.GetSolutionPath())
+    
+    # Watches a directory and its subdirectories the way GetFilesToScan walks them. Returns the files
+    # found in them. Raises an OSError only when no more directories can be watched.
+    def _AddDirectoryTree(self, dirpath):
+        filepaths = []
+        for root, dirs, files in os.walk(dirpath, topdown=True):
+            wd = self.libc.inotify_add_watch(self.fd, root, self.watchMask)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    # The limit set by /proc/sys/fs/inotify/max_user_watches was reached.
+                    raise OSError(error, "Couldn't watch {0}: {1}".format(root, os.strerror(error)))
+                
+                # e.g. ENOENT, the directory was removed since it was listed. Its parent's watch
+                # reports that.
+                dirs[:] = []
+                continue
+            self.watchPaths[wd] = root
+            
+            dirs[:] = [name for name in dirs if not self._IsDirectoryExcluded(os.path.join(root, name))]
+            filepaths.extend([os.path.join(root, name) for name in files])
+        
+        return filepaths
+    
+    def _IsDirectoryExcluded(self, dirpath):
+        fileFilter = self.processor.fileFilter
+        return (fileFilter and fileFilter.IsDirectoryExcluded(dirpath)) or os.path.islink(dirpath)
+    
+    # Wait
+    #   Waits for files to change and returns a tuple of the list of the paths of the files that were
+    #   modified, added or removed and whether the list holds all of the files of the solution, in
+    #   which case the files that aren't on it have been removed. The latter happens when directories
+    #   are moved or removed, or when the kernel's event queue overflowed, as the events of the
+    #   individual files are then lost.
+    #   
+    #   The events are collected until none arrive for settleTime seconds, but for no longer than
+    #   maxBatchTime seconds. The events that arrive after that are returned by the next call.
+    def Wait(self):
+        filepaths = set()
+        isRescanNeeded = False
+        
+        timeout = None
+        batchEndTime = None
+        while select.select([self.fd], [], [], timeout)[0]:
+            if batchEndTime is None:
+                batchEndTime = time.time() + self.maxBatchTime
+            
+            data = os.read(self.fd, 65536)
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, nameLength = self.eventHeader.unpack_from(data, offset)
+                offset += self.eventHeader.size
+                name = data[offset:offset + nameLength].rstrip('\0')
+                offset += nameLength
+                
+                if mask & self.IN_Q_OVERFLOW:
+                    isRescanNeeded = True
+                elif wd not in self.watchPaths or not name:
+                    # The events of a removed directory's own watch.
+                    continue
+                elif mask & self.IN_ISDIR:
+                    path = os.path.join(self.watchPaths[wd], name)
+                    if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                        isRescanNeeded = True
+                    elif mask & (self.IN_CREATE | self.IN_MOVED_TO) and not self._IsDirectoryExcluded(path):
+                        filepaths.update(self._AddDirectoryTree(path))
+                else:
+                    filepaths.add(os.path.join(self.watchPaths[wd], name))
+            
+            timeout = min(self.settleTime, batchEndTime - time.time())
+            if timeout <= 0:
+                break
+        
+        if isRescanNeeded:
+            self._AddWatches()
+            return (self.processor.GetFilesToScan()[0], True)
+        
+        return (sorted(filepaths), False)
+
+# _PollingWatcher class
+#   Watches the solution for changed files by walking it at regular intervals, where inotify isn't
+#   available. Every walk lists all of the files of the solution, see _InotifyWatcher.Wait.
+class _PollingWatcher(object):
+    def __init__(self, processor, interval):
+        self.processor = processor
+        self.interval = interval
+    
+    def Close(self):
+        pass
+    
+    def Wait(self):
+        time.sleep(self.interval)
+        return (self.processor.GetFilesToScan()[0], True)
+
 class SolutionProcessor(object):
     # match.group(1) will contain the #include content including {<,>,"}
     # match.group(2) will contain the included filepath only for system includes (None otherwise)
     # match.group(3) will contain the included filepath only for local includes (None otherwise)
     includeRegex = re.compile('^[ ]*#include[ ]+(\\<(.*?)\\>|"(.*?)")')
+    
+    # Used by the fast include scan (see _ReadIncludesFast).
+    includeScanChunkSize = 1 << 16
+    declarationRegex = re.compile('^[ \\t]*[A-Za-z_]', re.M)
+    blockCommentRegex = re.compile('/\\*.*?\\*/', re.S)
+    lineContinuationRegex = re.compile('\\\\\r?\n')
 
     def __init__(self, config = None, fileFilter = None):
         self.config = config
+        self.messagePrinter = config.messagePrinter
         self.fileFilter = fileFilter
         self.solutionInfo = SolutionInfo(config)
-        self.database = DependencyScriptDatabase(config.databaseFilename, messagePrinter=config.messagePrinter)
+        self.database = DependencyScriptDatabase(config.databaseFilename, messagePrinter=config.messagePrinter, batchSize=config.batchSize)
         self.htmlFilename = config.parser.get("Output", "HtmlFilename")
+        self.jobs = config.jobs
+        self.incremental = config.incremental
+        self.hashContents = config.hashContents
+        self.includeScanLines = config.includeScanLines
+        self.stopAtDeclaration = config.stopAtDeclaration
+        self.fastIncludeScan = config.fastIncludeScan or self.includeScanLines is not None or self.stopAtDeclaration
+        self.pipeline = config.pipeline
+        self.readThreads = max(1, config.readThreads)
         self.isDbOpen = False
+        
+        # Index of every file under the solution root (see GetFilesToScan) and the cache of include
+        # search results that don't depend on the including file (see GetIncludeFileAbsolutePath).
+        self.fileIndex = None
+        self.fileIndexRoot = None
+        self.unindexedPaths = []
+        self.includeSearchCache = {}
+        
+        # The posix solution paths of the files in the index, see UpdateStoredFileIndex.
+        self.solutionFiles = set()
+
+    # The worker processes get a copy of the processor when --jobs is used. The database connection
+    # and the argparse based configuration can't be pickled and aren't needed by ScanFile().
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['config'] = None
+        state['database'] = None
+        return state
 
     # GetIncludes free-function (equivalent to a static class method)
     #   This function processes a .h, .c, .hpp, .cpp; file, extracts all of the #include'd file paths,
     #   categorises them into two lists (local and system includes) and returns the two lists in a tuple.
     def GetIncludes(self, filepath):
-        localIncludes = []
-        systemIncludes = []
+        localIncludes, systemIncludes, skippedBytes = self._ReadIncludes(filepath)
         
+        return (localIncludes, systemIncludes)
+    
+    # _ReadIncludes
+    #   Implements GetIncludes. Returns the two lists and the number of bytes at the end of the file
+    #   that were never read because the fast include scan stopped early. The file's contents are
+    #   parsed from data instead if they have already been read.
+    def _ReadIncludes(self, filepath, data = None):
         try:
-            reader = open(filepath)
+            if data is not None:
+                reader = BytesIO(data)
+            elif self.fastIncludeScan:
+                reader = open(filepath, 'rb')
+            else:
+                reader = open(filepath)
         except IOError as e:
-            self.config.messagePrinter.error("Error, couldn't open" + repr(filepath))
+            self.messagePrinter.error("Error, couldn't open" + repr(filepath))
             sys.exit(1)
         
+        try:
+            if self.fastIncludeScan:
+                if data is not None:
+                    fileSize = len(data)
+                else:
+                    fileSize = os.fstat(reader.fileno()).st_size
+                return self._ReadIncludesFast(reader, fileSize)
+            else:
+                localIncludes, systemIncludes = self._ReadIncludesByLine(reader)
+                return (localIncludes, systemIncludes, 0)
+        finally:
+            reader.close()
+    
+    def _ReadIncludesByLine(self, reader):
+        localIncludes = []
+        systemIncludes = []
+        
         # Read the file, line by line
         line = reader.readline();
         lineNum = 0
@@ -639,47 +1888,173 @@ class SolutionProcessor(object):
                 
             line = reader.readline();
         
-        reader.close()
-        
         return (localIncludes, systemIncludes)
+    
+    # _HasDeclaration
+    #   Checks if the text, which doesn't contain any #include directives, has a line that starts with
+    #   an identifier once comments and preprocessor line continuations are removed.
+    def _HasDeclaration(self, text):
+        text = self.blockCommentRegex.sub('', text)
+        text = self.lineContinuationRegex.sub('', text)
+        return self.declarationRegex.search(text) is not None
+    
+    # _ReadIncludesFast
+    #   Reads the file in binary chunks and searches them for "#include" so that the include regex
+    #   is only run on the lines that could match. The line numbers are the same as the ones the line
+    #   by line scan produces.
+    #   
+    #   With --include-scan-lines or --stop-at-declaration the rest of the file is not read once the
+    #   #include region at the top of the file has been passed.
+    def _ReadIncludesFast(self, reader, fileSize):
+        localIncludes = []
+        systemIncludes = []
+        
+        lineNum = 0            # The number of lines before the current position
+        lastIncludeLineNum = 0
+        bytesRead = 0
+        pendingData = ''       # The incomplete last line of the previous chunk
+        isEndOfFile = False
+        isDone = False
+        
+        while not isDone and not isEndOfFile:
+            chunk = reader.read(self.includeScanChunkSize)
+            bytesRead += len(chunk)
+            
+            if chunk:
+                # Only process complete lines, the incomplete last line is carried over.
+                data = pendingData + chunk
+                end = data.rfind('\n') + 1
+                pendingData = data[end:]
+            else:
+                data = pendingData
+                end = len(data)
+                isEndOfFile = True
+            
+            pos = 0
+            while pos < end:
+                hit = data.find('#include', pos, end)
+                if hit < 0:
+                    gapEnd = end
+                else:
+                    lineStart = data.rfind('\n', pos, hit) + 1
+                    if lineStart == 0:
+                        lineStart = pos
+                    gapEnd = lineStart
+                
+                # Check the lines in between the #include lines for the end of the #include region.
+                gapLineCount = data.count('\n', pos, gapEnd)
+                if self.stopAtDeclaration and self._HasDeclaration(data[pos:gapEnd]):
+                    isDone = True
+                    break
+                if self.includeScanLines is not None:
+                    if hit < 0 and (lineNum + gapLineCount) - lastIncludeLineNum >= self.includeScanLines:
+                        isDone = True
+                        break
+                    elif hit >= 0 and (lineNum + gapLineCount + 1) - lastIncludeLineNum > self.includeScanLines:
+                        isDone = True
+                        break
+                
+                lineNum += gapLineCount
+                if hit < 0:
+                    break
+                
+                lineEnd = data.find('\n', hit, end)
+                if lineEnd < 0:
+                    lineEnd = end
+                else:
+                    lineEnd += 1
+                lineNum += 1
+                pos = lineEnd
+                
+                # Check the include regex
+                matchObj = self.includeRegex.match(data[lineStart:lineEnd])
+                if matchObj:
+                    if matchObj.group(2) is not None:
+                        systemIncludes.append((matchObj.group(2), lineNum))
+                        lastIncludeLineNum = lineNum
+                    elif matchObj.group(3) is not None:
+                        localIncludes.append((matchObj.group(3), lineNum))
+                        lastIncludeLineNum = lineNum
+        
+        skippedBytes = 0
+        if isDone:
+            skippedBytes = fileSize - bytesRead
+        
+        return (localIncludes, systemIncludes, skippedBytes)
+    
+    # IsFile
+    #   Equivalent to os.path.isfile() but answers from the file index for the paths under the
+    #   solution root once the solution has been walked.
+    def IsFile(self, path):
+        # A path like "missing/../file.h" only exists if the "missing" directory does so paths that
+        # go up a directory are left to the file system.
+        if self.fileIndex is None or '..' in path:
+            return os.path.isfile(path)
+        
+        indexKey = os.path.normcase(os.path.abspath(path))
+        if indexKey in self.fileIndex:
+            return True
         
+        # The directories that were not walked (and the paths outside of the solution) aren't in the
+        # index so we have to ask the file system.
+        for unindexedPath in self.unindexedPaths:
+            if indexKey.startswith(unindexedPath):
+                return os.path.isfile(path)
+        if not indexKey.startswith(self.fileIndexRoot):
+            return os.path.isfile(path)
+        
+        return False
+    
     def GetIncludeFileAbsolutePath(self, absoluteFilepath, includetext, isLocalInclude = True):
         filepath, filename = os.path.split(absoluteFilepath)
         
         localFilePath = os.path.join(filepath, includetext)
-        solFilePath = os.path.join(self.solutionInfo.path, includetext)
         
-        if os.path.isfile(localFilePath):
+        if self.IsFile(localFilePath):
             # This is a local include file
             return os.path.abspath(localFilePath)
-        elif os.path.isfile(solFilePath):
-            # Solution path relative include
-            return os.path.abspath(solFilePath)
+        
+        # The rest of the search doesn't depend on the including file so it is done once for each
+        # include text. Includes that never resolve, like <vector>, cost nothing after the first miss.
+        if includetext in self.includeSearchCache:
+            absoluteIncludePath, potentials = self.includeSearchCache[includetext]
         else:
-            # Try one of the projects paths
+            solFilePath = os.path.join(self.solutionInfo.path, includetext)
+            
             potentials = []
-            for project in self.solutionInfo.projectList:
-                proj = self.solutionInfo.projectList[project]
-                if proj.includePath is not None:
-                    projFilePath = toPosixPath(os.path.join(proj.includePath, includetext))
-                    if os.path.isfile(projFilePath):
-                        potentials.append(projFilePath)
-            
-            if len(potentials) == 1:
-                return os.path.abspath(potentials[0])
-            elif len(potentials) > 1:
-                self.config.messagePrinter.error('include text "{0}" in {1} matches multiple files:'.format(includetext, absoluteFilepath))
-                formatStr = '  {0} (selected)'
-                for p in potentials:
-                    self.config.messagePrinter.error(formatStr.format(p))
-                    formatStr = '  {0}'
+            if self.IsFile(solFilePath):
+                # Solution path relative include
+                absoluteIncludePath = os.path.abspath(solFilePath)
+            else:
+                # Try one of the projects paths
+                for project in self.solutionInfo.projectList:
+                    proj = self.solutionInfo.projectList[project]
+                    if proj.includePath is not None:
+                        projFilePath = toPosixPath(os.path.join(proj.includePath, includetext))
+                        if self.IsFile(projFilePath):
+                            potentials.append(projFilePath)
                 
-                return os.path.abspath(potentials[0])
+                if len(potentials) > 0:
+                    absoluteIncludePath = os.path.abspath(potentials[0])
+                else:
+                    # Don't know where this file is...
+                    absoluteIncludePath = None
             
-            # Don't know where this file is...
-            return None
+            self.includeSearchCache[includetext] = (absoluteIncludePath, potentials)
+        
+        if len(potentials) > 1:
+            self.messagePrinter.error('include text "{0}" in {1} matches multiple files:'.format(includetext, absoluteFilepath))
+            formatStr = '  {0} (selected)'
+            for p in potentials:
+                self.messagePrinter.error(formatStr.format(p))
+                formatStr = '  {0}'
+        
+        return absoluteIncludePath
     
-    def AddIncludeTupleToDatabase(self, filepath, solPath, includeTuple, isLocalInclude = True):
+    # GetIncludeRow
+    #   Resolves an include tuple, as returned by GetIncludes(), and returns the arguments that
+    #   DependencyScriptDatabase.AddInclude() expects as a tuple.
+    def GetIncludeRow(self, filepath, solPath, includeTuple, isLocalInclude = True):
         include, lineNumber = includeTuple
         absoluteIncludePath = self.GetIncludeFileAbsolutePath(filepath, include, isLocalInclude)
         
@@ -695,79 +2070,539 @@ class SolutionProcessor(object):
         
         includePath, includeFilename = os.path.split(include)
         
-        includeType = self.database.includeTypeSystem
+        includeType = DependencyScriptDatabase.includeTypeSystem
         if isLocalInclude:
-            includeType = self.database.includeTypeLocal
+            includeType = DependencyScriptDatabase.includeTypeLocal
         
-        fileList = self.database.AddInclude(solPath, include, includeType, includeFilename, incProject, solIncPath, lineNumber)
+        return (solPath, include, includeType, includeFilename, incProject, solIncPath, lineNumber)
+    
+    def AddIncludeTupleToDatabase(self, filepath, solPath, includeTuple, isLocalInclude = True):
+        self.database.AddInclude(*self.GetIncludeRow(filepath, solPath, includeTuple, isLocalInclude))
+    
+    def GetContentHash(self, filepath):
+        contentHash = hashlib.md5()
+        
+        with open(filepath, 'rb') as reader:
+            data = reader.read(1 << 20)
+            while data:
+                contentHash.update(data)
+                data = reader.read(1 << 20)
+        
+        return contentHash.hexdigest()
+    
+    # ScanFile
+    #   Extracts and resolves all of the #include directives of a single file without touching the
+    #   database. Returns a (filename, project, solution path, include rows, content hash, skipped
+    #   bytes) tuple where the include rows are the argument tuples for
+    #   DependencyScriptDatabase.AddInclude(), the content hash is None unless --hash was given and
+    #   the skipped bytes are the number of bytes the fast include scan didn't read.
+    #   
+    #   The file's contents can be given in data if they have already been read.
+    def ScanFile(self, filepath, data = None):
+        root, name = os.path.split(filepath)
+        
+        # Get the paths relative to the solution and workout the project folder that the file is
+        # located in.
+        solPath = self.solutionInfo.GetPathRelativeToSolution(filepath)
+        project = self.solutionInfo.GetProjectName(filepath)
+        
+        internalIncludes, externalIncludes, skippedBytes = self._ReadIncludes(filepath, data)
+        
+        includeRows = []
+        for i in internalIncludes:
+            includeRows.append(self.GetIncludeRow(filepath, solPath, i, isLocalInclude = True))
+        
+        for i in externalIncludes:
+            includeRows.append(self.GetIncludeRow(filepath, solPath, i, isLocalInclude = False))
+        
+        contentHash = None
+        if self.hashContents:
+            if data is not None:
+                contentHash = hashlib.md5(data).hexdigest()
+            else:
+                contentHash = self.GetContentHash(filepath)
+        
+        return (name, project, solPath, includeRows, contentHash, skippedBytes)
+    
+    # GetFilesToScan
+    #   Walks the solution directory and returns a tuple of the list of files that pass the file
+    #   filter and the number of files that were skipped.
+    #   
+    #   The walk also builds the index of all the files in the solution which is used to resolve the
+    #   #include directives without probing the file system.
+    def GetFilesToScan(self, fileCallback = None):
+        solutionPath = self.solutionInfo.GetSolutionPath()
+        
+        # The index is only used once the walk is complete. A pipelined scan resolves includes while
+        # the walk is still running, IsFile() falls back to the file system until then.
+        self.fileIndex = None
+        self.includeSearchCache = {}
+        fileIndex = set()
+        fileIndexRoot = os.path.join(os.path.normcase(solutionPath), '')
+        unindexedPaths = []
+        solutionFiles = set()
+        solutionPathLength = len(os.path.join(solutionPath, ''))
+        
+        filepaths = []
+        skippedCounter = 0
+        for root, dirs, files in os.walk(solutionPath, topdown=True):
+            # Prune the excluded directories so that they are never listed. Neither their files nor
+            # those of the symlinked directories, which os.walk() doesn't descend into, are indexed.
+            walkedDirs = []
+            for name in dirs:
+                dirpath = os.path.join(root, name)
+                if self.fileFilter and self.fileFilter.IsDirectoryExcluded(dirpath):
+                    unindexedPaths.append(os.path.join(os.path.normcase(dirpath), ''))
+                else:
+                    if os.path.islink(dirpath):
+                        unindexedPaths.append(os.path.join(os.path.normcase(dirpath), ''))
+                    walkedDirs.append(name)
+            dirs[:] = walkedDirs
+            
+            for name in files:
+                filepath = os.path.join(root, name)
+                fileIndex.add(os.path.normcase(filepath))
+                solutionFiles.add(toPosixPath(filepath[solutionPathLength:]))
+                
+                # Apply the file filter (including only the .cpp, .c, .h and .hpp files presumably)
+                # The filter is specified in the .ini file.
+                if self.fileFilter and (self.fileFilter.IsIncluded(filepath) and not self.fileFilter.IsExcluded(filepath)):
+                    filepaths.append(filepath)
+                    if fileCallback:
+                        fileCallback(filepath)
+                else:
+                    skippedCounter = skippedCounter + 1
+        
+        self.fileIndexRoot = fileIndexRoot
+        self.unindexedPaths = unindexedPaths
+        self.fileIndex = fileIndex
+        self.solutionFiles = solutionFiles
+        
+        return (filepaths, skippedCounter)
+    
+    # GetFileStat
+    #   Returns the modification time and size of the file.
+    def GetFileStat(self, filepath):
+        fileStat = os.stat(filepath)
+        return (fileStat.st_mtime, fileStat.st_size)
+    
+    # IsProjectListCurrent
+    #   Checks if the projects recorded in the database match the configured projects. The include
+    #   resolution of every file depends on them so an incremental scan isn't possible otherwise.
+    def IsProjectListCurrent(self):
+        projects = set()
+        for project in self.solutionInfo.GetProjectList():
+            path = toPosixPath(self.solutionInfo.GetProjectPath(project))
+            level = self.solutionInfo.GetProjectSortOrder(project)
+            projects.add((path, project, level))
+        
+        return projects == set(self.database.GetProjects())
+    
+    # CompareFileStat
+    #   Compares the state of a file with the state recorded by the last scan and removes the latter
+    #   from storedFileStats. Returns a tuple of the file's state and, for touched files, its
+    #   contents hash. The state is one of:
+    #     fileAdded      - the file is new
+    #     fileModified   - the file has been modified
+    #     fileTouched    - only the modification time or size changed but the contents hash didn't,
+    #                      the recorded state needs updating but the file needn't be parsed again
+    #     fileUnchanged  - the file is unchanged
+    #   The contents hash is only compared when --hash is given.
+    fileAdded = "added"
+    fileModified = "modified"
+    fileTouched = "touched"
+    fileUnchanged = "unchanged"
+    
+    def CompareFileStat(self, filepath, solPath, fileStat, storedFileStats):
+        storedFileStat = storedFileStats.pop(solPath, None)
+        if storedFileStat is None:
+            return (self.fileAdded, None)
+        
+        modifiedTime, size = fileStat
+        if storedFileStat[0] == modifiedTime and storedFileStat[1] == size:
+            return (self.fileUnchanged, None)
+        
+        storedHash = storedFileStat[2]
+        if self.hashContents and storedHash is not None and storedHash == self.GetContentHash(filepath):
+            return (self.fileTouched, storedHash)
+        
+        return (self.fileModified, None)
+    
+    # GetChangedFiles
+    #   Compares the files found in the solution with the file states recorded by the last scan.
+    #   Returns a tuple of the list of new or modified files that need to be parsed, the list of
+    #   solution paths of the files that no longer exist and the list of solution paths of the new
+    #   files.
+    #   
+    #   Files whose modification time and size are unchanged are skipped. When --hash is given, files
+    #   whose contents hash is unchanged are skipped as well and only their recorded state is updated.
+    def GetChangedFiles(self, filepaths, fileStats, storedFileStats):
+        changedFilepaths = []
+        addedSolPaths = []
+        for filepath in filepaths:
+            solPath = self.solutionInfo.GetPathRelativeToSolution(filepath)
+            fileState, contentHash = self.CompareFileStat(filepath, solPath, fileStats[filepath], storedFileStats)
+            
+            if fileState == self.fileAdded:
+                addedSolPaths.append(solPath)
+                changedFilepaths.append(filepath)
+            elif fileState == self.fileModified:
+                changedFilepaths.append(filepath)
+            elif fileState == self.fileTouched:
+                modifiedTime, size = fileStats[filepath]
+                self.database.AddFileStat(solPath, modifiedTime, size, contentHash)
+        
+        removedSolPaths = list(storedFileStats.keys())
+        
+        return (changedFilepaths, removedSolPaths, addedSolPaths)
+    
+    # UpdateStoredFileIndex
+    #   Stores the solution paths of the files found by the last walk of the solution (see
+    #   GetFilesToScan) in the database. Returns a tuple of the sets of the solution paths of the files
+    #   that were added and removed since they were last stored. These include the files that are not
+    #   scanned, e.g. those that the file filter excludes, which can still be included.
+    def UpdateStoredFileIndex(self):
+        storedSolPaths = self.database.GetSolutionFiles()
+        addedSolPaths = self.solutionFiles - storedSolPaths
+        removedSolPaths = storedSolPaths - self.solutionFiles
+        
+        self.database.RemoveSolutionFiles(removedSolPaths)
+        self.database.AddSolutionFiles(addedSolPaths)
+        
+        return (addedSolPaths, removedSolPaths)
+    
+    # ReresolveIncludes
+    #   Resolves the #include directives that refer to a file with one of the given filenames again.
+    #   These are the only directives whose resolution can change when files with those names are
+    #   added or removed.
+    def ReresolveIncludes(self, includeFilenames):
+        updatedCounter = 0
+        for rowId, solPath, includeText, includeType, lineNumber in self.database.GetIncludesOfFilenames(includeFilenames):
+            filepath = os.path.join(self.solutionInfo.GetSolutionPath(), solPath)
+            isLocalInclude = (includeType == DependencyScriptDatabase.includeTypeLocal)
+            includeRow = self.GetIncludeRow(filepath, solPath, (includeText, lineNumber), isLocalInclude)
+            self.database.UpdateIncludeResolution(rowId, includeRow[4], includeRow[5])
+            updatedCounter = updatedCounter + 1
+        
+        return updatedCounter
+    
+    # WriteScanResult
+    #   Adds a scanned file, its #include directives and its state to the database. In incremental
+    #   mode the directives recorded by the last scan are removed first.
+    def WriteScanResult(self, scanResult, fileStat, isIncremental):
+        name, project, solPath, includeRows, contentHash, skippedBytes = scanResult
+        
+        if isIncremental:
+            self.database.RemoveIncludes(solPath)
+        
+        self.database.AddFile(name, project, solPath, exists = True)
+        for includeRow in includeRows:
+            self.database.AddInclude(*includeRow)
+        
+        modifiedTime, size = fileStat
+        self.database.AddFileStat(solPath, modifiedTime, size, contentHash)
     
     # PopulateDatabase
     #   This function processes a .h, .c, .hpp, .cpp; file, extracts all of the #include'd file paths,
     #   and places them all into an SQLite database.
+    #   
+    #   When more than one job is requested the files are parsed and resolved by a pool of worker
+    #   processes. The results are returned in the walk order and this process remains the only
+    #   writer to the database. With --pipeline the scan is done by a pipeline of threads instead
+    #   (see _ScanPipeline).
+    #   
+    #   In incremental mode an existing database is updated by parsing only the new and modified
+    #   files (see GetChangedFiles). The #include directives that could refer to any file that was
+    #   added or removed, scanned or not, are then resolved again (see UpdateStoredFileIndex).
+    #   
+    #   A full scan that fails is aborted, see DependencyScriptDatabase.Abort.
     def PopulateDatabase(self):
+        isPopulated = False
+        try:
+            isPopulated = self._PopulateDatabase()
+        finally:
+            if not isPopulated and self.isDbOpen and self.database.isBulkLoading:
+                self.database.Abort()
+        return isPopulated
+    
+    def _PopulateDatabase(self):
         # Print helpful info
         self.config.messagePrinter.info("Working directory: {0}".format(os.path.abspath(os.getcwd())))
         self.config.messagePrinter.info("Configuration file: {0}".format(os.path.relpath(self.config.scriptIni)))
         self.config.messagePrinter.info("Source path: {0}".format(os.path.relpath(self.config.sourcePath)))
         
-        if not self.isDbOpen:
-            self.isDbOpen = self.database.Open()
+        # Only a full scan bulk loads, see BeginBulkLoad. A database that turns out to need one is
+        # switched over below.
+        self.isDbOpen = self.database.Open(bulkLoad = not self.incremental)
         
         if not self.isDbOpen:
             self.config.messagePrinter.error("Failed to open database. Exiting!")
             return False
+        
+        isIncremental = False
+        if self.incremental:
+            if not self.database.HasTable("CodeFileStat"):
+                self.config.messagePrinter.info("No previous scan found in the database, doing a full scan.")
+            elif not self.IsProjectListCurrent():
+                self.config.messagePrinter.info("The project configuration has changed, doing a full scan.")
+            else:
+                isIncremental = True
+        
+        storedFileStats = None
+        if isIncremental:
+            self.database.Migrate()
+            self.database.Create()
+            storedFileStats = self.database.GetFileStats()
         else:
+            if not self.database.isBulkLoading:
+                self.database.BeginBulkLoad()
             self.database.Drop()
             self.database.Create()
-        
-        # Populate Projects table
-        for project in self.solutionInfo.GetProjectList():
-            path = self.solutionInfo.GetProjectPath(project)
-            level = self.solutionInfo.GetProjectSortOrder(project)
-            self.database.AddProject(project, path, level)
             
-        # Populate CodeFile and IncludeDirective tables
-        processedCounter = 0
-        skippedCounter = 0
-        startTime = time.clock()
-        for root, dirs, files in os.walk(self.solutionInfo.GetSolutionPath(), topdown=True):
-            for name in files:
-                filepath = os.path.join(root, name)
+            # Populate Projects table
+            projectsByPath = {}
+            for project in self.solutionInfo.GetProjectList():
+                path = self.solutionInfo.GetProjectPath(project)
+                level = self.solutionInfo.GetProjectSortOrder(project)
+                if self.database.AddProject(project, path, level) is None:
+                    self.config.messagePrinter.error("The projects \"{0}\" and \"{1}\" have the same path \"{2}\". Exiting!".format(projectsByPath[toPosixPath(path)], project, path))
+                    return False
+                projectsByPath[toPosixPath(path)] = project
+        
+        if self.pipeline:
+            if self.jobs > 1:
+                self.config.messagePrinter.info("--jobs is ignored by --pipeline")
+            
+            pipeline = _ScanPipeline(self, isIncremental, storedFileStats)
+            if not pipeline.Run():
+                return False
+            
+            processedCounter = pipeline.processedCounter
+            skippedCounter = pipeline.skippedCounter
+            skippedBytesCounter = pipeline.skippedBytesCounter
+            removedSolPaths = pipeline.removedSolPaths
+            addedSolPaths = pipeline.addedSolPaths
+            
+            if isIncremental:
+                self.config.messagePrinter.info("Incremental scan: {0} new or modified, {1} removed, {2} unchanged files".format(processedCounter, len(removedSolPaths), pipeline.unchangedCounter))
                 
-                # Apply the file filter (including only the .cpp, .c, .h and .hpp files presumably)
-                # The filter is specified in the .ini file.
-                if self.fileFilter and (self.fileFilter.IsIncluded(filepath) and not self.fileFilter.IsExcluded(filepath)):
-                    # Get the paths relative to the solution and workout the project folder that
-                    # the file is located in.
-                    solPath = self.solutionInfo.GetPathRelativeToSolution(filepath)
-                    project = self.solutionInfo.GetProjectName(filepath)
-                    
-                    # Add the file and the includes to the database.
-                    if self.isDbOpen:
-                        self.database.AddFile(name, project, solPath, exists = True)
-                        
-                        # Process includes
-                        internalIncludes, externalIncludes = self.GetIncludes(filepath)
-                        
-                        for i in internalIncludes:
-                            self.AddIncludeTupleToDatabase(filepath, solPath, i, isLocalInclude = True)
-                        
-                        for i in externalIncludes:
-                            self.AddIncludeTupleToDatabase(filepath, solPath, i, isLocalInclude = False)
-                        
-                        processedCounter = processedCounter + 1
-                    else:
-                        self.config.messagePrinter.error("Error, database not open!")
+                for solPath in removedSolPaths:
+                    self.database.RemoveFile(solPath)
+        else:
+            filepaths, skippedCounter = self.GetFilesToScan()
+            
+            # Record the state of the files before they are parsed. A file that is modified while we
+            # are parsing it will then be parsed again by the next incremental scan.
+            fileStats = {}
+            for filepath in filepaths:
+                fileStats[filepath] = self.GetFileStat(filepath)
+            
+            if isIncremental:
+                unchangedCount = len(filepaths)
+                filepaths, removedSolPaths, addedSolPaths = self.GetChangedFiles(filepaths, fileStats, storedFileStats)
+                unchangedCount -= len(filepaths)
+                
+                self.config.messagePrinter.info("Incremental scan: {0} new or modified, {1} removed, {2} unchanged files".format(len(filepaths), len(removedSolPaths), unchangedCount))
+                
+                for solPath in removedSolPaths:
+                    self.database.RemoveFile(solPath)
+                
+                self.database.SaveProgress()
+            
+            pool = None
+            if self.jobs > 1 and len(filepaths) > 0:
+                self.config.messagePrinter.info("Scanning {0} files using {1} jobs".format(len(filepaths), self.jobs))
+                pool = multiprocessing.Pool(self.jobs, _InitScanWorker, (self,))
+                chunkSize = max(1, min(64, len(filepaths) // (self.jobs * 4)))
+                scanResults = pool.imap(_ScanFileWorker, filepaths, chunkSize)
+            else:
+                scanResults = (self.ScanFile(filepath) for filepath in filepaths)
+            
+            # Populate CodeFile and IncludeDirective tables
+            processedCounter = 0
+            skippedBytesCounter = 0
+            try:
+                for scanResult in scanResults:
+                    filepath = filepaths[processedCounter]
+                    if scanResult is None:
+                        self.config.messagePrinter.error("Error, failed to scan {0}".format(repr(filepath)))
                         return False
-
+                    
+                    self.WriteScanResult(scanResult, fileStats[filepath], isIncremental)
+                    skippedBytesCounter += scanResult[5]
+                    
+                    processedCounter = processedCounter + 1
                     if processedCounter % 1000 == 0:
-                        self.database.SaveProgress() 
                         self.config.messagePrinter.info("Processed {0: >4}, skipped {1: >6} files".format(processedCounter, skippedCounter))
-                else:
-                    skippedCounter = skippedCounter + 1
-                    
-        self.database.SaveProgress()
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                    pool.join()
+        
+        addedIndexSolPaths, removedIndexSolPaths = self.UpdateStoredFileIndex()
+        if isIncremental:
+            # Any file can be included, not just the scanned ones.
+            changedSolPaths = set(addedSolPaths + removedSolPaths) | addedIndexSolPaths | removedIndexSolPaths
+            if len(changedSolPaths) > 0:
+                includeFilenames = set([posixpath.basename(solPath) for solPath in changedSolPaths])
+                updatedCounter = self.ReresolveIncludes(includeFilenames)
+                self.config.messagePrinter.info("Resolved {0} includes of added or removed files again".format(updatedCounter))
+        
+        if isIncremental:
+            self.database.UpdateProjectDependencies()
+            self.database.SaveProgress()
+        else:
+            self.database.EndBulkLoad()
         self.config.messagePrinter.info("Processed {0: >4}, skipped {1: >6} files".format(processedCounter, skippedCounter))
+        if self.includeScanLines is not None or self.stopAtDeclaration:
+            self.config.messagePrinter.info("Skipped reading {0} bytes past the #include regions".format(skippedBytesCounter))
+        
+        return True
+    
+    # UpdateFiles
+    #   Brings the database up to date with the files in the list, see _InotifyWatcher.Wait, and
+    #   commits the changes. storedFileStats holds the file states recorded in the database, as
+    #   returned by GetFileStats(), and is kept up to date.
+    #   
+    #   The files are compared with their recorded states like in an incremental scan: modified and
+    #   added files are parsed again, removed files are removed and the #include directives that
+    #   could refer to the added or removed files, scanned or not, are resolved again.
+    def UpdateFiles(self, filepaths, isComplete, storedFileStats):
+        modifiedCounter = 0
+        addedSolPaths = []
+        removedSolPaths = []
+        
+        # Bring the file index up to date before any file is parsed. The solution files of a complete
+        # list are those of the walk that produced it, see UpdateStoredFileIndex.
+        fileStats = {}
+        isIndexChanged = self.fileIndex is None
+        addedIndexSolPaths = set()
+        removedIndexSolPaths = set()
+        for filepath in filepaths:
+            try:
+                fileStats[filepath] = self.GetFileStat(filepath)
+            except OSError:
+                fileStats[filepath] = None
+            
+            if self.fileIndex is not None:
+                indexKey = os.path.normcase(filepath)
+                if fileStats[filepath] is not None and indexKey not in self.fileIndex:
+                    self.fileIndex.add(indexKey)
+                    isIndexChanged = True
+                elif fileStats[filepath] is None and indexKey in self.fileIndex:
+                    self.fileIndex.discard(indexKey)
+                    isIndexChanged = True
+            
+            if not isComplete:
+                solPath = self.solutionInfo.GetPathRelativeToSolution(filepath)
+                if fileStats[filepath] is not None and solPath not in self.solutionFiles:
+                    self.solutionFiles.add(solPath)
+                    addedIndexSolPaths.add(solPath)
+                elif fileStats[filepath] is None and solPath in self.solutionFiles:
+                    self.solutionFiles.discard(solPath)
+                    removedIndexSolPaths.add(solPath)
+        
+        if isComplete:
+            addedIndexSolPaths, removedIndexSolPaths = self.UpdateStoredFileIndex()
+        else:
+            self.database.RemoveSolutionFiles(removedIndexSolPaths)
+            self.database.AddSolutionFiles(addedIndexSolPaths)
+        
+        # The cached include search results may name removed files or miss the added ones.
+        if isIndexChanged:
+            self.includeSearchCache = {}
+        
+        if isComplete:
+            remainingSolPaths = set(storedFileStats.keys())
+        
+        for filepath in filepaths:
+            solPath = self.solutionInfo.GetPathRelativeToSolution(filepath)
+            if isComplete:
+                remainingSolPaths.discard(solPath)
+            
+            fileStat = fileStats[filepath]
+            if fileStat is None or not self.fileFilter or not self.fileFilter.IsIncluded(filepath) or self.fileFilter.IsExcluded(filepath):
+                if solPath in storedFileStats:
+                    del storedFileStats[solPath]
+                    removedSolPaths.append(solPath)
+                continue
+            
+            storedFileStat = storedFileStats.get(solPath)
+            fileState, contentHash = self.CompareFileStat(filepath, solPath, fileStat, storedFileStats)
+            if fileState == self.fileUnchanged:
+                storedFileStats[solPath] = storedFileStat
+                continue
+            if fileState == self.fileTouched:
+                self.database.AddFileStat(solPath, fileStat[0], fileStat[1], contentHash)
+                storedFileStats[solPath] = (fileStat[0], fileStat[1], contentHash)
+                continue
+            
+            # The file can be removed before we get to read it, its removal is then seen next time.
+            try:
+                with open(filepath, 'rb') as reader:
+                    data = reader.read()
+            except IOError:
+                continue
+            
+            scanResult = self.ScanFile(filepath, data)
+            self.WriteScanResult(scanResult, fileStat, isIncremental = True)
+            storedFileStats[solPath] = (fileStat[0], fileStat[1], scanResult[4])
+            
+            if fileState == self.fileAdded:
+                addedSolPaths.append(solPath)
+            else:
+                modifiedCounter = modifiedCounter + 1
+        
+        if isComplete:
+            for solPath in remainingSolPaths:
+                del storedFileStats[solPath]
+                removedSolPaths.append(solPath)
+        
+        for solPath in removedSolPaths:
+            self.database.RemoveFile(solPath)
+        
+        updatedCounter = 0
+        changedSolPaths = set(addedSolPaths + removedSolPaths) | addedIndexSolPaths | removedIndexSolPaths
+        if len(changedSolPaths) > 0:
+            includeFilenames = set([posixpath.basename(solPath) for solPath in changedSolPaths])
+            updatedCounter = self.ReresolveIncludes(includeFilenames)
+        
+        self.database.SaveProgress()
+        self.database.UpdateProjectDependencies()
+        
+        if modifiedCounter > 0 or len(changedSolPaths) > 0:
+            self.config.messagePrinter.info("Updated {0} modified, {1} added and {2} removed files, resolved {3} includes again".format(modifiedCounter, len(addedSolPaths), len(removedSolPaths), updatedCounter))
+    
+    # Watch
+    #   Keeps the database up to date with the files of the solution until interrupted, see
+    #   UpdateFiles. The files are watched with inotify where it is available, otherwise the solution
+    #   is walked every pollInterval seconds. Must be called after PopulateDatabase.
+    def Watch(self, pollInterval):
+        storedFileStats = self.database.GetFileStats()
+        
+        try:
+            watcher = _InotifyWatcher(self)
+            self.config.messagePrinter.info("Watching {0} for changes with inotify".format(os.path.relpath(self.config.sourcePath)))
+        except OSError as e:
+            watcher = _PollingWatcher(self, pollInterval)
+            self.config.messagePrinter.info("inotify isn't available ({0}), checking {1} for changes every {2} seconds".format(e, os.path.relpath(self.config.sourcePath), pollInterval))
+        
+        try:
+            while True:
+                try:
+                    filepaths, isComplete = watcher.Wait()
+                except OSError as e:
+                    # E.g. the limit on the number of inotify watches was reached by a new directory.
+                    watcher.Close()
+                    watcher = _PollingWatcher(self, pollInterval)
+                    self.config.messagePrinter.error("Failed to watch for changes ({0}), checking for changes every {1} seconds instead".format(e, pollInterval))
+                    filepaths, isComplete = watcher.Wait()
+                
+                self.UpdateFiles(filepaths, isComplete, storedFileStats)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.Close()
         
         return True
     
@@ -786,8 +2621,8 @@ def PrintExampleConfig():
 [Output]
 ; The special :memory: filename creates an in-memory database that is
 ; deleted once the script exits. If you want to keep the database
-; give it a proper filename but note that it will cost you a slight
-; performance hit.
+; give it a proper filename. The database is built in bulk-load mode
+; so a file database costs about the same to build as an in-memory one.
 DatabaseFilename:   :memory:
 HtmlFilename:       IncludeDependencyMatrix.html
 
@@ -799,6 +2634,10 @@ IncludePatterns:
     .*\.c$
 ExcludePatterns:
     .*moc_.*
+; Directories whose full path matches one of these patterns are not
+; walked at all. Much faster than excluding all of their files.
+ExcludeDirectories:
+    .*[/\\\\]\.git$
 
 ; Solution path is relative to the script path
 [Paths]
@@ -869,7 +2708,12 @@ ProjectGroupsList: {
 # ################################################################################################ #
 def Main(argv):
     # Try and initialise the configuration file
-    config = DependencyScriptConfiguration(argv)
+    config = DependencyScriptConfiguration()
+    
+    config.argparser.add_argument('--watch', action='store_true', default=False, dest='watch', help='Keep running after the scan and update the database as the files change, until interrupted. The changes are seen with inotify where it is available, otherwise by checking the files every --watch-interval seconds. Implies --incremental. The database must be a file for the other scripts to see the updates.')
+    config.argparser.add_argument('--watch-interval', type=float, default=1.0, dest='watchInterval', metavar='<seconds>', help='How often --watch checks the files for changes when inotify isn\'t available. Default: %(default)s.')
+    
+    config.Configure(argv)
     
     if config.printExampleConfig:
         PrintExampleConfig()
@@ -879,6 +2723,14 @@ def Main(argv):
             config.messagePrinter.error("Exiting.")
             sys.exit(1)
         
+        if config.watch:
+            if config.databaseFilename == ':memory:':
+                config.messagePrinter.error("--watch needs a database file, the in-memory database would be lost. Exiting.")
+                sys.exit(1)
+            
+            # A restarted watch only has to scan what changed while it wasn't running.
+            config.incremental = True
+        
         # Time the execution of our script.
         config.messagePrinter.referenceTime = time.clock()
         
@@ -887,6 +2739,8 @@ def Main(argv):
         processor = SolutionProcessor(config, fileFilter)
         
         success = processor.PopulateDatabase()
+        if success and config.watch:
+            success = processor.Watch(config.watchInterval)
         processor.Close()
         
         if not success:
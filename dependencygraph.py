@@ -0,0 +1,193 @@
+#!/usr/bin/python2
+
+# ################################################################################################ #
+# Dependency Graph                                                                                 #
+#                                                                                                  #
+# Graph algorithms over dependency graphs given as adjacency lists of integer node indices, e.g.   #
+# the project rows of a DependencyMatrix. Used by the dependencymatrix.py module.                  #
+# ################################################################################################ #
+
+# FindStronglyConnectedComponents
+#   Finds the strongly connected components of a graph with Tarjan's algorithm. adjacency is a list
+#   of the lists of the successors of each node. Returns the list of the components, each a list of
+#   node indices, and the list of the component index of each node.
+#
+#   The components are in reverse topological order: no component has an edge to a component that
+#   comes after it. The search is iterative so that long dependency chains don't hit the recursion
+#   limit.
+def FindStronglyConnectedComponents(adjacency):
+    nodeCount = len(adjacency)
+    visitIndex = [None] * nodeCount
+    lowLink = [0] * nodeCount
+    isOnStack = [False] * nodeCount
+    stack = []
+    components = []
+    componentIndices = [None] * nodeCount
+    nextVisitIndex = 0
+    
+    for root in xrange(nodeCount):
+        if visitIndex[root] is not None:
+            continue
+        
+        visitIndex[root] = lowLink[root] = nextVisitIndex
+        nextVisitIndex += 1
+        stack.append(root)
+        isOnStack[root] = True
+        
+        # The path being searched as (node, index of the next edge to follow) pairs.
+        path = [(root, 0)]
+        while path:
+            node, edgeIndex = path[-1]
+            successors = adjacency[node]
+            if edgeIndex < len(successors):
+                path[-1] = (node, edgeIndex + 1)
+                successor = successors[edgeIndex]
+                if visitIndex[successor] is None:
+                    visitIndex[successor] = lowLink[successor] = nextVisitIndex
+                    nextVisitIndex += 1
+                    stack.append(successor)
+                    isOnStack[successor] = True
+                    path.append((successor, 0))
+                elif isOnStack[successor] and visitIndex[successor] < lowLink[node]:
+                    lowLink[node] = visitIndex[successor]
+                continue
+            
+            path.pop()
+            if path and lowLink[node] < lowLink[path[-1][0]]:
+                lowLink[path[-1][0]] = lowLink[node]
+            
+            if lowLink[node] == visitIndex[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    isOnStack[member] = False
+                    componentIndices[member] = len(components)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    
+    return (components, componentIndices)
+
+# FindFeedbackEdges
+#   Returns a list of (node, successor) edges of a strongly connected component, as found by
+#   FindStronglyConnectedComponents, whose removal breaks all of the cycles of the component, and
+#   whether the list is minimal.
+#
+#   The list starts out as all of the edges of the component and each edge is then put back if the
+#   component stays acyclic with it, the heaviest edges first when getEdgeWeight is given. This
+#   leaves a minimal list, no edge can be left out of it, but not necessarily the smallest one as
+#   finding that is NP-hard. Putting an edge back takes a search of the component so when trying all
+#   of the edges would visit more than maxReductionCost edges in total the list starts out as the
+#   back edges of a depth first search of the component instead, which already break all of its
+#   cycles. The weights then only decide which of those are put back. If even that is too costly
+#   the back edges are returned as they are.
+def FindFeedbackEdges(adjacency, component, componentIndices, getEdgeWeight = None, maxReductionCost = 10000000):
+    componentIndex = componentIndices[component[0]]
+    isOnPath = {}
+    backEdges = []
+    componentEdges = []
+    
+    for root in component:
+        if root in isOnPath:
+            continue
+        
+        isOnPath[root] = True
+        path = [(root, 0)]
+        while path:
+            node, edgeIndex = path[-1]
+            successors = adjacency[node]
+            if edgeIndex < len(successors):
+                path[-1] = (node, edgeIndex + 1)
+                successor = successors[edgeIndex]
+                if componentIndices[successor] != componentIndex:
+                    continue
+                
+                componentEdges.append((node, successor))
+                if successor not in isOnPath:
+                    isOnPath[successor] = True
+                    path.append((successor, 0))
+                elif isOnPath[successor]:
+                    backEdges.append((node, successor))
+                continue
+            
+            isOnPath[node] = False
+            path.pop()
+    
+    if len(componentEdges) * len(componentEdges) <= maxReductionCost:
+        candidateEdges = list(componentEdges)
+    elif len(backEdges) * len(componentEdges) <= maxReductionCost:
+        candidateEdges = list(backEdges)
+    else:
+        return (backEdges, False)
+    
+    removedEdges = set(candidateEdges)
+    if getEdgeWeight is not None:
+        candidateEdges.sort(key=getEdgeWeight, reverse=True)
+    
+    for node, successor in candidateEdges:
+        # Putting the edge back closes a cycle if the node can be reached from the successor.
+        if node != successor and not _IsReachable(adjacency, successor, node, componentIndex, componentIndices, removedEdges):
+            removedEdges.discard((node, successor))
+    
+    return ([edge for edge in componentEdges if edge in removedEdges], True)
+
+# Returns whether the target node can be reached from the source node within a component, without
+# following the excluded edges.
+def _IsReachable(adjacency, source, target, componentIndex, componentIndices, excludedEdges):
+    visited = set([source])
+    stack = [source]
+    while stack:
+        node = stack.pop()
+        if node == target:
+            return True
+        
+        for successor in adjacency[node]:
+            if successor not in visited and componentIndices[successor] == componentIndex and (node, successor) not in excludedEdges:
+                visited.add(successor)
+                stack.append(successor)
+    
+    return False
+
+# GetBitIndices
+#   Returns the sorted indices of the set bits of a bitset held in a (long) integer.
+def GetBitIndices(bits):
+    return [index for index, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1']
+
+# TransitiveClosure class
+#   The reachability of every node of a graph (see FindStronglyConnectedComponents for the adjacency
+#   format), computed for all of the nodes in one pass. The graph is condensed into its strongly
+#   connected components and the set of the nodes reachable from each component is propagated as a
+#   bitset from the components that it depends on, which the condensation's reverse topological
+#   order guarantees are done first.
+class TransitiveClosure(object):
+    def __init__(self, adjacency):
+        self.components, self.componentIndices = FindStronglyConnectedComponents(adjacency)
+        
+        # The bitset of the nodes reachable from each component, its own nodes included.
+        self.componentReach = []
+        for componentIndex, component in enumerate(self.components):
+            reach = 0
+            for node in component:
+                reach |= 1 << node
+                for successor in adjacency[node]:
+                    successorComponentIndex = self.componentIndices[successor]
+                    if successorComponentIndex != componentIndex:
+                        reach |= self.componentReach[successorComponentIndex]
+            self.componentReach.append(reach)
+    
+    # Returns the bitset of the nodes reachable from the node, the node itself excluded.
+    def GetReachBits(self, node):
+        return self.componentReach[self.componentIndices[node]] & ~(1 << node)
+    
+    # Returns the sorted indices of the nodes reachable from the node, the node itself excluded.
+    def GetReachable(self, node):
+        return GetBitIndices(self.GetReachBits(node))
+    
+    def IsReachable(self, node, otherNode):
+        return node != otherNode and bool(self.componentReach[self.componentIndices[node]] & (1 << otherNode))
+    
+    # Returns the list of the components of the graph, see FindStronglyConnectedComponents.
+    def GetComponents(self):
+        return self.components
+
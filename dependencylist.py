@@ -17,74 +17,162 @@ import re
 import string
 import time
 import sqlite3
-from collections import OrderedDict
 import json
 import dependencydatabase
+import dependencymatrix
+import dependencygraph
+import dependencyquery
+import socket
 import argparse
 import codecs
 
 config = None
 startTime = time.clock()
 
-def GetDependencieTree(database):
+def GetDependencyMatrix(database, solutionInfo = None):
     global config
     
     if not database.isOpen:
         database.Open()
     
     if database.isOpen:
-        dependencyTree = OrderedDict()
-        
         config.messagePrinter.info('Getting dependency tree')
         
-        return database.QueryProjectDependencieTree()
+        return dependencymatrix.DependencyMatrix(database, solutionInfo)
     else:
         config.messagePrinter.info('SQLite3 database with filename {0} not found.'.format(database.filename))
     
     return None
 
-def GetDependenciesOfProjectsInSet(dependencyTree, dependencySet):
+# Returns a dependencyquery.RemoteDependencyMatrix that answers the queries with the query server
+# listening on the socket, or None if the server can't be reached.
+def GetRemoteDependencyMatrix(socketPath):
     global config
     
-    # dependencySet is expected as a set
-    # dependencySet is expected as a dictionary with string keys and lists of strings as values.
-    setSize = len(dependencySet)
+    try:
+        return dependencyquery.RemoteDependencyMatrix(dependencyquery.DependencyQueryClient(socketPath))
+    except (socket.error, dependencyquery.DependencyQueryError) as e:
+        config.messagePrinter.error('Couldn\'t query the server on {0}: {1}'.format(socketPath, e))
     
-    newSetItems = set()
+    return None
+
+# ServeQueries
+#   Answers queries with the dependencyquery.DependencyQueryServer until stdin is closed, or until
+#   interrupted or terminated when serving a socket.
+def ServeQueries(database, dependencyMatrix):
+    global config
     
-    if setSize > 0:
-        for setItem in dependencySet:
-            if setItem in dependencyTree:
-                dependencies = dependencyTree[setItem]
-                for dependency in dependencies:
-                    if dependency not in dependencySet:
-                        newSetItems.add(dependency)
+    server = dependencyquery.DependencyQueryServer(database, dependencyMatrix, config.messagePrinter)
+    if config.serveSocket == '-':
+        server.ServeStream(sys.stdin, sys.stdout)
     else:
-        config.messagePrinter.error('Empty dependency set has no dependencies. Take your illogical logic home!')
+        try:
+            server.ServeSocket(config.serveSocket)
+        except dependencyquery.DependencyQueryError as e:
+            config.messagePrinter.error(str(e))
+            return False
     
-    return newSetItems
+    return True
 
-def GetAllProjectDependencies(dependencyTree, targetProject):
+def GetAllProjectDependencies(dependencyMatrix, targetProject):
     global config
     
-    # Seed the set with the desired project.
-    dependencySet = set([ targetProject ])
-    
     config.messagePrinter.info('Building dependency list for ' + targetProject)
     
-    # Iterate over the set of projects and get a set of all the projects that they depend on collectively.
-    newDependencySet = GetDependenciesOfProjectsInSet(dependencyTree, dependencySet)
-    while len(newDependencySet) > 0:
-        # Add the set of the dependencies of the projects already in the set to the set.
-        dependencySet = dependencySet | newDependencySet
-        newDependencySet = GetDependenciesOfProjectsInSet(dependencyTree, dependencySet)
+    dependencySet = dependencyMatrix.GetAllDependencies(targetProject)
     
     config.messagePrinter.info('Finished building dependency list for ' + targetProject)
     
-    dependencySet.discard(targetProject)
-    
     return dependencySet
 
+def GetAllProjectDependents(dependencyMatrix, targetProject):
+    global config
+    
+    config.messagePrinter.info('Building dependent list for ' + targetProject)
+    
+    dependentSet = dependencyMatrix.GetAllDependents(targetProject)
+    
+    config.messagePrinter.info('Finished building dependent list for ' + targetProject)
+    
+    return dependentSet
+
+# Returns the #include directive as it appears in the code file.
+def FormatIncludeDirective(includeText, includeType):
+    if includeType == dependencydatabase.DependencyScriptDatabase.includeTypeSystem:
+        return '#include <{0}>'.format(includeText)
+    return '#include "{0}"'.format(includeText)
+
+# PrintProjectCycles
+#   Prints the cycles in which projects include each other's files along with the #include
+#   directives of the project dependencies that would have to be removed to break them. Returns the
+#   number of cycles found.
+def PrintProjectCycles(dependencyMatrix, database):
+    global config
+    
+    config.messagePrinter.info('Finding project cycles')
+    
+    cycles = dependencyMatrix.GetCycles()
+    for projects, dependencies, isMinimal in cycles:
+        print 'Project cycle: {0}'.format(', '.join(projects))
+        if not isMinimal:
+            config.messagePrinter.info('The dependencies that break the cycle between {0} might not all be needed, the cycle is too large to check.'.format(', '.join(projects)))
+        for project, includeProject in dependencies:
+            directives = database.GetProjectIncludeDirectives(project, includeProject)
+            print '    {0} -> {1} ({2} #include directives)'.format(project, includeProject, len(directives))
+            for solutionPath, lineNumber, includeText, includeType in directives:
+                print '        {0}:{1}: {2}'.format(solutionPath, lineNumber, FormatIncludeDirective(includeText, includeType))
+    
+    config.messagePrinter.info('Found {0} project cycles.'.format(len(cycles)))
+    
+    return len(cycles)
+
+# PrintFileCycles
+#   Prints the cycles in which files #include each other along with the #include directives that
+#   would have to be removed to break them. Returns the number of cycles found.
+def PrintFileCycles(database):
+    global config
+    
+    config.messagePrinter.info('Finding file cycles')
+    
+    pathIds, adjacency = database.GetFileIncludeGraph()
+    components, componentIndices = dependencygraph.FindStronglyConnectedComponents(adjacency)
+    
+    # A file that includes itself is a cycle of its own.
+    cycleComponents = [component for component in components if len(component) > 1 or component[0] in adjacency[component[0]]]
+    
+    cycles = []
+    for component in cycleComponents:
+        edges, isMinimal = dependencygraph.FindFeedbackEdges(adjacency, component, componentIndices)
+        cycles.append((component, edges, isMinimal))
+    
+    cyclePathIds = set([pathIds[index] for component in cycleComponents for index in component])
+    solutionPaths = database.GetSolutionPaths(cyclePathIds)
+    
+    # The directives of the breaking edges, a file can include the same file more than once.
+    edgeDirectives = {}
+    breakingEdges = set([(pathIds[node], pathIds[successor]) for component, edges, isMinimal in cycles for node, successor in edges])
+    for codeFileId, includePathId, solutionPath, lineNumber, includeText, includeType in database.GetIncludeDirectivesOfFiles(set([edge[0] for edge in breakingEdges])):
+        if (codeFileId, includePathId) in breakingEdges:
+            edgeDirectives.setdefault((codeFileId, includePathId), []).append((solutionPath, lineNumber, includeText, includeType))
+    
+    printedCycles = []
+    for component, edges, isMinimal in cycles:
+        files = sorted([solutionPaths[pathIds[index]] for index in component])
+        directives = sorted([directive for node, successor in edges for directive in edgeDirectives.get((pathIds[node], pathIds[successor]), [])])
+        printedCycles.append((files, directives, isMinimal))
+    printedCycles.sort()
+    
+    for files, directives, isMinimal in printedCycles:
+        print 'File cycle: {0}'.format(', '.join(files))
+        if not isMinimal:
+            config.messagePrinter.info('The #include directives that break the cycle between {0} files might not all be needed, the cycle is too large to check.'.format(len(files)))
+        for solutionPath, lineNumber, includeText, includeType in directives:
+            print '    {0}:{1}: {2}'.format(solutionPath, lineNumber, FormatIncludeDirective(includeText, includeType))
+    
+    config.messagePrinter.info('Found {0} file cycles.'.format(len(printedCycles)))
+    
+    return len(printedCycles)
+
 def PrintExampleDotConfig(dependencySet, config=None, indent=" "):
     print indent, "node [fontcolor=black shape=box style=filled fillcolor=dodgerblue1];"
 
@@ -123,13 +211,27 @@ def Main(argv):
     
     config.argparser.add_argument('-r', '--reuse-database', dest='reuseDatabase', action='store_true', default=False, help='Specifies that an existing database is to be used instead of generating one on this run.')
     config.argparser.add_argument('-d', '--direct', dest='directOnly', action='store_true', default=False, help='Only print the direct project dependencies. Otherwise both direct and indirect dependencies are printed.')
-    config.argparser.add_argument('-p', '--project-name', dest='projectName', required=True, action='append', metavar='<project-name>', help='The name of the project for which we will generate the dependency list. The \'?\', \'^\' and \'~\' can be used to: list all known projects, list projects that are not depended on by any other project (top level projects) and list all projects that depend on no other project respectively.')
+    config.argparser.add_argument('-p', '--project-name', dest='projectName', default=[], action='append', metavar='<project-name>', help='The name of the project for which we will generate the dependency list. The \'?\', \'^\' and \'~\' can be used to: list all known projects, list projects that are not depended on by any other project (top level projects) and list all projects that depend on no other project respectively.')
+    config.argparser.add_argument('--dependents', dest='printDependents', action='store_true', default=False, help='Print the projects that depend on the specified project (include files from it) directly or indirectly instead of its dependencies. Can be combined with -d and --all-projects-json.')
+    config.argparser.add_argument('--direct-dependents', dest='printDirectDependents', action='store_true', default=False, help='The same as --dependents -d, only print the projects that depend on the specified project directly.')
+    config.argparser.add_argument('--all-projects-json', dest='printAllProjectsJson', action='store_true', default=False, help='Print a JSON object of all the projects mapped to the sorted lists of their dependencies instead. The dependencies of every project are computed in a single pass. Can be used instead of the -p option.')
+    config.argparser.add_argument('--cycles', dest='printCycles', nargs='?', const='all', default=None, choices=['projects', 'files', 'all'], help='Print the cycles in which projects include each other\'s files and/or in which files include each other instead, along with the #include directives that would have to be removed to break them. The script exits with an error code if any cycles are found. Can be used instead of the -p option.')
+    config.argparser.add_argument('--serve', dest='serveSocket', nargs='?', const='-', default=None, metavar='<socket-path>', help='Load the database once and answer JSON queries, one per line, on a Unix socket at the given path, or on stdin and stdout if no path is given, instead. See the dependencyquery.py module for the queries. Can be used instead of the -p option.')
+    config.argparser.add_argument('--server', dest='serverSocket', metavar='<socket-path>', help='Answer the query with the server started with --serve on the Unix socket at the given path instead of loading the database. The output is the same. Can\'t be combined with --cycles.')
     config.argparser.add_argument('--dot', dest='printDot', action='store_true', default=False, help='Instead of printing the dependencies print a dot graph instead.')
     config.argparser.add_argument('--example-dot-config', dest='exampleDot', action='store_true', default=False, help='Prints an example dot configuration on stdout. Only projects that would have been printed without this option will be included in the configuration.')
     config.argparser.add_argument('--dot-config', dest='dotConfig', metavar='<dot-config-file>', help='The contents of this file will be added to the generated graph output before the edges are specified.')
 
     config.Configure(argv)
     
+    if not config.projectName and not config.printAllProjectsJson and config.printCycles is None and config.serveSocket is None and not config.printExampleConfig:
+        config.argparser.error('argument -p/--project-name is required')
+    if config.serverSocket is not None and (config.printCycles is not None or config.serveSocket is not None):
+        config.argparser.error('argument --server: not allowed with argument --cycles or --serve')
+    if config.serveSocket == '-' and config.verbose:
+        # The responses are written to stdout.
+        config.argparser.error('argument --verbose: not allowed when serving stdin with --serve')
+    
     if config.printExampleConfig:
         dependencydatabase.PrintExampleConfig()
     else:
@@ -138,7 +240,12 @@ def Main(argv):
         
         slnProcessor = None
         database = None
-        if config.reuseDatabase and os.path.exists(config.databaseFilename):
+        dependencyMatrix = None
+        if config.serverSocket is not None:
+            dependencyMatrix = GetRemoteDependencyMatrix(config.serverSocket)
+            if dependencyMatrix is None:
+                return False
+        elif config.reuseDatabase and os.path.exists(config.databaseFilename):
             database = dependencydatabase.DependencyScriptDatabase(config.databaseFilename, messagePrinter=config.messagePrinter)
         elif config.isConfigured:
             fileFilter = dependencydatabase.FileFilter(config)
@@ -148,11 +255,40 @@ def Main(argv):
             else:
                 slnProcessor.database.close()
 
-        if database is not None:
+        if database is not None or dependencyMatrix is not None:
             # Main part of the script. Set the included/excluded files and recurse into the subdirectories.
-            dependencieTree = GetDependencieTree(database)
+            if config.serveSocket is not None:
+                # The declared dependencies are needed for the dependency violations.
+                solutionInfo = None
+                if config.isConfigured:
+                    solutionInfo = dependencydatabase.SolutionInfo(config)
+                
+                dependencyMatrix = GetDependencyMatrix(database, solutionInfo)
+                if dependencyMatrix is None:
+                    return False
+                
+                return ServeQueries(database, dependencyMatrix)
+            elif dependencyMatrix is None:
+                dependencyMatrix = GetDependencyMatrix(database)
+            
+            # The dependents are answered from the transposed dependency matrix.
+            isDependents = config.printDependents or config.printDirectDependents
+            isDirectOnly = config.directOnly or config.printDirectDependents
 
-            if dependencieTree is not None:
+            if dependencyMatrix is not None and config.printCycles is not None:
+                cycleCount = 0
+                if config.printCycles in ('projects', 'all'):
+                    cycleCount += PrintProjectCycles(dependencyMatrix, database)
+                if config.printCycles in ('files', 'all'):
+                    cycleCount += PrintFileCycles(database)
+                
+                config.messagePrinter.info("Finished.")
+                
+                return cycleCount == 0
+            elif dependencyMatrix is not None and config.printAllProjectsJson:
+                print json.dumps(dependencyMatrix.GetAllDependencyTree(isDirectOnly, isDependents), indent=4)
+            elif dependencyMatrix is not None:
+                dependencieTree = dependencyMatrix.GetDependencyTree()
                 dependencySet = set()
                 for project in config.projectName:
                     if project == '?':
@@ -167,6 +303,14 @@ def Main(argv):
                         for proj in dependencieTree:
                             if len(dependencieTree[proj]) == 0:
                                 dependencySet.add(proj)
+                    elif isDependents:
+                        if dependencyMatrix.GetIndex(project) is None:
+                            config.messagePrinter.error('Couldn\'t find {0} dependents. Are you sure the project exists?'.format(project))
+                            return False
+                        elif isDirectOnly:
+                            dependencySet = dependencyMatrix.GetDependents(project)
+                        else:
+                            dependencySet = GetAllProjectDependents(dependencyMatrix, project)
                     else:
                         if config.directOnly:
                             try:
@@ -175,9 +319,12 @@ def Main(argv):
                                 config.messagePrinter.error('Couldn\'t find {0} dependencies. Are you sure the project exists?'.format(project))
                                 return False
                         else:
-                            dependencySet = GetAllProjectDependencies(dependencieTree, project)
+                            dependencySet = GetAllProjectDependencies(dependencyMatrix, project)
 
-                config.messagePrinter.info('Found {0} dependencies.'.format(str(len(dependencySet))))
+                if isDependents:
+                    config.messagePrinter.info('Found {0} dependents.'.format(str(len(dependencySet))))
+                else:
+                    config.messagePrinter.info('Found {0} dependencies.'.format(str(len(dependencySet))))
 
                 dependencyList = list(dependencySet)
                 dependencyList.sort()
@@ -204,7 +351,7 @@ def Main(argv):
                                 print contents
                         for project in dependencyList:
                             wasPrinted = False
-                            for dependency in dependencieTree[project]:
+                            for dependency in dependencieTree.get(project, []):
                                 if dependency in dependencyList:
                                     print indent, project, "->", dependency, ";"
                                     wasPrinted = True
@@ -0,0 +1,336 @@
+#!/usr/bin/python2
+
+# ################################################################################################ #
+# Dependency Matrix                                                                                #
+#                                                                                                  #
+# The project x project include counts of a database generated by the dependencydatabase.py script #
+# as a sparse matrix. Used by both the dependency2html.py and the dependencylist.py scripts.       #
+# ################################################################################################ #
+
+from array import array
+from collections import OrderedDict
+import dependencygraph
+
+# NumPy is optional. It is used to classify and sum the cells in bulk, see GetTotals.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# DependencyMatrix class
+#   A sparse matrix of the number of #include directives with which the files of each project (the
+#   row) include the files of each project (the column). The projects are in their hierarchy order
+#   so the cells below the diagonal are hierarchy violations.
+#
+#   The matrix is stored as a dictionary of the non-empty cells keyed by their (row, column) indices
+#   together with the sorted column indices of each row and row indices of each column. It is loaded
+#   once from the database's ProjectDependency table.
+class DependencyMatrix(object):
+    # Cell classifications, see ClassifyCell.
+    cellInternal = "internal"
+    cellHierarchyViolation = "hierarchy-violation"
+    cellDependencyViolation = "dependency-violation"
+    cellDependency = "dependency"
+    
+    # How much GetCycles prefers to keep each kind of cell, the violations are the first to go.
+    cycleEdgeRanks = { cellDependency: 2, cellDependencyViolation: 1, cellHierarchyViolation: 0 }
+    
+    # Set to False to use the pure Python implementation even when NumPy is available.
+    useNumPy = numpy is not None
+    
+    def __init__(self, database, solutionInfo = None):
+        self.solutionInfo = solutionInfo
+        
+        # The column indices of the declared dependencies of each row, see _GetDeclaredDependencies.
+        self.declaredDependencies = None
+        
+        # The transitive closures of the rows and of the columns, see GetClosure and
+        # GetReverseClosure.
+        self.closure = None
+        self.reverseClosure = None
+        
+        self.projectIds = []
+        self.projectNames = []
+        self.projectIndices = {}
+        
+        # (row, column) -> (include count, file count)
+        self.cells = {}
+        self.rowColumns = []
+        self.columnRows = []
+        self.rowTotals = array('l')
+        self.columnTotals = array('l')
+        
+        self._Load(database)
+    
+    def _Load(self, database):
+        database.UpdateProjectDependencies()
+        
+        database.cur.execute("SELECT Id, Name FROM ProjectEntry ORDER BY HierarchyLevel ASC, Name DESC")
+        idIndices = {}
+        for projectId, name in database.cur.fetchall():
+            idIndices[projectId] = len(self.projectIds)
+            self.projectIndices[name] = len(self.projectIds)
+            self.projectIds.append(projectId)
+            self.projectNames.append(name)
+        
+        projectCount = len(self.projectIds)
+        self.rowColumns = [[] for i in xrange(projectCount)]
+        self.columnRows = [[] for i in xrange(projectCount)]
+        self.rowTotals = array('l', [0] * projectCount)
+        self.columnTotals = array('l', [0] * projectCount)
+        
+        database.cur.execute("SELECT ProjectId, IncludeProjectId, IncludeCount, FileCount FROM ProjectDependencyEntry")
+        for projectId, includeProjectId, includeCount, fileCount in database.cur.fetchall():
+            rowIndex = idIndices[projectId]
+            columnIndex = idIndices[includeProjectId]
+            self.cells[(rowIndex, columnIndex)] = (includeCount, fileCount)
+            self.rowColumns[rowIndex].append(columnIndex)
+            self.columnRows[columnIndex].append(rowIndex)
+        
+        for indices in self.rowColumns:
+            indices.sort()
+        for indices in self.columnRows:
+            indices.sort()
+        
+        if self.useNumPy:
+            rowIndices, columnIndices, includeCounts = self._GetCellArrays()
+            self.rowTotals = array('l', numpy.bincount(rowIndices, includeCounts, projectCount).astype(numpy.int64).tolist())
+            self.columnTotals = array('l', numpy.bincount(columnIndices, includeCounts, projectCount).astype(numpy.int64).tolist())
+        else:
+            for (rowIndex, columnIndex), (includeCount, fileCount) in self.cells.iteritems():
+                self.rowTotals[rowIndex] += includeCount
+                self.columnTotals[columnIndex] += includeCount
+    
+    # _GetCellArrays
+    #   Returns the NumPy arrays of the row indices, the column indices and the include counts of the
+    #   non-empty cells.
+    def _GetCellArrays(self):
+        cellCount = len(self.cells)
+        rowIndices = numpy.fromiter((cell[0] for cell in self.cells.iterkeys()), numpy.intp, cellCount)
+        columnIndices = numpy.fromiter((cell[1] for cell in self.cells.iterkeys()), numpy.intp, cellCount)
+        includeCounts = numpy.fromiter((counts[0] for counts in self.cells.itervalues()), numpy.int64, cellCount)
+        return (rowIndices, columnIndices, includeCounts)
+    
+    # _GetDeclaredDependencies
+    #   Returns a list of the sets of the column indices of the projects that each row's project
+    #   declares a dependency on in the configuration.
+    def _GetDeclaredDependencies(self):
+        if self.declaredDependencies is None:
+            self.declaredDependencies = []
+            for projectName in self.projectNames:
+                dependencies = set()
+                if self.solutionInfo is not None:
+                    for dependency in self.solutionInfo.GetProjectDependencies(projectName):
+                        columnIndex = self.GetIndex(dependency)
+                        if columnIndex is not None:
+                            dependencies.add(columnIndex)
+                self.declaredDependencies.append(dependencies)
+        
+        return self.declaredDependencies
+    
+    # _GetDeclaredDependencyMask
+    #   Returns the boolean NumPy matrix of the declared dependencies (see _GetDeclaredDependencies).
+    def _GetDeclaredDependencyMask(self):
+        projectCount = len(self.projectNames)
+        mask = numpy.zeros((projectCount, projectCount), dtype=bool)
+        for rowIndex, dependencies in enumerate(self._GetDeclaredDependencies()):
+            mask[rowIndex, list(dependencies)] = True
+        
+        return mask
+    
+    # Returns the sorted column indices of the projects that the row's project declares a dependency on.
+    def GetDeclaredDependencyColumns(self, rowIndex):
+        return sorted(self._GetDeclaredDependencies()[rowIndex])
+    
+    def GetProjectCount(self):
+        return len(self.projectNames)
+    
+    # Returns the row (and column) index of the project or None if the project is unknown.
+    def GetIndex(self, projectName):
+        return self.projectIndices.get(projectName)
+    
+    def GetCount(self, rowIndex, columnIndex):
+        return self.cells.get((rowIndex, columnIndex), (0, 0))[0]
+    
+    def GetFileCount(self, rowIndex, columnIndex):
+        return self.cells.get((rowIndex, columnIndex), (0, 0))[1]
+    
+    # Returns the sorted column indices of the non-empty cells of the row.
+    def GetRowColumns(self, rowIndex):
+        return self.rowColumns[rowIndex]
+    
+    # Returns the sorted row indices of the non-empty cells of the column.
+    def GetColumnRows(self, columnIndex):
+        return self.columnRows[columnIndex]
+    
+    def GetRowTotal(self, rowIndex):
+        return self.rowTotals[rowIndex]
+    
+    def GetColumnTotal(self, columnIndex):
+        return self.columnTotals[columnIndex]
+    
+    # ClassifyCell
+    #   Returns the classification of a cell:
+    #     cellInternal            - the project includes its own files (the diagonal)
+    #     cellHierarchyViolation  - the project includes the files of a project higher up in the
+    #                               hierarchy (below the diagonal)
+    #     cellDependencyViolation - the project includes the files of a project that it doesn't
+    #                               declare a dependency on
+    #     cellDependency          - the project includes the files of one of its dependencies
+    def ClassifyCell(self, rowIndex, columnIndex):
+        if rowIndex == columnIndex:
+            return self.cellInternal
+        elif rowIndex > columnIndex:
+            return self.cellHierarchyViolation
+        elif columnIndex not in self._GetDeclaredDependencies()[rowIndex]:
+            return self.cellDependencyViolation
+        
+        return self.cellDependency
+    
+    # GetTotals
+    #   Returns a dictionary of the cell classifications mapped to the sum of the include counts of
+    #   the cells with that classification. With NumPy all of the cells are classified at once with a
+    #   few array operations.
+    def GetTotals(self):
+        if self.useNumPy:
+            return self._GetTotalsNumPy()
+        
+        totals = dict([(cellClass, 0) for cellClass in [self.cellInternal, self.cellHierarchyViolation, self.cellDependencyViolation, self.cellDependency]])
+        for (rowIndex, columnIndex), (includeCount, fileCount) in self.cells.iteritems():
+            totals[self.ClassifyCell(rowIndex, columnIndex)] += includeCount
+        
+        return totals
+    
+    # The NumPy implementation of GetTotals.
+    def _GetTotalsNumPy(self):
+        rowIndices, columnIndices, includeCounts = self._GetCellArrays()
+        
+        isInternal = (rowIndices == columnIndices)
+        isHierarchyViolation = (rowIndices > columnIndices)
+        isUpper = (rowIndices < columnIndices)
+        isDeclared = self._GetDeclaredDependencyMask()[rowIndices, columnIndices]
+        
+        totals = {}
+        totals[self.cellInternal] = int(includeCounts[isInternal].sum())
+        totals[self.cellHierarchyViolation] = int(includeCounts[isHierarchyViolation].sum())
+        totals[self.cellDependencyViolation] = int(includeCounts[isUpper & ~isDeclared].sum())
+        totals[self.cellDependency] = int(includeCounts[isUpper & isDeclared].sum())
+        
+        return totals
+    
+    # Returns the set of the names of the projects that the project includes files from, the project
+    # itself excluded.
+    def GetDependencies(self, projectName):
+        rowIndex = self.GetIndex(projectName)
+        if rowIndex is None:
+            return set()
+        
+        return set([self.projectNames[columnIndex] for columnIndex in self.rowColumns[rowIndex] if columnIndex != rowIndex])
+    
+    # Returns the set of the names of the projects that include files from the project, the project
+    # itself excluded.
+    def GetDependents(self, projectName):
+        columnIndex = self.GetIndex(projectName)
+        if columnIndex is None:
+            return set()
+        
+        return set([self.projectNames[rowIndex] for rowIndex in self.columnRows[columnIndex] if rowIndex != columnIndex])
+    
+    # GetDependencyTree
+    #   Returns an OrderedDict, sorted by name, of the projects that include any files mapped to their
+    #   dependencies (see GetDependencies).
+    def GetDependencyTree(self):
+        dependencyTree = OrderedDict()
+        for projectName in sorted([self.projectNames[rowIndex] for rowIndex in xrange(len(self.rowColumns)) if self.rowColumns[rowIndex]]):
+            dependencyTree[projectName] = self.GetDependencies(projectName)
+        
+        return dependencyTree
+    
+    # GetClosure
+    #   Returns the dependencygraph.TransitiveClosure of the matrix, which holds the direct and
+    #   indirect dependencies of all of the projects. It is computed once, on first use.
+    def GetClosure(self):
+        if self.closure is None:
+            self.closure = dependencygraph.TransitiveClosure(self.rowColumns)
+        
+        return self.closure
+    
+    # GetReverseClosure
+    #   Returns the dependencygraph.TransitiveClosure of the transposed matrix, which holds the direct
+    #   and indirect dependents of all of the projects. It is computed once, on first use.
+    def GetReverseClosure(self):
+        if self.reverseClosure is None:
+            self.reverseClosure = dependencygraph.TransitiveClosure(self.columnRows)
+        
+        return self.reverseClosure
+    
+    # GetAllDependencies
+    #   Returns the set of the names of the projects that the project depends on directly or
+    #   indirectly, the project itself excluded.
+    def GetAllDependencies(self, projectName):
+        rowIndex = self.GetIndex(projectName)
+        if rowIndex is None:
+            return set()
+        
+        return set([self.projectNames[index] for index in self.GetClosure().GetReachable(rowIndex)])
+    
+    # GetAllDependents
+    #   Returns the set of the names of the projects that depend on the project directly or
+    #   indirectly, the project itself excluded.
+    def GetAllDependents(self, projectName):
+        columnIndex = self.GetIndex(projectName)
+        if columnIndex is None:
+            return set()
+        
+        return set([self.projectNames[index] for index in self.GetReverseClosure().GetReachable(columnIndex)])
+    
+    # GetCycles
+    #   Returns the cycles in which projects include each other's files as a list of (projects,
+    #   breaking dependencies, is minimal) tuples, sorted by the first project. The projects are the
+    #   sorted names of the projects of a strongly connected component of the matrix, the breaking
+    #   dependencies are the (project, included project) pairs whose removal would break all of the
+    #   cycles between them, see dependencygraph.FindFeedbackEdges. The hierarchy violations are
+    #   preferred, then the dependencies that aren't declared and then the dependencies with the
+    #   fewest #include directives, see _GetCycleEdgeWeight.
+    def GetCycles(self):
+        adjacency = [[columnIndex for columnIndex in columnIndices if columnIndex != rowIndex] for rowIndex, columnIndices in enumerate(self.rowColumns)]
+        components, componentIndices = dependencygraph.FindStronglyConnectedComponents(adjacency)
+        
+        cycles = []
+        for component in components:
+            if len(component) < 2:
+                continue
+            
+            edges, isMinimal = dependencygraph.FindFeedbackEdges(adjacency, component, componentIndices, self._GetCycleEdgeWeight)
+            projects = sorted([self.projectNames[index] for index in component])
+            dependencies = sorted([(self.projectNames[rowIndex], self.projectNames[columnIndex]) for rowIndex, columnIndex in edges])
+            cycles.append((projects, dependencies, isMinimal))
+        
+        cycles.sort()
+        return cycles
+    
+    # _GetCycleEdgeWeight
+    #   Returns the weight of a (row, column) cell for GetCycles, the heaviest cells are the last to
+    #   be chosen for breaking a cycle. Cells are compared by their classification (see
+    #   cycleEdgeRanks), then by whether they are declared, which only tells the hierarchy violations
+    #   apart, and then by their include count.
+    def _GetCycleEdgeWeight(self, edge):
+        rowIndex, columnIndex = edge
+        isDeclared = columnIndex in self._GetDeclaredDependencies()[rowIndex]
+        return (self.cycleEdgeRanks[self.ClassifyCell(rowIndex, columnIndex)], isDeclared, self.GetCount(rowIndex, columnIndex))
+    
+    # GetAllDependencyTree
+    #   Returns an OrderedDict, sorted by name, of all of the projects mapped to the sorted lists of
+    #   the names of their direct and indirect (or only their direct if isDirectOnly is set)
+    #   dependencies, or dependents if isDependents is set.
+    def GetAllDependencyTree(self, isDirectOnly = False, isDependents = False):
+        if isDependents:
+            getProjects = self.GetDependents if isDirectOnly else self.GetAllDependents
+        else:
+            getProjects = self.GetDependencies if isDirectOnly else self.GetAllDependencies
+        
+        allDependencies = OrderedDict()
+        for projectName in sorted(self.projectNames):
+            allDependencies[projectName] = sorted(getProjects(projectName))
+        
+        return allDependencies
@@ -0,0 +1,293 @@
+#!/usr/bin/python2
+
+# ################################################################################################ #
+# Dependency Query                                                                                 #
+#                                                                                                  #
+# A query server that keeps a database generated by the dependencydatabase.py script and its       #
+# dependency matrix loaded between queries, and its client. Used by the --serve and --server       #
+# options of the dependencylist.py script.                                                         #
+# ################################################################################################ #
+
+import os
+import stat
+import signal
+import socket
+import threading
+import SocketServer
+import json
+from collections import OrderedDict
+import dependencydatabase
+import dependencymatrix
+
+# DependencyQueryError class
+#   Raised for invalid queries by the server and for the error responses by the client.
+class DependencyQueryError(Exception):
+    pass
+
+# DependencyQueryServer class
+#   Answers queries from a database and its DependencyMatrix. The queries and their responses are
+#   JSON objects, one per line. A query names the query and its arguments, e.g.
+#   {"query": "deps", "project": "MyLibrary", "direct": false}, and is answered with
+#   {"result": <result>} or {"error": "<message>"}. The "id" of a query, if any, is copied into its
+#   response. The project arguments are names and the direct and dependents arguments are booleans
+#   that default to false. The queries are:
+#     projects                            - the project names in hierarchy order
+#     tree                                - the projects that include any files mapped to their
+#                                           direct dependencies, see GetDependencyTree
+#     deps, dependents (project, direct)  - the sorted dependencies or dependents of a project
+#     closure (direct, dependents)        - all of the projects mapped to their dependencies or
+#                                           dependents, see GetAllDependencyTree
+#     violations                          - the hierarchy and dependency violation cells
+#     details (project, includeProject)   - the #include directives of a cell
+class DependencyQueryServer(object):
+    # How often, in seconds, ServeSocket checks whether it has been asked to stop.
+    stopPollInterval = 0.5
+    
+    def __init__(self, database, dependencyMatrix, messagePrinter):
+        self.database = database
+        self.dependencyMatrix = dependencyMatrix
+        self.messagePrinter = messagePrinter
+        
+        # The database connections of the threads that serve the socket's clients.
+        self.threadState = threading.local()
+        
+        self.queryHandlers = {
+            "projects": self._QueryProjects,
+            "tree": self._QueryTree,
+            "deps": self._QueryDependencies,
+            "dependents": self._QueryDependents,
+            "closure": self._QueryClosure,
+            "violations": self._QueryViolations,
+            "details": self._QueryDetails
+        }
+        
+        # Compute the closures up front so that the first queries are as fast as the rest.
+        self.dependencyMatrix.GetClosure()
+        self.dependencyMatrix.GetReverseClosure()
+    
+    # Returns the database of the calling thread, see ServeSocket.
+    def _GetDatabase(self):
+        return getattr(self.threadState, "database", self.database)
+    
+    def _GetProjectIndex(self, request, key = "project"):
+        projectName = request.get(key)
+        if not isinstance(projectName, basestring):
+            raise DependencyQueryError("The {0} argument must be a project name.".format(key))
+        
+        projectIndex = self.dependencyMatrix.GetIndex(projectName)
+        if projectIndex is None:
+            raise DependencyQueryError("Unknown project: {0}".format(projectName))
+        return projectIndex
+    
+    def _GetFlag(self, request, key):
+        value = request.get(key, False)
+        if not isinstance(value, bool):
+            raise DependencyQueryError("The {0} argument must be true or false.".format(key))
+        return value
+    
+    def _QueryProjects(self, request):
+        return self.dependencyMatrix.projectNames
+    
+    def _QueryTree(self, request):
+        dependencyTree = self.dependencyMatrix.GetDependencyTree()
+        for projectName in dependencyTree:
+            dependencyTree[projectName] = sorted(dependencyTree[projectName])
+        return dependencyTree
+    
+    def _QueryDependencies(self, request):
+        projectName = self.dependencyMatrix.projectNames[self._GetProjectIndex(request)]
+        if self._GetFlag(request, "direct"):
+            return sorted(self.dependencyMatrix.GetDependencies(projectName))
+        return sorted(self.dependencyMatrix.GetAllDependencies(projectName))
+    
+    def _QueryDependents(self, request):
+        projectName = self.dependencyMatrix.projectNames[self._GetProjectIndex(request)]
+        if self._GetFlag(request, "direct"):
+            return sorted(self.dependencyMatrix.GetDependents(projectName))
+        return sorted(self.dependencyMatrix.GetAllDependents(projectName))
+    
+    def _QueryClosure(self, request):
+        return self.dependencyMatrix.GetAllDependencyTree(self._GetFlag(request, "direct"), self._GetFlag(request, "dependents"))
+    
+    # Returns the violating cells of the matrix in row then column order.
+    def _QueryViolations(self, request):
+        violations = []
+        matrix = self.dependencyMatrix
+        for rowIndex in xrange(matrix.GetProjectCount()):
+            for columnIndex in matrix.GetRowColumns(rowIndex):
+                cellClass = matrix.ClassifyCell(rowIndex, columnIndex)
+                if cellClass in (dependencymatrix.DependencyMatrix.cellHierarchyViolation, dependencymatrix.DependencyMatrix.cellDependencyViolation):
+                    violations.append(OrderedDict([
+                        ("project", matrix.projectNames[rowIndex]),
+                        ("includeProject", matrix.projectNames[columnIndex]),
+                        ("type", cellClass),
+                        ("includeCount", matrix.GetCount(rowIndex, columnIndex)),
+                        ("fileCount", matrix.GetFileCount(rowIndex, columnIndex))]))
+        return violations
+    
+    def _QueryDetails(self, request):
+        projectName = self.dependencyMatrix.projectNames[self._GetProjectIndex(request)]
+        includeProjectName = self.dependencyMatrix.projectNames[self._GetProjectIndex(request, "includeProject")]
+        return [OrderedDict([("file", solutionPath), ("line", lineNumber), ("include", includeText), ("type", includeType)]) for solutionPath, lineNumber, includeText, includeType in self._GetDatabase().GetProjectIncludeDirectives(projectName, includeProjectName)]
+    
+    # HandleRequest
+    #   Returns the response line to a query line. Any query, however malformed, gets a response so
+    #   that it can't take the server down.
+    def HandleRequest(self, line):
+        response = OrderedDict()
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise DependencyQueryError("Invalid JSON: {0}".format(e))
+            if not isinstance(request, dict):
+                raise DependencyQueryError("A query must be a JSON object.")
+            if "id" in request:
+                response["id"] = request["id"]
+            
+            query = request.get("query")
+            if not isinstance(query, basestring) or query not in self.queryHandlers:
+                raise DependencyQueryError("Unknown query: {0}".format(query))
+            
+            response["result"] = self.queryHandlers[query](request)
+        except DependencyQueryError as e:
+            response["error"] = str(e)
+        except Exception as e:
+            self.messagePrinter.error("Failed to answer the query {0}: {1}".format(line.strip(), repr(e)))
+            response["error"] = "Failed to answer the query: {0}".format(e)
+        
+        return json.dumps(response) + "\n"
+    
+    # ServeStream
+    #   Answers the query lines read from the input file, e.g. stdin, until it is closed.
+    def ServeStream(self, inputFile, outputFile):
+        # readline() doesn't wait for more input like iterating over the file does.
+        for line in iter(inputFile.readline, ''):
+            if line.strip():
+                outputFile.write(self.HandleRequest(line))
+                outputFile.flush()
+    
+    # ServeSocket
+    #   Answers the queries of the clients that connect to a Unix socket at the path until
+    #   interrupted or terminated. Every connection is served by its own thread with its own
+    #   connection to the database, so a client can keep its connection open and send any number of
+    #   queries over it without holding up the others.
+    def ServeSocket(self, socketPath):
+        if not hasattr(socket, "AF_UNIX"):
+            raise DependencyQueryError("Unix sockets aren't supported on this platform, serve stdin instead.")
+        
+        # A socket file left behind by a server that was killed is replaced, nothing else is.
+        if os.path.exists(socketPath):
+            if not stat.S_ISSOCK(os.stat(socketPath).st_mode):
+                raise DependencyQueryError("{0} exists and isn't a socket.".format(socketPath))
+            
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socketPath)
+            except socket.error:
+                os.remove(socketPath)
+            else:
+                raise DependencyQueryError("A server is already serving queries on {0}.".format(socketPath))
+            finally:
+                probe.close()
+        
+        queryServer = self
+        class RequestHandler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                # An SQLite connection can't be shared by the threads.
+                database = dependencydatabase.DependencyScriptDatabase(queryServer.database.filename)
+                database.Open()
+                queryServer.threadState.database = database
+                try:
+                    queryServer.ServeStream(self.rfile, self.wfile)
+                finally:
+                    database.Close()
+        
+        class UnixStreamServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+            # The clients that are still connected don't keep the server running.
+            daemon_threads = True
+            # How often the stop flag is checked.
+            timeout = self.stopPollInterval
+        
+        # The signals only set a flag. An interrupt raised in the middle of a request can be lost,
+        # e.g. while a socket file object is being closed, and leave the server running.
+        stopSignals = []
+        def Stop(signalNumber, frame):
+            stopSignals.append(signalNumber)
+        
+        server = UnixStreamServer(socketPath, RequestHandler)
+        previousHandlers = dict([(signalNumber, signal.signal(signalNumber, Stop)) for signalNumber in (signal.SIGINT, signal.SIGTERM)])
+        self.messagePrinter.info('Serving queries on {0}'.format(socketPath))
+        try:
+            while not stopSignals:
+                server.handle_request()
+        finally:
+            for signalNumber, handler in previousHandlers.items():
+                signal.signal(signalNumber, handler)
+            server.server_close()
+            os.remove(socketPath)
+
+# DependencyQueryClient class
+#   Sends queries to a DependencyQueryServer over its Unix socket. The connection is kept open for
+#   the lifetime of the client.
+class DependencyQueryClient(object):
+    def __init__(self, socketPath):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socketPath)
+        self.file = self.socket.makefile('rwb')
+    
+    # Returns the result of the query or raises a DependencyQueryError.
+    def Query(self, query, **arguments):
+        arguments["query"] = query
+        self.file.write(json.dumps(arguments) + "\n")
+        self.file.flush()
+        
+        line = self.file.readline()
+        if not line:
+            raise DependencyQueryError("The query server closed the connection.")
+        
+        response = json.loads(line, object_pairs_hook=OrderedDict)
+        if "error" in response:
+            raise DependencyQueryError(response["error"])
+        return response["result"]
+    
+    def Close(self):
+        self.file.close()
+        self.socket.close()
+
+# RemoteDependencyMatrix class
+#   Stands in for the DependencyMatrix methods used by the dependencylist.py script and answers them
+#   with queries to a DependencyQueryServer, so that the script's output is the same either way.
+class RemoteDependencyMatrix(object):
+    def __init__(self, client):
+        self.client = client
+        self.projectNames = client.Query("projects")
+        self.projectIndices = dict([(projectName, index) for index, projectName in enumerate(self.projectNames)])
+    
+    def GetIndex(self, projectName):
+        return self.projectIndices.get(projectName)
+    
+    def GetDependencyTree(self):
+        dependencyTree = self.client.Query("tree")
+        return dict([(projectName, set(dependencies)) for projectName, dependencies in dependencyTree.iteritems()])
+    
+    def GetDependencies(self, projectName):
+        return self._GetProjectSet("deps", projectName, True)
+    
+    def GetDependents(self, projectName):
+        return self._GetProjectSet("dependents", projectName, True)
+    
+    def GetAllDependencies(self, projectName):
+        return self._GetProjectSet("deps", projectName, False)
+    
+    def GetAllDependents(self, projectName):
+        return self._GetProjectSet("dependents", projectName, False)
+    
+    def _GetProjectSet(self, query, projectName, isDirectOnly):
+        # The DependencyMatrix returns an empty set for unknown projects.
+        if self.GetIndex(projectName) is None:
+            return set()
+        return set(self.client.Query(query, project=projectName, direct=isDirectOnly))
+    
+    def GetAllDependencyTree(self, isDirectOnly = False, isDependents = False):
+        return self.client.Query("closure", direct=isDirectOnly, dependents=isDependents)
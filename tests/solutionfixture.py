@@ -0,0 +1,191 @@
+#!/usr/bin/python2
+
+# ################################################################################################ #
+# Solution Fixture                                                                                 #
+#                                                                                                  #
+# Builds throwaway solutions (source files and an INI file) in a temporary directory for the tests #
+# and runs the scripts against them.                                                               #
+# ################################################################################################ #
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import json
+from collections import OrderedDict
+
+repositoryPath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repositoryPath not in sys.path:
+    sys.path.insert(0, repositoryPath)
+
+import dependencydatabase
+import dependency2html
+
+# The projects of the example solution, in hierarchy order, as (name, path, include path,
+# dependencies) tuples. A includes B although only B declares a dependency on A.
+exampleProjects = [
+    ("A", "lib/a/", "lib/a/include", []),
+    ("B", "lib/b/", "lib/b", ["A"]),
+    ("C", "app/c/", None, ["A"]),
+]
+
+# The files of the example solution. They cover local, system, solution relative, project include
+# path and unresolved includes, includes after the first declaration, an indented include, a file
+# that is excluded by its name and one in an excluded directory.
+exampleFiles = {
+    "lib/a/include/a/a.h": '#pragma once\n#include <vector>\n#include "b.h"\n',
+    "lib/a/a.cpp": '// comment\n#include "a/a.h"\n#include <string>\n/* #include "b.h" */\nint x;\n',
+    "lib/b/b.h": '#include <map>\n#include "a/a.h"\n',
+    "lib/b/b.cpp": '#include "b.h"\n#include "lib/b/b.h"\n#include "missing.h"\n',
+    "app/c/c.h": '#include "a/a.h"\n',
+    "app/c/main.cpp": '#include "a/a.h"\n#include "b.h"\n#include "c.h"\n#include <vector>\n  #include "../../lib/b/b.h"\nint main() {}\n#include "late.h"\n',
+    "app/c/late.h": '#include "c.h"\n',
+    "app/c/moc_c.cpp": '#include "a/a.h"\n',
+    "build/gen.cpp": '#include "a/a.h"\n',
+}
+
+# SolutionFixture class
+#   A solution in a temporary directory. The source files are under its src directory and the
+#   configuration file, the database and the report are next to it. Call Close to delete it.
+class SolutionFixture(object):
+    def __init__(self, files = None, projects = None, excludeDirectories = None):
+        self.path = tempfile.mkdtemp(prefix='dep-matrix-test-')
+        self.sourcePath = os.path.join(self.path, "src")
+        os.mkdir(self.sourcePath)
+        
+        if files is None:
+            files = exampleFiles
+        if projects is None:
+            projects = exampleProjects
+        if excludeDirectories is None:
+            excludeDirectories = [".*[/\\\\]build$"]
+        
+        for solutionPath, contents in files.items():
+            self.WriteFile(solutionPath, contents)
+        
+        self.projects = projects
+        self.excludeDirectories = excludeDirectories
+        self.configFilename = self.WriteConfig("deps.db")
+    
+    def Close(self):
+        shutil.rmtree(self.path)
+    
+    # Returns the absolute path of a file of the solution.
+    def GetPath(self, solutionPath):
+        return os.path.join(self.sourcePath, *solutionPath.split("/"))
+    
+    def WriteFile(self, solutionPath, contents):
+        filepath = self.GetPath(solutionPath)
+        if not os.path.isdir(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+        with open(filepath, "wb") as writer:
+            writer.write(contents)
+    
+    def RemoveFile(self, solutionPath):
+        os.remove(self.GetPath(solutionPath))
+    
+    # Returns the absolute path of a file next to the configuration file.
+    def GetOutputPath(self, filename):
+        return os.path.join(self.path, filename)
+    
+    # WriteConfig
+    #   Writes a configuration file for the solution whose database has the given filename and
+    #   returns its path.
+    def WriteConfig(self, databaseFilename, configFilename = None):
+        if configFilename is None:
+            configFilename = os.path.splitext(databaseFilename)[0] + ".ini"
+        
+        projectObjects = []
+        for name, path, includePath, dependencies in self.projects:
+            project = OrderedDict([("type", "project"), ("name", name), ("path", path)])
+            if includePath is not None:
+                project["include-path"] = includePath
+            project["dependencies"] = dependencies
+            projectObjects.append(project)
+        groups = { "type": "list", "object": [{ "type": "group", "name": "Group", "description": "The test projects", "projects": projectObjects }] }
+        
+        lines = [
+            "[Output]",
+            "DatabaseFilename: " + self.GetOutputPath(databaseFilename),
+            "HtmlFilename: " + self.GetOutputPath(os.path.splitext(databaseFilename)[0] + ".html"),
+            "",
+            "[FileFilter]",
+            "IncludePatterns:",
+            "    .*\\.cpp$",
+            "    .*\\.h$",
+            "ExcludePatterns:",
+            "    .*moc_.*",
+            "ExcludeDirectories:",
+        ]
+        lines += ["    " + pattern for pattern in self.excludeDirectories]
+        lines += [
+            "",
+            "[Paths]",
+            "SourceRoot: src",
+            "",
+            "[JSONObjects]",
+            "ProjectGroupsList: " + "\n    ".join(json.dumps(groups, indent=2).split("\n")),
+            "",
+        ]
+        
+        configPath = self.GetOutputPath(configFilename)
+        with open(configPath, "w") as writer:
+            writer.write("\n".join(lines))
+        return configPath
+    
+    # Scan
+    #   Runs the dependencydatabase.py script with the extra arguments and returns whether it
+    #   succeeded.
+    def Scan(self, *arguments, **options):
+        configFilename = options.get("configFilename", self.configFilename)
+        return dependencydatabase.Main([os.path.join(repositoryPath, "dependencydatabase.py"), "-c", configFilename] + list(arguments))
+    
+    # GenerateHtml
+    #   Runs the dependency2html.py script on the database of the last scan with the extra arguments
+    #   and returns the contents of the report. The script's messages are discarded.
+    def GenerateHtml(self, *arguments):
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            result = dependency2html.Main([os.path.join(repositoryPath, "dependency2html.py"), "-c", self.configFilename, "-r", "--dont-open"] + list(arguments))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        if result < 0:
+            raise Exception("dependency2html.py failed")
+        
+        with open(self.GetOutputPath("deps.html"), "r") as reader:
+            return reader.read()
+    
+    # CreateProcessor
+    #   Returns a SolutionProcessor configured like the dependencydatabase.py script would be with
+    #   the extra arguments. Call its Close method when done.
+    def CreateProcessor(self, *arguments):
+        config = self.CreateConfiguration(*arguments)
+        return dependencydatabase.SolutionProcessor(config, dependencydatabase.FileFilter(config))
+    
+    # Returns the configuration of the dependencydatabase.py script with the extra arguments.
+    def CreateConfiguration(self, *arguments):
+        config = dependencydatabase.DependencyScriptConfiguration()
+        config.Configure([os.path.join(repositoryPath, "dependencydatabase.py"), "-c", self.configFilename] + list(arguments))
+        return config
+    
+    # GetRows
+    #   Returns the sorted rows of the tables of the original schema and of the ProjectDependency
+    #   table, which together are the results of a scan, as a dictionary keyed by the table name.
+    def GetRows(self, databaseFilename = "deps.db"):
+        connection = sqlite3.connect(self.GetOutputPath(databaseFilename))
+        try:
+            rows = {}
+            for tableName in ["Project", "CodeFile", "IncludeDirective", "ProjectDependency"]:
+                rows[tableName] = sorted(connection.execute("SELECT * FROM {0}".format(tableName)).fetchall())
+            return rows
+        finally:
+            connection.close()
+    
+    # Returns a database object for the database with the given filename, opened for reading.
+    def OpenDatabase(self, databaseFilename = "deps.db"):
+        database = dependencydatabase.DependencyScriptDatabase(self.GetOutputPath(databaseFilename))
+        database.Open()
+        return database
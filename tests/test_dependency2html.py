@@ -0,0 +1,192 @@
+#!/usr/bin/python2
+
+# ################################################################################################ #
+# Tests of the dependency2html.py script                                                           #
+# ################################################################################################ #
+
+import os
+import re
+import json
+import zlib
+import base64
+import unittest
+import cStringIO
+from solutionfixture import SolutionFixture
+import dependency2html
+import dependencydatabase
+import dependencymatrix
+
+# DeclaredDependencies class
+#   Stands in for the SolutionInfo of the matrix writer, the projects declare their dependencies in
+#   a dictionary.
+class DeclaredDependencies(object):
+    def __init__(self, dependencies):
+        self.dependencies = dependencies
+    
+    def GetProjectDependencies(self, projectName):
+        return self.dependencies.get(projectName, [])
+    
+    def HasProjectDependency(self, projectName, projectDependency):
+        if projectName in self.dependencies:
+            return projectDependency in self.dependencies[projectName]
+        return None
+
+# MatrixWriterTest class
+#   DependencyMatrixHtmlTableWriter.WriteRow must write the same table as writing the cells through
+#   a HtmlTableInlineWriter.
+class MatrixWriterTest(unittest.TestCase):
+    projectNames = ["App", "Gui", "Util", "Core"]
+    solutionInfo = DeclaredDependencies({ "App": ["Gui", "Core"], "Gui": ["Util"], "Util": ["Core", "Unknown"] })
+    
+    # The cells of the matrix by row, any dependencies that are not declared included.
+    cells = {
+        0: { 1: "App-Gui", 3: "App-Core" },
+        1: { 0: "Gui-App", 1: "Gui-Gui", 3: "Gui-Core" },
+        3: { 3: "Core-Core" },
+    }
+    
+    def CreateWriter(self, output):
+        writer = dependency2html.DependencyMatrixHtmlTableWriter(output, self.solutionInfo)
+        writer.SetRowHeadings(self.projectNames)
+        writer.SetColumnHeadings(self.projectNames)
+        return writer
+    
+    def testWriteRow(self):
+        inlineOutput = cStringIO.StringIO()
+        inlineWriter = dependency2html.HtmlTableInlineWriter(self.CreateWriter(inlineOutput))
+        for rowIndex in sorted(self.cells):
+            for columnIndex in sorted(self.cells[rowIndex]):
+                inlineWriter.WriteData(self.cells[rowIndex][columnIndex], columnIndex, rowIndex)
+        inlineWriter.End()
+        
+        rowOutput = cStringIO.StringIO()
+        rowWriter = self.CreateWriter(rowOutput)
+        rowWriter.WriteTableStart()
+        for rowIndex in xrange(len(self.projectNames)):
+            rowWriter.WriteRow(rowIndex, self.cells.get(rowIndex, {}))
+        rowWriter.WriteTableEnd()
+        
+        self.assertEqual(rowOutput.getvalue(), inlineOutput.getvalue())
+        
+        # The empty cells of the declared dependencies above the diagonal.
+        self.assertIn('<td class="col-Util"></td>', rowOutput.getvalue())
+        self.assertIn('<td class="col-Core"></td>', rowOutput.getvalue())
+
+# DetailsTest class
+#   The #include details of the cells must be the same however they are shipped with the report.
+class DetailsTest(unittest.TestCase):
+    inlineDetailRegex = re.compile('<div id="([^"]+)" class="jsondata hidden">\n(.*?)\n?</div>', re.S)
+    
+    def setUp(self):
+        self.solution = SolutionFixture()
+        self.assertTrue(self.solution.Scan())
+        self.inlineDetails = dict([(cellId, json.loads(data)) for cellId, data in self.inlineDetailRegex.findall(self.solution.GenerateHtml())])
+    
+    def tearDown(self):
+        self.solution.Close()
+    
+    def testInlineDetails(self):
+        self.assertEqual(len(self.inlineDetails), 7)
+        self.assertEqual(self.inlineDetails["B-A-json"], [{"file": "lib/b/b.h", "include-list": {"a/a.h": [{"line-number": 2, "include-type": "local"}]}}])
+    
+    def testDetailFiles(self):
+        html = self.solution.GenerateHtml("--detail-files")
+        
+        detailsPath = self.solution.GetOutputPath("deps-details")
+        details = {}
+        for filename in sorted(os.listdir(detailsPath)):
+            with open(os.path.join(detailsPath, filename), "r") as reader:
+                match = re.match('registerDetailShard\\((".*?"), (.*)\\);\n$', reader.read())
+            self.assertEqual(json.loads(match.group(1)), "deps-details/" + filename)
+            for cellId, data in json.loads(match.group(2)).items():
+                details[cellId] = data
+                self.assertIn('<div id="{0}" class="jsondata hidden" data-shard="deps-details/{1}"></div>'.format(cellId, filename), html)
+        
+        self.assertEqual(details, self.inlineDetails)
+    
+    def testCompressedDetails(self):
+        html = self.solution.GenerateHtml("--compress-details")
+        
+        encodedPayload = re.search('<div id="compressed-details" class="hidden">\n(.*?)</div>', html, re.S).group(1)
+        payload = json.loads(zlib.decompress(base64.b64decode("".join(encodedPayload.split())), 16 + zlib.MAX_WBITS))
+        strings = payload["strings"]
+        
+        # Expand the cells, see CompressedDetailPayload.
+        details = {}
+        for cellId, cell in payload["cells"].items():
+            details[cellId] = []
+            for fileIndex, includes in cell:
+                includeList = {}
+                for textIndex, lines in includes:
+                    includeList[strings[textIndex]] = [{"line-number": lines[i], "include-type": strings[lines[i + 1]]} for i in xrange(0, len(lines), 2)]
+                details[cellId].append({"file": strings[fileIndex], "include-list": includeList})
+            self.assertIn('<div id="{0}" class="jsondata hidden" data-shard="compressed-details"></div>'.format(cellId), html)
+        
+        self.assertEqual(details, self.inlineDetails)
+
+# VirtualMatrixTest class
+#   The --virtual-matrix data must classify and sum the cells the way the DependencyMatrix does.
+class VirtualMatrixTest(unittest.TestCase):
+    # The cell classes in the order of cellClassNames in the report.
+    cellClasses = [dependencymatrix.DependencyMatrix.cellInternal, dependencymatrix.DependencyMatrix.cellHierarchyViolation, dependencymatrix.DependencyMatrix.cellDependencyViolation, dependencymatrix.DependencyMatrix.cellDependency]
+    
+    # The index of the cell classes in the [error sum, warning sum, dependencies sum] totals.
+    totalIndices = {
+        dependencymatrix.DependencyMatrix.cellHierarchyViolation: 0,
+        dependencymatrix.DependencyMatrix.cellDependencyViolation: 1,
+        dependencymatrix.DependencyMatrix.cellInternal: 2,
+        dependencymatrix.DependencyMatrix.cellDependency: 2,
+    }
+    
+    def setUp(self):
+        self.solution = SolutionFixture()
+        self.assertTrue(self.solution.Scan())
+        
+        html = self.solution.GenerateHtml("--virtual-matrix")
+        self.assertNotIn('<table id="dependency-matrix"', html)
+        self.data = json.loads(re.search('var dependencyMatrixData = (.*);\n', html).group(1))
+        
+        database = self.solution.OpenDatabase()
+        try:
+            self.matrix = dependencymatrix.DependencyMatrix(database, dependencydatabase.SolutionInfo(self.solution.CreateConfiguration()))
+        finally:
+            database.Close()
+    
+    def tearDown(self):
+        self.solution.Close()
+    
+    def testCells(self):
+        projects = self.data["projects"]
+        cells = self.data["cells"]
+        self.assertEqual(sorted(projects), sorted(self.matrix.projectNames))
+        self.assertEqual(len(cells), 4 * len(self.matrix.cells))
+        
+        for i in xrange(0, len(cells), 4):
+            rowIndex, columnIndex, includeCount, cellClassIndex = cells[i:i + 4]
+            matrixRowIndex = self.matrix.GetIndex(projects[rowIndex])
+            matrixColumnIndex = self.matrix.GetIndex(projects[columnIndex])
+            self.assertEqual(includeCount, self.matrix.GetCount(matrixRowIndex, matrixColumnIndex))
+            self.assertEqual(self.cellClasses[cellClassIndex], self.matrix.ClassifyCell(matrixRowIndex, matrixColumnIndex))
+    
+    def testTotals(self):
+        projects = self.data["projects"]
+        rowTotals = [0] * (3 * len(projects))
+        columnTotals = [0] * (3 * len(projects))
+        for rowIndex, rowProject in enumerate(projects):
+            for columnIndex, columnProject in enumerate(projects):
+                matrixRowIndex = self.matrix.GetIndex(rowProject)
+                matrixColumnIndex = self.matrix.GetIndex(columnProject)
+                totalIndex = self.totalIndices[self.matrix.ClassifyCell(matrixRowIndex, matrixColumnIndex)]
+                rowTotals[3 * rowIndex + totalIndex] += self.matrix.GetCount(matrixRowIndex, matrixColumnIndex)
+                columnTotals[3 * columnIndex + totalIndex] += self.matrix.GetCount(matrixRowIndex, matrixColumnIndex)
+        self.assertEqual(self.data["rowTotals"], rowTotals)
+        self.assertEqual(self.data["columnTotals"], columnTotals)
+        
+        expectedSums = [0, 0, 0]
+        for cellClass, total in self.matrix.GetTotals().items():
+            expectedSums[self.totalIndices[cellClass]] += total
+        self.assertEqual([sum(self.data["rowTotals"][i::3]) for i in xrange(3)], expectedSums)
+        self.assertEqual([sum(self.data["columnTotals"][i::3]) for i in xrange(3)], expectedSums)
+
+if __name__ == '__main__':
+    unittest.main()
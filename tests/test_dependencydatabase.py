@@ -0,0 +1,314 @@
+#!/usr/bin/python2
+
+# ################################################################################################ #
+# Tests of the dependencydatabase.py script                                                        #
+# ################################################################################################ #
+
+import sys
+import time
+import errno
+import ctypes
+import threading
+import traceback
+import sqlite3
+import unittest
+from solutionfixture import SolutionFixture, exampleProjects
+import dependencydatabase
+
+# ScanParityTest class
+#   The alternative ways of scanning a solution must give the same database as the serial scan.
+class ScanParityTest(unittest.TestCase):
+    def setUp(self):
+        self.solution = SolutionFixture()
+        self.assertTrue(self.solution.Scan())
+        self.serialRows = self.solution.GetRows()
+    
+    def tearDown(self):
+        self.solution.Close()
+    
+    def testSerialScan(self):
+        codeFiles = [row[0] for row in self.serialRows["CodeFile"]]
+        self.assertEqual(codeFiles, ["app/c/c.h", "app/c/late.h", "app/c/main.cpp", "lib/a/a.cpp", "lib/a/include/a/a.h", "lib/b/b.cpp", "lib/b/b.h"])
+        self.assertIn((u"B", u"A", 1, 1), self.serialRows["ProjectDependency"])
+    
+    def testJobs(self):
+        self.assertTrue(self.solution.Scan("--jobs", "3"))
+        self.assertEqual(self.solution.GetRows(), self.serialRows)
+    
+    def testPipeline(self):
+        self.assertTrue(self.solution.Scan("--pipeline", "--read-threads", "3"))
+        self.assertEqual(self.solution.GetRows(), self.serialRows)
+    
+    def testFastIncludeScan(self):
+        self.assertTrue(self.solution.Scan("--fast-include-scan"))
+        self.assertEqual(self.solution.GetRows(), self.serialRows)
+        self.assertTrue(self.solution.Scan("--fast-include-scan", "--include-scan-lines", "10"))
+        self.assertEqual(self.solution.GetRows(), self.serialRows)
+    
+    # Only the #include directive after main() is lost.
+    def testStopAtDeclaration(self):
+        self.assertTrue(self.solution.Scan("--stop-at-declaration"))
+        rows = self.solution.GetRows()
+        lateIncludes = [row for row in self.serialRows["IncludeDirective"] if row[0] == "app/c/main.cpp" and row[1] == "late.h"]
+        self.assertEqual(len(lateIncludes), 1)
+        self.assertEqual(rows["IncludeDirective"], [row for row in self.serialRows["IncludeDirective"] if row not in lateIncludes])
+    
+    # An exception raised by a stage of the pipeline is raised again with its traceback.
+    def testPipelineError(self):
+        processor = self.solution.CreateProcessor("--pipeline")
+        def FailingScanFile(filepath, data = None):
+            raise ValueError("Scan failed")
+        processor.ScanFile = FailingScanFile
+        try:
+            processor.PopulateDatabase()
+            self.fail("The exception wasn't raised again.")
+        except ValueError:
+            self.assertEqual(traceback.extract_tb(sys.exc_info()[2])[-1][2], "FailingScanFile")
+        finally:
+            processor.database.Abort()
+            processor.Close()
+
+# IncrementalScanTest class
+#   An incremental scan must give the same database as a full scan of the changed solution.
+class IncrementalScanTest(unittest.TestCase):
+    def setUp(self):
+        self.solution = SolutionFixture()
+        self.freshConfigFilename = self.solution.WriteConfig("fresh.db")
+        self.assertTrue(self.solution.Scan())
+    
+    def tearDown(self):
+        self.solution.Close()
+    
+    def assertSameAsFullScan(self):
+        self.assertTrue(self.solution.Scan("-i"))
+        self.assertTrue(self.solution.Scan(configFilename = self.freshConfigFilename))
+        self.assertEqual(self.solution.GetRows(), self.solution.GetRows("fresh.db"))
+    
+    def testModifiedAndAddedFiles(self):
+        self.solution.WriteFile("lib/b/b.cpp", '#include "b.h"\n#include "new.h"\n')
+        self.solution.WriteFile("lib/b/new.h", '#include "a/a.h"\n')
+        self.assertSameAsFullScan()
+    
+    def testRemovedFile(self):
+        self.solution.RemoveFile("app/c/late.h")
+        self.assertSameAsFullScan()
+    
+    # Returns how many times the scan started a bulk load.
+    def CountBulkLoads(self, *arguments):
+        processor = self.solution.CreateProcessor(*arguments)
+        bulkLoads = []
+        beginBulkLoad = processor.database.BeginBulkLoad
+        def BeginBulkLoad():
+            bulkLoads.append(True)
+            beginBulkLoad()
+        processor.database.BeginBulkLoad = BeginBulkLoad
+        try:
+            self.assertTrue(processor.PopulateDatabase())
+        finally:
+            processor.Close()
+        return len(bulkLoads)
+    
+    # Only a full scan, which starts from empty tables, trades durability for speed.
+    def testBulkLoad(self):
+        self.solution.WriteFile("lib/b/new.h", '')
+        self.assertEqual(self.CountBulkLoads("-i"), 0)
+        self.assertEqual(self.CountBulkLoads(), 1)
+        
+        self.solution.projects = self.solution.projects[:2]
+        self.solution.WriteConfig("deps.db")
+        self.assertEqual(self.CountBulkLoads("-i"), 1)
+    
+    # The files that the file filter excludes can still be included.
+    def testUnscannedFiles(self):
+        self.solution.WriteFile("lib/b/u.cpp", '#include "gen.inl"\n#include "moc_b.h"\n')
+        self.assertSameAsFullScan()
+        
+        self.solution.WriteFile("lib/b/gen.inl", '')
+        self.solution.WriteFile("lib/b/moc_b.h", '')
+        self.assertSameAsFullScan()
+        resolvedIncludes = [row for row in self.solution.GetRows()["IncludeDirective"] if row[0] == "lib/b/u.cpp"]
+        self.assertEqual([row[4:6] for row in resolvedIncludes], [("B", "lib/b/gen.inl"), ("B", "lib/b/moc_b.h")])
+        
+        self.solution.RemoveFile("lib/b/gen.inl")
+        self.assertSameAsFullScan()
+
+# WatchTest class
+#   The updates made by --watch must give the same database as a full scan of the changed solution.
+class WatchTest(unittest.TestCase):
+    def setUp(self):
+        self.solution = SolutionFixture()
+        self.freshConfigFilename = self.solution.WriteConfig("fresh.db")
+        self.solution.WriteFile("lib/b/u.cpp", '#include "gen.inl"\n#include "b.h"\n')
+        self.processor = self.solution.CreateProcessor("-i")
+        self.assertTrue(self.processor.PopulateDatabase())
+        self.storedFileStats = self.processor.database.GetFileStats()
+    
+    def tearDown(self):
+        self.processor.Close()
+        self.solution.Close()
+    
+    def assertSameAsFullScan(self):
+        self.assertTrue(self.solution.Scan(configFilename = self.freshConfigFilename))
+        self.assertEqual(self.solution.GetRows(), self.solution.GetRows("fresh.db"))
+    
+    def testFileEvents(self):
+        self.solution.WriteFile("lib/b/gen.inl", '')
+        self.solution.WriteFile("lib/b/u.cpp", '#include "gen.inl"\n#include "c.h"\n')
+        self.processor.UpdateFiles([self.solution.GetPath("lib/b/gen.inl"), self.solution.GetPath("lib/b/u.cpp")], False, self.storedFileStats)
+        self.assertSameAsFullScan()
+        
+        self.solution.RemoveFile("lib/b/gen.inl")
+        self.processor.UpdateFiles([self.solution.GetPath("lib/b/gen.inl")], False, self.storedFileStats)
+        self.assertSameAsFullScan()
+    
+    def testCompleteFileList(self):
+        self.solution.WriteFile("lib/b/gen.inl", '')
+        self.solution.RemoveFile("app/c/late.h")
+        self.processor.UpdateFiles(self.processor.GetFilesToScan()[0], True, self.storedFileStats)
+        self.assertSameAsFullScan()
+
+# FailingLibc class
+#   Stands in for the C library of an _InotifyWatcher, adding a watch fails with the error.
+class FailingLibc(object):
+    def __init__(self, error):
+        self.error = error
+    
+    def inotify_add_watch(self, fd, path, mask):
+        ctypes.set_errno(self.error)
+        return -1
+
+# InotifyWatcherTest class
+class InotifyWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.solution = SolutionFixture()
+        self.processor = self.solution.CreateProcessor()
+        try:
+            self.watcher = dependencydatabase._InotifyWatcher(self.processor)
+        except OSError as e:
+            self.processor.Close()
+            self.solution.Close()
+            self.skipTest(str(e))
+    
+    def tearDown(self):
+        self.watcher.Close()
+        self.processor.Close()
+        self.solution.Close()
+    
+    # Only running out of watches stops the watcher, a directory that is gone is skipped.
+    def testAddWatchErrors(self):
+        self.watcher.libc = FailingLibc(errno.ENOENT)
+        self.assertEqual(self.watcher._AddDirectoryTree(self.solution.GetPath("lib")), [])
+        self.watcher.libc = FailingLibc(errno.ENOSPC)
+        self.assertRaises(OSError, self.watcher._AddDirectoryTree, self.solution.GetPath("lib"))
+    
+    # A file that is written to all the time doesn't hold up the changes.
+    def testBatchTime(self):
+        isWriting = [True]
+        def WriteFile():
+            while isWriting[0]:
+                self.solution.WriteFile("lib/b/b.h", '#include "a/a.h"\n')
+                time.sleep(0.02)
+        writer = threading.Thread(target=WriteFile)
+        writer.start()
+        try:
+            startTime = time.time()
+            filepaths, isComplete = self.watcher.Wait()
+            self.assertLess(time.time() - startTime, 2)
+            self.assertEqual(filepaths, [self.solution.GetPath("lib/b/b.h")])
+            self.assertFalse(isComplete)
+        finally:
+            isWriting[0] = False
+            writer.join()
+
+# FileFilterTest class
+#   A pattern list must match what its patterns match one by one.
+class FileFilterTest(unittest.TestCase):
+    def assertMatches(self, patternList, filepaths):
+        fileFilter = dependencydatabase.FileFilter()
+        fileFilter.includeList = patternList
+        fileFilter.Compile()
+        for filepath, isIncluded in filepaths:
+            self.assertEqual(fileFilter.IsIncluded(filepath), isIncluded, filepath)
+    
+    def testPatterns(self):
+        self.assertMatches([".*\\.h$", ".*\\.cpp$"], [("a.h", True), ("a.cpp", True), ("a.c", False)])
+        
+        # An inline flag only applies to its own pattern.
+        self.assertMatches([".*\\.h$", "(?i).*\\.CPP$"], [("FOO.H", False), ("foo.h", True), ("foo.cpp", True)])
+        
+        # So do the group numbers and names.
+        self.assertMatches(["(x)y", "(a)\\1"], [("aa", True), ("xy", True), ("ab", False)])
+        self.assertMatches(["(?P<n>a)b", "(?P<n>c)d"], [("ab", True), ("cd", True), ("ad", False)])
+
+# ProjectTest class
+class ProjectTest(unittest.TestCase):
+    def tearDown(self):
+        self.solution.Close()
+    
+    # Two projects with the same path are a configuration error, neither is renamed.
+    def testDuplicateProjectPath(self):
+        self.solution = SolutionFixture(projects = exampleProjects + [("D", "lib/a/", None, [])])
+        self.assertFalse(self.solution.Scan())
+        
+        # The failed scan leaves a current, empty database behind, not one to migrate.
+        database = self.solution.OpenDatabase()
+        self.assertEqual(database.GetSchemaVersion(), database.schemaVersion)
+        self.assertEqual(database.GetProjects(), [])
+        database.Close()
+        
+        self.solution.projects = exampleProjects
+        self.solution.WriteConfig("deps.db")
+        self.assertTrue(self.solution.Scan("-i"))
+        self.assertEqual(len(self.solution.GetRows()["Project"]), 3)
+
+# MigrationTest class
+#   A database generated by an older version of the script must give the same results once migrated
+#   as a new scan does.
+class MigrationTest(unittest.TestCase):
+    # The tables of schema version 0, before the normalised schema.
+    version0TableCreateCommands = [
+        "CREATE TABLE Project (SolutionPath TEXT PRIMARY KEY, Name TEXT, HierarchyLevel INTEGER);",
+        "CREATE TABLE CodeFile (SolutionPath TEXT PRIMARY KEY, Project TEXT, Filename TEXT);",
+        "CREATE TABLE IncludeDirective (CodeFileSolutionPath TEXT, IncludeText TEXT, IncludeType TEXT, IncludeFilename TEXT, IncludeProject TEXT, IncludeSolutionPath TEXT, LineNumber INTEGER);",
+    ]
+    
+    def setUp(self):
+        self.solution = SolutionFixture()
+        self.assertTrue(self.solution.Scan())
+        self.rows = self.solution.GetRows()
+    
+    def tearDown(self):
+        self.solution.Close()
+    
+    def assertMigrated(self, databaseFilename):
+        database = self.solution.OpenDatabase(databaseFilename)
+        self.assertEqual(database.GetSchemaVersion(), database.schemaVersion)
+        database.Close()
+        self.assertEqual(self.solution.GetRows(databaseFilename), self.rows)
+    
+    def testVersion0(self):
+        connection = sqlite3.connect(self.solution.GetOutputPath("old.db"))
+        for command in self.version0TableCreateCommands:
+            connection.execute(command)
+        for tableName in ["Project", "CodeFile", "IncludeDirective"]:
+            for row in self.rows[tableName]:
+                connection.execute("INSERT INTO {0} VALUES ({1});".format(tableName, ", ".join(["?"] * len(row))), row)
+        connection.commit()
+        connection.close()
+        
+        self.assertMigrated("old.db")
+    
+    # Version 2 had no ProjectDependency table, the migration computes it.
+    def testVersion2(self):
+        connection = sqlite3.connect(self.solution.GetOutputPath("deps.db"))
+        connection.execute("DROP VIEW ProjectDependency;")
+        connection.execute("DROP TABLE ProjectDependencyEntry;")
+        connection.execute("DROP TABLE SolutionFileEntry;")
+        connection.execute("PRAGMA user_version = 2;")
+        connection.commit()
+        connection.close()
+        
+        self.assertMigrated("deps.db")
+
+if __name__ == '__main__':
+    unittest.main()
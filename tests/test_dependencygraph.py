@@ -0,0 +1,122 @@
+#!/usr/bin/python2
+
+# ################################################################################################ #
+# Tests of the dependencygraph.py module                                                           #
+# ################################################################################################ #
+
+import random
+import unittest
+import solutionfixture # Puts the repository on the module search path.
+import dependencygraph
+
+# Returns a random graph in the adjacency list format of the dependencygraph module.
+def GetRandomGraph(generator, nodeCount, edgeCount):
+    adjacency = [set() for node in xrange(nodeCount)]
+    for i in xrange(edgeCount):
+        adjacency[generator.randrange(nodeCount)].add(generator.randrange(nodeCount))
+    return [sorted(successors) for successors in adjacency]
+
+# Returns the set of the nodes reachable from the node by following at least one edge.
+def GetReachable(adjacency, node):
+    reachable = set()
+    stack = list(adjacency[node])
+    while stack:
+        successor = stack.pop()
+        if successor not in reachable:
+            reachable.add(successor)
+            stack.extend(adjacency[successor])
+    return reachable
+
+# GraphTest class
+#   Checks the algorithms against plain searches of random graphs, from sparse and acyclic to dense
+#   with many cycles.
+class GraphTest(unittest.TestCase):
+    def setUp(self):
+        generator = random.Random(1)
+        self.graphs = [[], [[0]], [[1], [0]]]
+        for nodeCount, edgeCount in [(10, 5), (10, 20), (50, 60), (50, 200), (200, 250)]:
+            self.graphs.append(GetRandomGraph(generator, nodeCount, edgeCount))
+    
+    def testStronglyConnectedComponents(self):
+        for adjacency in self.graphs:
+            components, componentIndices = dependencygraph.FindStronglyConnectedComponents(adjacency)
+            reachable = [GetReachable(adjacency, node) for node in xrange(len(adjacency))]
+            
+            self.assertEqual(sorted([node for component in components for node in component]), range(len(adjacency)))
+            for componentIndex, component in enumerate(components):
+                for node in component:
+                    self.assertEqual(componentIndices[node], componentIndex)
+            
+            for node in xrange(len(adjacency)):
+                for otherNode in xrange(len(adjacency)):
+                    isConnected = node == otherNode or (otherNode in reachable[node] and node in reachable[otherNode])
+                    self.assertEqual(componentIndices[node] == componentIndices[otherNode], isConnected)
+                
+                # Reverse topological order.
+                for successor in adjacency[node]:
+                    self.assertLessEqual(componentIndices[successor], componentIndices[node])
+    
+    def testTransitiveClosure(self):
+        for adjacency in self.graphs:
+            closure = dependencygraph.TransitiveClosure(adjacency)
+            for node in xrange(len(adjacency)):
+                reachable = GetReachable(adjacency, node) - set([node])
+                self.assertEqual(closure.GetReachable(node), sorted(reachable))
+                for otherNode in xrange(len(adjacency)):
+                    self.assertEqual(closure.IsReachable(node, otherNode), otherNode in reachable)
+    
+    # Checks that the edges break all of the cycles of the component and, if isMinimal is set, that
+    # none of them can be left out.
+    def assertFeedbackEdges(self, adjacency, component, edges, isMinimal):
+        removedEdges = set(edges)
+        self.assertEqual(len(removedEdges), len(edges))
+        
+        nodes = set(component)
+        remainingAdjacency = [[successor for successor in successors if node in nodes and successor in nodes and (node, successor) not in removedEdges] for node, successors in enumerate(adjacency)]
+        for node, successor in edges:
+            self.assertIn(successor, adjacency[node])
+            self.assertIn(node, nodes)
+            self.assertIn(successor, nodes)
+        for node in component:
+            self.assertNotIn(node, GetReachable(remainingAdjacency, node))
+        
+        if isMinimal:
+            for node, successor in edges:
+                self.assertTrue(node == successor or node in GetReachable(remainingAdjacency, successor))
+    
+    def testFeedbackEdges(self):
+        generator = random.Random(2)
+        for adjacency in self.graphs:
+            components, componentIndices = dependencygraph.FindStronglyConnectedComponents(adjacency)
+            weights = dict([((node, successor), generator.random()) for node in xrange(len(adjacency)) for successor in adjacency[node]])
+            for component in components:
+                componentEdgeCount = len([successor for node in component for successor in adjacency[node] if componentIndices[successor] == componentIndices[node]])
+                for getEdgeWeight in [None, weights.get]:
+                    edges, isMinimal = dependencygraph.FindFeedbackEdges(adjacency, component, componentIndices, getEdgeWeight, componentEdgeCount * componentEdgeCount)
+                    self.assertTrue(isMinimal)
+                    self.assertFeedbackEdges(adjacency, component, edges, isMinimal)
+                    
+                    # Too costly to start from all of the edges, only the back edges are reduced.
+                    edges, isMinimal = dependencygraph.FindFeedbackEdges(adjacency, component, componentIndices, getEdgeWeight, max(0, componentEdgeCount * componentEdgeCount - 1))
+                    self.assertFeedbackEdges(adjacency, component, edges, isMinimal)
+                
+                edges, isMinimal = dependencygraph.FindFeedbackEdges(adjacency, component, componentIndices, maxReductionCost = 0)
+                self.assertEqual(isMinimal, componentEdgeCount == 0)
+                self.assertFeedbackEdges(adjacency, component, edges, isMinimal)
+    
+    # The lightest edges of a cycle are removed.
+    def testWeightedFeedbackEdges(self):
+        adjacency = [[1], [2], [0, 3], [1]]
+        components, componentIndices = dependencygraph.FindStronglyConnectedComponents(adjacency)
+        weights = { (0, 1): 5, (1, 2): 1, (2, 0): 5, (2, 3): 5, (3, 1): 5 }
+        self.assertEqual(dependencygraph.FindFeedbackEdges(adjacency, components[0], componentIndices, weights.get), ([(1, 2)], True))
+        weights = { (0, 1): 4, (1, 2): 10, (2, 0): 5, (2, 3): 3, (3, 1): 6 }
+        self.assertEqual(sorted(dependencygraph.FindFeedbackEdges(adjacency, components[0], componentIndices, weights.get)[0]), [(0, 1), (2, 3)])
+    
+    def testGetBitIndices(self):
+        self.assertEqual(dependencygraph.GetBitIndices(0), [])
+        self.assertEqual(dependencygraph.GetBitIndices(1), [0])
+        self.assertEqual(dependencygraph.GetBitIndices((1 << 100) | (1 << 3) | (1 << 2)), [2, 3, 100])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/python2
+
+# ################################################################################################ #
+# Tests of the DependencyMatrix class                                                              #
+# ################################################################################################ #
+
+import unittest
+from solutionfixture import SolutionFixture, exampleProjects
+import dependencydatabase
+import dependencymatrix
+from dependencymatrix import DependencyMatrix
+
+# The pure Python implementation, whether NumPy is available or not.
+class PureDependencyMatrix(DependencyMatrix):
+    useNumPy = False
+
+# DependencyMatrixTest class
+#   The matrix of the example solution with its projects in reverse, so that the application is at
+#   the top of the hierarchy and every kind of cell is present.
+class DependencyMatrixTest(unittest.TestCase):
+    def setUp(self):
+        self.solution = SolutionFixture(projects = list(reversed(exampleProjects)))
+        self.assertTrue(self.solution.Scan())
+        self.database = self.solution.OpenDatabase()
+        self.solutionInfo = dependencydatabase.SolutionInfo(self.solution.CreateConfiguration())
+        self.matrix = DependencyMatrix(self.database, self.solutionInfo)
+    
+    def tearDown(self):
+        self.database.Close()
+        self.solution.Close()
+    
+    def testCounts(self):
+        self.assertEqual(self.matrix.projectNames, ["C", "B", "A"])
+        
+        rows = self.solution.GetRows()["ProjectDependency"]
+        cells = dict([((self.matrix.GetIndex(project), self.matrix.GetIndex(includeProject)), (includeCount, fileCount)) for project, includeProject, includeCount, fileCount in rows])
+        self.assertEqual(self.matrix.cells, cells)
+        
+        for index in xrange(self.matrix.GetProjectCount()):
+            self.assertEqual(self.matrix.GetRowColumns(index), sorted([column for row, column in cells if row == index]))
+            self.assertEqual(self.matrix.GetColumnRows(index), sorted([row for row, column in cells if column == index]))
+            self.assertEqual(self.matrix.GetRowTotal(index), sum([counts[0] for (row, column), counts in cells.items() if row == index]))
+            self.assertEqual(self.matrix.GetColumnTotal(index), sum([counts[0] for (row, column), counts in cells.items() if column == index]))
+    
+    def testClassifyCell(self):
+        c, b, a = 0, 1, 2
+        self.assertEqual(self.matrix.ClassifyCell(c, c), DependencyMatrix.cellInternal)
+        self.assertEqual(self.matrix.ClassifyCell(c, a), DependencyMatrix.cellDependency)
+        self.assertEqual(self.matrix.ClassifyCell(b, a), DependencyMatrix.cellDependency)
+        self.assertEqual(self.matrix.ClassifyCell(c, b), DependencyMatrix.cellDependencyViolation)
+        self.assertEqual(self.matrix.ClassifyCell(a, b), DependencyMatrix.cellHierarchyViolation)
+        
+        # Without the configuration no dependency is declared.
+        matrix = DependencyMatrix(self.database)
+        self.assertEqual(matrix.ClassifyCell(c, a), DependencyMatrix.cellDependencyViolation)
+    
+    def testTotals(self):
+        totals = self.matrix.GetTotals()
+        self.assertTrue(all(totals.values()))
+        self.assertEqual(sum(totals.values()), sum([counts[0] for counts in self.matrix.cells.values()]))
+        for cellClass in totals:
+            self.assertEqual(totals[cellClass], sum([counts[0] for cell, counts in self.matrix.cells.items() if self.matrix.ClassifyCell(*cell) == cellClass]))
+    
+    @unittest.skipIf(dependencymatrix.numpy is None, "NumPy isn't installed")
+    def testNumPy(self):
+        pureMatrix = PureDependencyMatrix(self.database, self.solutionInfo)
+        self.assertTrue(self.matrix.useNumPy)
+        self.assertEqual(self.matrix.GetTotals(), pureMatrix.GetTotals())
+        self.assertEqual(self.matrix.rowTotals, pureMatrix.rowTotals)
+        self.assertEqual(self.matrix.columnTotals, pureMatrix.columnTotals)
+    
+    def testDependencies(self):
+        self.assertEqual(self.matrix.GetDependencies("C"), set(["A", "B"]))
+        self.assertEqual(self.matrix.GetDependents("A"), set(["B", "C"]))
+        self.assertEqual(self.matrix.GetDependencies("Unknown"), set())
+    
+    # A project is a dependent of each of its dependencies, directly and indirectly.
+    def testDependents(self):
+        for isDirectOnly in [True, False]:
+            dependencyTree = self.matrix.GetAllDependencyTree(isDirectOnly)
+            dependentTree = self.matrix.GetAllDependencyTree(isDirectOnly, isDependents = True)
+            self.assertEqual(dependencyTree.keys(), sorted(self.matrix.projectNames))
+            self.assertEqual(dependentTree.keys(), sorted(self.matrix.projectNames))
+            
+            dependencies = set([(project, dependency) for project in dependencyTree for dependency in dependencyTree[project]])
+            dependents = set([(project, dependent) for dependent in dependentTree for project in dependentTree[dependent]])
+            self.assertEqual(dependencies, dependents)
+        
+        self.assertEqual(self.matrix.GetAllDependents("A"), set(["B", "C"]))
+        self.assertEqual(self.matrix.GetAllDependents("C"), set())
+
+# CycleTest class
+#   Util declares its dependency on Core but Core includes Util's files more often than Util includes
+#   Core's, the cycle must still be broken at Core's hierarchy violation.
+class CycleTest(unittest.TestCase):
+    projects = [
+        ("App", "app/", None, ["Util", "Core"]),
+        ("Util", "util/", None, ["Core"]),
+        ("Core", "core/", None, []),
+    ]
+    files = {
+        "app/main.cpp": '#include "util/u.h"\n#include "core/c.h"\n',
+        "util/u.h": '#include "core/c.h"\n',
+        "util/u.cpp": '#include "u.h"\n',
+        "core/c.h": '#include "util/u.h"\n',
+        "core/c.cpp": '#include "c.h"\n#include "util/u.h"\n',
+    }
+    
+    def setUp(self):
+        self.solution = SolutionFixture(files = self.files, projects = self.projects)
+        self.assertTrue(self.solution.Scan())
+        self.database = self.solution.OpenDatabase()
+        self.solutionInfo = dependencydatabase.SolutionInfo(self.solution.CreateConfiguration())
+    
+    def tearDown(self):
+        self.database.Close()
+        self.solution.Close()
+    
+    def testGetCycles(self):
+        matrix = DependencyMatrix(self.database, self.solutionInfo)
+        self.assertEqual(matrix.GetCount(matrix.GetIndex("Core"), matrix.GetIndex("Util")), 2)
+        self.assertEqual(matrix.GetCount(matrix.GetIndex("Util"), matrix.GetIndex("Core")), 1)
+        self.assertEqual(matrix.GetCycles(), [(["Core", "Util"], [("Core", "Util")], True)])
+    
+    # Without the configuration only the hierarchy tells the dependencies apart.
+    def testGetCyclesWithoutDeclarations(self):
+        matrix = DependencyMatrix(self.database)
+        self.assertEqual(matrix.GetCycles(), [(["Core", "Util"], [("Core", "Util")], True)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/python2
+
+# ################################################################################################ #
+# Tests of the dependencyquery.py module and of the --serve and --server options of the            #
+# dependencylist.py script                                                                         #
+# ################################################################################################ #
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import subprocess
+import unittest
+import cStringIO
+from solutionfixture import SolutionFixture, repositoryPath
+import dependencydatabase
+import dependencymatrix
+import dependencyquery
+from utility import Logger
+
+# QueryServerTest class
+#   The query protocol, answered in this process.
+class QueryServerTest(unittest.TestCase):
+    def setUp(self):
+        self.solution = SolutionFixture()
+        self.assertTrue(self.solution.Scan())
+        self.database = self.solution.OpenDatabase()
+        
+        messagePrinter = Logger()
+        messagePrinter.isInfoEnabled = False
+        messagePrinter.isErrEnabled = False
+        matrix = dependencymatrix.DependencyMatrix(self.database, dependencydatabase.SolutionInfo(self.solution.CreateConfiguration()))
+        self.server = dependencyquery.DependencyQueryServer(self.database, matrix, messagePrinter)
+    
+    def tearDown(self):
+        self.database.Close()
+        self.solution.Close()
+    
+    def Query(self, line):
+        response = self.server.HandleRequest(line)
+        self.assertTrue(response.endswith("\n"))
+        return json.loads(response)
+    
+    def testQueries(self):
+        self.assertEqual(self.Query('{"query": "projects", "id": 7}'), {"id": 7, "result": ["A", "B", "C"]})
+        self.assertEqual(self.Query('{"query": "deps", "project": "C", "direct": true}'), {"result": ["A", "B"]})
+        self.assertEqual(self.Query('{"query": "dependents", "project": "A"}'), {"result": ["B", "C"]})
+        self.assertEqual(self.Query('{"query": "closure", "dependents": true}')["result"], {"A": ["B", "C"], "B": ["A", "C"], "C": []})
+        self.assertEqual(self.Query('{"query": "details", "project": "B", "includeProject": "A"}')["result"], [{"file": "lib/b/b.h", "line": 2, "include": "a/a.h", "type": "local"}])
+        self.assertEqual([violation["type"] for violation in self.Query('{"query": "violations"}')["result"]], ["dependency-violation", "hierarchy-violation", "hierarchy-violation", "hierarchy-violation"])
+    
+    # Invalid queries are answered with an error, they must never take the server down.
+    def testInvalidQueries(self):
+        for line in ['nonsense', '[]', '{}', '{"query": []}', '{"query": "tables"}', '{"query": "deps"}', '{"query": "deps", "project": []}', '{"query": "deps", "project": "D"}', '{"query": "deps", "project": "A", "direct": "yes"}', '{"query": "closure", "dependents": 1}', '{"query": "details", "project": "A", "includeProject": {}}']:
+            response = self.Query(line)
+            self.assertEqual(response.keys(), ["error"], line)
+        
+        self.assertEqual(self.Query('{"query": "deps", "id": 1, "project": "D"}'), {"id": 1, "error": "Unknown project: D"})
+        
+        def FailingQuery(request):
+            raise TypeError("Query failed")
+        self.server.queryHandlers["projects"] = FailingQuery
+        self.assertEqual(self.Query('{"query": "projects"}'), {"error": "Failed to answer the query: Query failed"})
+    
+    def testServeStream(self):
+        output = cStringIO.StringIO()
+        self.server.ServeStream(cStringIO.StringIO('{"query": "deps", "project": []}\n\n{"query": "deps", "project": "B"}\n'), output)
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(responses[1], {"result": ["A"]})
+        self.assertEqual(len(responses), 2)
+
+# QuerySocketTest class
+#   The dependencylist.py script answering queries over a Unix socket and as a client of it.
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix sockets aren't supported")
+class QuerySocketTest(unittest.TestCase):
+    def setUp(self):
+        self.solution = SolutionFixture()
+        self.assertTrue(self.solution.Scan())
+        self.socketPath = self.solution.GetOutputPath("deps.sock")
+        self.servers = []
+    
+    def tearDown(self):
+        for server in self.servers:
+            if server.poll() is None:
+                server.kill()
+                server.wait()
+        self.solution.Close()
+    
+    # Runs the dependencylist.py script and returns its exit code and output.
+    def RunScript(self, *arguments):
+        script = subprocess.Popen([sys.executable, os.path.join(repositoryPath, "dependencylist.py"), "-c", self.solution.configFilename, "-r"] + list(arguments), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, errors = script.communicate()
+        return (script.returncode, output, errors)
+    
+    # Starts a server on the socket and waits until it answers.
+    def StartServer(self):
+        server = subprocess.Popen([sys.executable, os.path.join(repositoryPath, "dependencylist.py"), "-c", self.solution.configFilename, "-r", "--serve", self.socketPath], stdout=subprocess.PIPE)
+        self.servers.append(server)
+        for i in xrange(200):
+            try:
+                client = dependencyquery.DependencyQueryClient(self.socketPath)
+                client.Close()
+                return server
+            except socket.error:
+                self.assertIsNone(server.poll())
+                time.sleep(0.05)
+        self.fail("The server didn't start.")
+    
+    # Stops the server with the signal. A server that doesn't stop is killed so that it can't hang
+    # the tests.
+    def StopServer(self, server, signalNumber = signal.SIGINT):
+        server.send_signal(signalNumber)
+        for i in xrange(200):
+            if server.poll() is not None:
+                break
+            time.sleep(0.05)
+        else:
+            server.kill()
+            server.wait()
+            self.fail("The server didn't stop.")
+        
+        server.communicate()
+        self.assertEqual(server.returncode, 0)
+        self.assertFalse(os.path.exists(self.socketPath))
+    
+    # The client's answers must be the same as those of the script's own DependencyMatrix.
+    def testRemoteDependencyMatrix(self):
+        server = self.StartServer()
+        for arguments in [["-p", "C"], ["-p", "C", "-d"], ["-p", "A", "--dependents"], ["-p", "A", "--direct-dependents"], ["-p", "D"], ["--all-projects-json"], ["--all-projects-json", "-d"], ["--all-projects-json", "--dependents"]]:
+            self.assertEqual(self.RunScript("--server", self.socketPath, *arguments), self.RunScript(*arguments))
+        
+        client = dependencyquery.DependencyQueryClient(self.socketPath)
+        try:
+            self.assertEqual(client.Query("deps", project="B"), ["A"])
+            self.assertRaises(dependencyquery.DependencyQueryError, client.Query, "deps", project=[])
+            self.assertEqual(client.Query("dependents", project="A", direct=True), ["B", "C"])
+        finally:
+            client.Close()
+        
+        self.StopServer(server)
+    
+    # A client that keeps its connection open doesn't hold up the others.
+    def testConcurrentClients(self):
+        server = self.StartServer()
+        idleClient = dependencyquery.DependencyQueryClient(self.socketPath)
+        try:
+            for i in xrange(3):
+                client = dependencyquery.DependencyQueryClient(self.socketPath)
+                client.socket.settimeout(10)
+                try:
+                    self.assertEqual(client.Query("details", project="B", includeProject="A"), [{"file": "lib/b/b.h", "line": 2, "include": "a/a.h", "type": "local"}])
+                finally:
+                    client.Close()
+            self.assertEqual(idleClient.Query("deps", project="B"), ["A"])
+            
+            # Neither does it keep the server running.
+            self.StopServer(server, signal.SIGTERM)
+        finally:
+            idleClient.Close()
+    
+    # A live server's socket is left alone, a stale one is replaced.
+    def testExistingSocket(self):
+        server = self.StartServer()
+        exitCode, output, errors = self.RunScript("--serve", self.socketPath)
+        self.assertNotEqual(exitCode, 0)
+        self.assertIn("already serving", errors)
+        self.StopServer(server)
+        
+        staleSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        staleSocket.bind(self.socketPath)
+        staleSocket.close()
+        self.StopServer(self.StartServer())
+        
+        # Anything else is never removed.
+        self.solution.WriteFile("../deps.sock", "")
+        exitCode, output, errors = self.RunScript("--serve", self.socketPath)
+        self.assertNotEqual(exitCode, 0)
+        self.assertTrue(os.path.isfile(self.socketPath))
+
+if __name__ == '__main__':
+    unittest.main()